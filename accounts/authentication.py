@@ -0,0 +1,122 @@
+"""
+JWT authentication without a user lookup per request.
+
+Tokens issued by tokens_for_user carry, besides the user id, the user's
+`user_type` and `business_id` (both fixed at registration).
+TokenUserAuthentication turns such a token into a User instance holding
+only those columns, every other column deferred: permission checks,
+ownership filters (`referrer=request.user`) and the claims cost no query,
+and the first other column a view reads loads the rest of the row in one
+query (see User.refresh_from_db). `request.auth` is the validated token,
+so request_business_id gives views the user's business without a query.
+Tokens issued before the claims existed fall back to the full lookup.
+
+Being stateless, a deactivated or deleted user keeps access until the
+access token expires (ACCESS_TOKEN_LIFETIME); refreshing checks the user.
+The claims are not columns a token user saves: `is_active` stays deferred
+and `user_type` is left out of user.save().
+
+Refresh tokens are rotated and blacklisted after use (token_blacklist app);
+CachedRefreshToken answers the blacklist check from the cache, written
+through when a token is blacklisted.
+"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from accounts.models import User
+
+logger = logging.getLogger(__name__)
+
+USER_TYPE_CLAIM = "user_type"
+BUSINESS_ID_CLAIM = "business_id"
+
+
+def _blacklist_key(jti):
+    return f"jwt:blacklisted:{jti}"
+
+
+class CachedRefreshToken(RefreshToken):
+    """RefreshToken with the user claims and a cached blacklist check"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        business = getattr(user, "business_profile", None)
+        token[USER_TYPE_CLAIM] = user.user_type
+        token[BUSINESS_ID_CLAIM] = business.id if business else None
+        return token
+
+    def _remaining_lifetime(self):
+        return max(1, int(self.payload["exp"] - self.current_time.timestamp()))
+
+    def check_blacklist(self):
+        key = _blacklist_key(self.payload[api_settings.JTI_CLAIM])
+        try:
+            blacklisted = cache.get(key)
+        except Exception as e:
+            logger.warning(f"Token blacklist cache unavailable: {str(e)}")
+            blacklisted = None
+        if blacklisted is None:
+            blacklisted = BlacklistedToken.objects.filter(token__jti=self.payload[api_settings.JTI_CLAIM]).exists()
+            # Blacklisting outside blacklist() (the admin) is picked up once this expires
+            timeout = self._remaining_lifetime() if blacklisted else settings.JWT_BLACKLIST_CACHE_TIMEOUT
+            try:
+                cache.set(key, blacklisted, timeout)
+            except Exception:
+                pass
+        if blacklisted:
+            raise TokenError("Token is blacklisted")
+
+    def blacklist(self):
+        result = super().blacklist()
+        try:
+            cache.set(_blacklist_key(self.payload[api_settings.JTI_CLAIM]), True, self._remaining_lifetime())
+        except Exception as e:
+            logger.warning(f"Could not cache blacklisted token: {str(e)}")
+        return result
+
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = CachedRefreshToken
+
+
+def tokens_for_user(user):
+    refresh = CachedRefreshToken.for_user(user)
+    return {"refresh": str(refresh), "access": str(refresh.access_token)}
+
+
+class TokenUserAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if USER_TYPE_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+
+        claims = {
+            "id": User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM]),
+            "user_type": validated_token[USER_TYPE_CLAIM],
+        }
+        field_names = [field.attname for field in User._meta.concrete_fields if field.attname in claims]
+        user = User.from_db(DEFAULT_DB_ALIAS, field_names, [claims[name] for name in field_names])
+        # Never written back by user.save(), the row is the source of truth
+        user._token_claims = {USER_TYPE_CLAIM}
+        return user
+
+
+def request_business_id(request):
+    """
+    Id of the authenticated user's business, None if they have none: from
+    the token claim when there is one, else from their business profile
+    """
+    payload = getattr(request.auth, "payload", None) or {}
+    if BUSINESS_ID_CLAIM in payload:
+        return payload[BUSINESS_ID_CLAIM]
+    business = getattr(request.user, "business_profile", None)
+    return business.id if business else None
@@ -0,0 +1,48 @@
+"""
+Password hashers with their cost parameters in settings.
+
+settings.PASSWORD_HASHERS lists the hasher picked by PASSWORD_HASHER first
+and every other one after it, so existing hashes keep verifying. A password
+hashed by another hasher, or with other parameters, is rehashed with the
+current ones on the user's next successful login (check_password's setter).
+
+Defaults: scrypt at N=2^14, r=8, p=1 (16 MiB per hash, about a quarter of
+the CPU time of Django's PBKDF2); Argon2id at OWASP's m=19 MiB, t=2, p=1.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+# Only a cap on what hashlib.scrypt may allocate, high enough for any hash we issue
+SCRYPT_MAXMEM = 256 * 1024 * 1024
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    maxmem = SCRYPT_MAXMEM
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
+    @property
+    def block_size(self):
+        return settings.PASSWORD_SCRYPT_BLOCK_SIZE
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_SCRYPT_PARALLELISM
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Argon2id, through argon2-cffi"""
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
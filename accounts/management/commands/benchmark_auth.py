@@ -0,0 +1,65 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.authentication import tokens_for_user
+from accounts.models import User
+
+ENDPOINTS = ("/referrals/my-subscriptions/", "/deals/all/", "/auth/profile/")
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare queries and latency per authenticated request with a plain JWT "
+        "(user loaded from the database) and a token carrying the user claims."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and token")
+        parser.add_argument("--email", help="User to authenticate as (default: any user with subscriptions)")
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(email=options["email"]) if options["email"] else \
+            User.objects.filter(subscriptions__isnull=False).distinct()
+        user = users.first() or User.objects.first()
+        if not user:
+            raise CommandError("No user to authenticate as, create one or pass --email.")
+
+        tokens = (
+            ("plain", str(RefreshToken.for_user(user).access_token)),
+            ("claims", tokens_for_user(user)["access"]),
+        )
+        self.stdout.write(f"Authenticated as {user.email}")
+        self.stdout.write(f"{'endpoint':<32}{'token':<8}{'queries':>9}{'p50 ms':>10}{'p95 ms':>10}")
+        for url in ENDPOINTS:
+            for name, access in tokens:
+                queries, timings = self.measure(url, access, options["requests"])
+                p50, p95 = self.percentiles(timings)
+                self.stdout.write(f"{url:<32}{name:<8}{queries:>9.1f}{p50:>10.2f}{p95:>10.2f}")
+
+    @staticmethod
+    def measure(url, access, count):
+        client = Client(HTTP_AUTHORIZATION=f"Bearer {access}")
+        response = client.get(url)  # warm up connection and caches
+        if response.status_code != 200:
+            raise CommandError(f"{url} returned {response.status_code}: {response.content[:200]}")
+
+        timings = []
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(count):
+                started = time.perf_counter()
+                client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+        return len(queries) / count, timings
+
+    @staticmethod
+    def percentiles(timings):
+        if len(timings) < 2:
+            return timings[0], timings[0]
+        cuts = statistics.quantiles(timings, n=100, method="inclusive")
+        return cuts[49], cuts[94]
@@ -0,0 +1,86 @@
+import asyncio
+import os
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, override_settings
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from accounts.models import User
+
+URL = "/auth/login/"
+BENCH_EMAIL = "login@bench.dealshark.invalid"
+BENCH_PASSWORD = "bench-Passw0rd!"
+
+# Label -> hasher made preferred for the run
+HASHERS = {
+    "pbkdf2": "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "scrypt": "accounts.hashers.ScryptPasswordHasher",
+    "argon2": "accounts.hashers.Argon2PasswordHasher",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure login throughput (requests per second, and per core) with each "
+        "password hasher, logins hashed concurrently in the hashing pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=100, help="Logins per hasher")
+        parser.add_argument("--concurrency", type=int, default=32, help="Logins in flight at once")
+        parser.add_argument("--hashers", default=",".join(HASHERS), help=f"Comma separated, of {', '.join(HASHERS)}")
+
+    def handle(self, *args, **options):
+        labels = [label.strip() for label in options["hashers"].split(",") if label.strip()]
+        unknown = set(labels) - set(HASHERS)
+        if unknown:
+            raise CommandError(f"Unknown hasher(s): {', '.join(sorted(unknown))}")
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+        user = self.bench_user()
+        self.stdout.write(f"{cores} core(s), {settings.PASSWORD_HASHING_MAX_WORKERS} hashing thread(s)")
+        self.stdout.write(f"{'hasher':<10}{'hash ms':>10}{'req/s':>10}{'req/s/core':>12}")
+        try:
+            for label in labels:
+                hashers = [HASHERS[label]] + [path for path in settings.PASSWORD_HASHERS if path != HASHERS[label]]
+                with override_settings(PASSWORD_HASHERS=hashers, RATE_LIMITS={}):
+                    try:
+                        started = time.perf_counter()
+                        user.password = make_password(BENCH_PASSWORD)
+                        hash_ms = (time.perf_counter() - started) * 1000
+                    except ValueError as e:  # hasher library not installed
+                        self.stdout.write(f"{label:<10}skipped: {str(e)}")
+                        continue
+                    user.save(update_fields=["password"])
+                    rate = asyncio.run(self.run(options["requests"], options["concurrency"]))
+                self.stdout.write(f"{label:<10}{hash_ms:>10.1f}{rate:>10.1f}{rate / cores:>12.1f}")
+        finally:
+            OutstandingToken.objects.filter(user=user).delete()
+            user.delete()
+
+    @staticmethod
+    def bench_user():
+        User.objects.filter(email=BENCH_EMAIL).delete()
+        return User.objects.create_user(
+            email=BENCH_EMAIL, username=BENCH_EMAIL, phone_number="+19990000000",
+            password=BENCH_PASSWORD, is_email_verified=True,
+        )
+
+    async def run(self, count, concurrency):
+        client = AsyncClient()
+        slots = asyncio.Semaphore(concurrency)
+        payload = {"email": BENCH_EMAIL, "password": BENCH_PASSWORD}
+
+        async def login():
+            async with slots:
+                response = await client.post(URL, payload, content_type="application/json")
+                if response.status_code != 200:
+                    raise CommandError(f"login returned {response.status_code}: {response.content[:200]}")
+
+        await login()  # warm up connection and caches
+        started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(count)))
+        return count / (time.perf_counter() - started)
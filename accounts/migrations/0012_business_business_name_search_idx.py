@@ -0,0 +1,24 @@
+# Generated by Django 4.2.24 on 2026-10-18 11:07
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0011_business_is_onboarding_completed_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="business",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.search.SearchVector(
+                    "business_name", config="simple"
+                ),
+                name="business_name_search_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.24 on 2026-10-18 11:07
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0012_business_business_name_search_idx"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="business",
+            name="business_name_search_idx",
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.24 on 2026-10-18 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0013_remove_business_business_name_search_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="business",
+            name="subscribers_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
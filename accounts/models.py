@@ -7,6 +7,8 @@ import random
 import string
 import secrets
 
+from dealshark.utils import fields_except
+
 
 class User(AbstractUser):
     USER_TYPES = (
@@ -29,10 +31,32 @@ class User(AbstractUser):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     profile_picture = models.URLField(blank=True, null=True)
+    # Resized copies, maintained by uploads.utils.generate_image_variants
+    profile_picture_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'phone_number']
 
+    def save(self, *args, **kwargs):
+        # Image variants are only written by the background job, never write back a stale copy;
+        # nor the claims a token user (accounts.authentication) was built from
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = fields_except(
+                self, "profile_picture_variants", *getattr(self, "_token_claims", ())
+            )
+        super().save(*args, **kwargs)
+
+    def refresh_from_db(self, using=None, fields=None):
+        # Token users (accounts.authentication) hold only their claims: the first other
+        # column read loads the whole rest of the row, not one query per column
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            row = User._base_manager.db_manager(using or self._state.db).filter(pk=self.pk).values(*deferred).get()
+            for attname, value in row.items():
+                setattr(self, attname, value)
+            return
+        super().refresh_from_db(using=using, fields=fields)
+
     def __str__(self):
         return self.email
 
@@ -121,7 +145,12 @@ class Business(models.Model):
     industry = models.CharField(max_length=255)
     business_logo_url = models.URLField(blank=True, null=True)
     business_cover_url = models.URLField(blank=True, null=True)
+    # Resized copies, maintained by uploads.utils.generate_image_variants
+    business_logo_variants = models.JSONField(default=dict, blank=True, editable=False)
+    business_cover_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_verified = models.BooleanField(default=False)
+    # Subscriptions across all deals, maintained by ReferralService
+    subscribers_count = models.PositiveIntegerField(default=0, editable=False)
 
     # New field for onboarding skip reason
     onboarding_no_deal_reason = models.CharField(
@@ -141,5 +170,14 @@ class Business(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def save(self, *args, **kwargs):
+        # subscribers_count only changes through F() updates and the image variants through
+        # the background job, never write back a stale copy
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = fields_except(
+                self, "subscribers_count", "business_logo_variants", "business_cover_variants"
+            )
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.business_name
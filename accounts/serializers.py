@@ -5,8 +5,10 @@ from django.core.exceptions import ValidationError
 
 from deals.models import Deal
 from deals.serializers import DealSerializer
-from referrals.models import ReferralSubscription
+from dealshark.serializers import SparseFieldsetMixin
+from uploads.serializers import SrcsetField
 from .models import User, Business, OTPVerification
+from .services import otp_service
 import re
 
 
@@ -37,7 +39,9 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 
         return User.objects.create_user(**validated_data)
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    profile_picture_srcset = SrcsetField("profile_picture", "profile_picture_variants")
+
     class Meta:
         model = User
         fields = [
@@ -47,6 +51,7 @@ class UserProfileSerializer(serializers.ModelSerializer):
             "email",
             "phone_number",
             "profile_picture",
+            "profile_picture_srcset",
             "user_type",
             "is_email_verified",
             "is_phone_verified",
@@ -84,7 +89,7 @@ class DealInlineSerializer(serializers.Serializer):
         allow_blank=True,
     )
 
-class DealResponseSerializer(serializers.ModelSerializer):
+class DealResponseSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Deal
         fields = [
@@ -143,7 +148,7 @@ class BusinessRegistrationSerializer(serializers.Serializer):
     deal = DealInlineSerializer(required=False)
 
 
-class UserProfileBasicSerializer(serializers.ModelSerializer):
+class UserProfileBasicSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Basic version to avoid recursion when embedding inside BusinessResponse."""
 
     class Meta:
@@ -157,10 +162,12 @@ class UserProfileBasicSerializer(serializers.ModelSerializer):
             "is_phone_verified",
         ]
 
-class BusinessResponseSerializer(serializers.ModelSerializer):
+class BusinessResponseSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user = UserProfileBasicSerializer(read_only=True)
     deals = DealResponseSerializer(many=True, read_only=True)
-    business_subscribers_count = serializers.SerializerMethodField()
+    business_subscribers_count = serializers.IntegerField(source="subscribers_count", read_only=True)
+    business_logo_srcset = SrcsetField("business_logo_url", "business_logo_variants")
+    business_cover_srcset = SrcsetField("business_cover_url", "business_cover_variants")
 
     class Meta:
         model = Business
@@ -182,22 +189,25 @@ class BusinessResponseSerializer(serializers.ModelSerializer):
             "business_country",
             "business_logo_url",
             "business_cover_url",
+            "business_logo_srcset",
+            "business_cover_srcset",
             "onboarding_no_deal_reason",
             "is_verified",
             "created_at",
             "updated_at",
             "deals",
         ]
-    def get_business_subscribers_count(self, obj):
-        return ReferralSubscription.objects.filter(deal__business=obj).count()
+        # Grows with the business, rendered only with ?expand=deals
+        expandable = ["deals"]
 
     def get_deals(self, obj):
         deals = obj.deals.all()
         return DealSerializer(deals, many=True).data
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     business_profile = BusinessResponseSerializer(read_only=True)
+    profile_picture_srcset = SrcsetField("profile_picture", "profile_picture_variants")
 
     class Meta:
         model = User
@@ -214,7 +224,8 @@ class UserProfileSerializer(serializers.ModelSerializer):
             "created_at",
             "updated_at",
             "business_profile",
-            "profile_picture"
+            "profile_picture",
+            "profile_picture_srcset",
         ]
 
 class OTPVerificationSerializer(serializers.Serializer):
@@ -228,20 +239,13 @@ class OTPVerificationSerializer(serializers.Serializer):
         except User.DoesNotExist:
             raise serializers.ValidationError("User with this email does not exist.")
 
-        try:
-            otp = OTPVerification.objects.get(
-                user=user,
-                otp_code=attrs['otp_code'],
-                otp_type=attrs['otp_type'],
-                is_used=False
-            )
-        except OTPVerification.DoesNotExist:
+        # Consumes the code when it matches
+        result = otp_service.get_otp_backend().verify(user, attrs['otp_type'], attrs['otp_code'])
+        if result == otp_service.LOCKED:
+            raise serializers.ValidationError("Too many incorrect attempts. Please request a new OTP.")
+        if result != otp_service.VERIFIED:
             raise serializers.ValidationError("Invalid or expired OTP.")
 
-        if otp.is_expired():
-            raise serializers.ValidationError("OTP has expired.")
-
-        attrs['otp_instance'] = otp
         attrs['user'] = user
         return attrs
 
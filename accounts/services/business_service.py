@@ -1,6 +1,7 @@
 from django.db import transaction
 
-from accounts.models import User, Business, OTPVerification
+from accounts.models import User, Business
+from accounts.services.otp_service import get_otp_backend
 from accounts.views import send_otp_email
 from deals.services.deal_service import DealService
 
@@ -54,7 +55,7 @@ class BusinessService:
             DealService.create_deal(business, deal_data)
 
         # Send OTP
-        otp = OTPVerification.objects.create(user=user, otp_type="email")
-        send_otp_email(user, otp.otp_code, "email")
+        otp_code = get_otp_backend().issue(user, "email")
+        send_otp_email(user, otp_code, "email")
 
         return business, user
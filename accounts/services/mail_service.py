@@ -0,0 +1,47 @@
+import logging
+
+from django.db import transaction
+
+from accounts.utils import send_otp_email_async
+from referrals.utils import send_referral_notifications
+
+logger = logging.getLogger(__name__)
+
+
+class MailService:
+    """
+    Queues outgoing emails for the Celery workers. Tasks are sent once the
+    surrounding transaction commits, so a request never holds a transaction
+    open across an SMTP round trip and a rolled back registration sends
+    nothing.
+    """
+
+    @staticmethod
+    def send_otp_email(user, otp_code, otp_type):
+        user_name = user.first_name or user.username
+        MailService._on_commit(send_otp_email_async, user.email, user_name, otp_code, otp_type)
+        return True
+
+    @staticmethod
+    def send_referral_notifications(referrals):
+        """Queue one batched task for all `referrals` (Referral instances)"""
+        notifications = [
+            {
+                "referrer_email": referral.referrer.email,
+                "referred_email": referral.referred_email,
+                "deal_title": referral.deal.deal_name,
+            }
+            for referral in referrals
+        ]
+        if notifications:
+            MailService._on_commit(send_referral_notifications, notifications)
+
+    @staticmethod
+    def _on_commit(task, *args):
+        def enqueue():
+            try:
+                task.delay(*args)
+            except Exception as e:
+                logger.error(f"Failed to queue {task.name}: {str(e)}")
+
+        transaction.on_commit(enqueue)
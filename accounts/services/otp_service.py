@@ -0,0 +1,163 @@
+"""
+One-time codes for email / phone verification and password resets, issued
+and checked through the backend in settings.OTP_BACKEND:
+
+  * RedisOTPBackend: each user and OTP type has one live code, stored as
+    an HMAC under a key with a native TTL. Verification is a single Lua
+    script that compares and deletes, so a code is consumed exactly once,
+    and counts wrong guesses: after OTP_MAX_ATTEMPTS the code is burnt.
+    Issues are rate limited by a counter in the same hash slot. With
+    OTP_AUDIT_LOG, issues and uses are also recorded in OTPVerification
+    (without the code).
+  * DatabaseOTPBackend: the OTPVerification table, for setups without
+    Redis (no attempt counting).
+
+issue() raises OTPRateLimited past OTP_RATE_LIMIT codes per OTP_RATE_WINDOW;
+verify() returns one of VERIFIED, INVALID or LOCKED.
+"""
+import hashlib
+import hmac
+import logging
+import secrets
+import string
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from accounts.models import OTPVerification
+
+logger = logging.getLogger(__name__)
+
+VERIFIED = "verified"
+INVALID = "invalid"  # wrong, expired, used or never issued
+LOCKED = "locked"  # too many wrong guesses, a new code is needed
+
+# Stands in for the code in audit rows, the code itself only lives in Redis
+REDACTED_CODE = "******"
+
+# KEYS: code hash, issue counter; ARGV: code HMAC, ttl, max issues, window
+ISSUE_SCRIPT = """
+local issued = redis.call('INCR', KEYS[2])
+if issued == 1 then
+    redis.call('EXPIRE', KEYS[2], ARGV[4])
+end
+if issued > tonumber(ARGV[3]) then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'code', ARGV[1], 'attempts', 0)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return issued
+"""
+
+# KEYS: code hash; ARGV: candidate HMAC, max attempts.
+# 1 verified (code deleted), 0 wrong, -1 no live code, -2 wrong and now burnt
+VERIFY_SCRIPT = """
+local code = redis.call('HGET', KEYS[1], 'code')
+if not code then
+    return -1
+end
+if code == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+if redis.call('HINCRBY', KEYS[1], 'attempts', 1) >= tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[1])
+    return -2
+end
+return 0
+"""
+
+VERIFY_RESULTS = {1: VERIFIED, 0: INVALID, -1: INVALID, -2: LOCKED}
+
+
+class OTPRateLimited(Exception):
+    """Too many codes requested for this user and OTP type"""
+
+
+def generate_code():
+    return "".join(secrets.choice(string.digits) for _ in range(OTPVerification.OTP_LENGTH))
+
+
+def get_otp_backend():
+    return import_string(settings.OTP_BACKEND)()
+
+
+class RedisOTPBackend:
+    _scripts = {}
+
+    def _redis(self):
+        from django_redis import get_redis_connection
+
+        return get_redis_connection("default")
+
+    def _run_script(self, script, keys, args):
+        client = self._redis()
+        if script not in RedisOTPBackend._scripts:
+            # Once per process: the Script only holds the SHA, and loads itself on a server missing it
+            RedisOTPBackend._scripts[script] = client.register_script(script)
+        return RedisOTPBackend._scripts[script](keys=keys, args=args, client=client)
+
+    @staticmethod
+    def _keys(user, otp_type):
+        # Braces keep both keys of a user in one Redis Cluster slot
+        slot = f"otp:{{{otp_type}:{user.pk}}}"
+        return f"{slot}:code", f"{slot}:issued"
+
+    @staticmethod
+    def _digest(user, otp_type, code):
+        message = f"{user.pk}:{otp_type}:{code}".encode()
+        return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+    def issue(self, user, otp_type):
+        """New code for `user`, replacing any live one"""
+        code = generate_code()
+        issued = self._run_script(
+            ISSUE_SCRIPT,
+            keys=self._keys(user, otp_type),
+            args=[self._digest(user, otp_type, code), settings.OTP_TTL,
+                  settings.OTP_RATE_LIMIT, settings.OTP_RATE_WINDOW],
+        )
+        if not issued:
+            raise OTPRateLimited()
+        if settings.OTP_AUDIT_LOG:
+            OTPVerification.objects.filter(user=user, otp_type=otp_type, is_used=False).update(is_used=True)
+            OTPVerification.objects.create(
+                user=user, otp_type=otp_type, otp_code=REDACTED_CODE,
+                expires_at=timezone.now() + timezone.timedelta(seconds=settings.OTP_TTL),
+            )
+        return code
+
+    def verify(self, user, otp_type, code):
+        """Check `code` and consume it if it matches"""
+        code_key, _ = self._keys(user, otp_type)
+        result = VERIFY_RESULTS[self._run_script(
+            VERIFY_SCRIPT, keys=[code_key], args=[self._digest(user, otp_type, code), settings.OTP_MAX_ATTEMPTS],
+        )]
+        if result == LOCKED:
+            logger.warning(f"OTP for user {user.pk} ({otp_type}) burnt after {settings.OTP_MAX_ATTEMPTS} wrong attempts")
+        if result == VERIFIED and settings.OTP_AUDIT_LOG:
+            OTPVerification.objects.filter(user=user, otp_type=otp_type, is_used=False).update(is_used=True)
+        return result
+
+
+class DatabaseOTPBackend:
+    def issue(self, user, otp_type):
+        window_start = timezone.now() - timezone.timedelta(seconds=settings.OTP_RATE_WINDOW)
+        recent = OTPVerification.objects.filter(user=user, otp_type=otp_type, created_at__gte=window_start)
+        if recent.count() >= settings.OTP_RATE_LIMIT:
+            raise OTPRateLimited()
+
+        OTPVerification.objects.filter(user=user, otp_type=otp_type, is_used=False).update(is_used=True)
+        otp = OTPVerification.objects.create(
+            user=user, otp_type=otp_type, otp_code=generate_code(),
+            expires_at=timezone.now() + timezone.timedelta(seconds=settings.OTP_TTL),
+        )
+        return otp.otp_code
+
+    def verify(self, user, otp_type, code):
+        used = OTPVerification.objects.filter(
+            user=user, otp_type=otp_type, otp_code=code, is_used=False, expires_at__gt=timezone.now()
+        ).update(is_used=True)
+        return VERIFIED if used else INVALID
@@ -1,10 +1,43 @@
 import re
 
-from accounts.models import User, OTPVerification
+from django.contrib.auth.hashers import check_password, make_password
+
+from accounts.models import User
 from accounts.serializers import UserRegistrationSerializer
+from accounts.services.otp_service import OTPRateLimited, get_otp_backend
+from dealshark.aio import run_hashing
+
+
+def _check_password(password, encoded):
+    """(is_correct, new hash if it must be rehashed with the current hasher, else None)"""
+    rehashed = []
+    is_correct = check_password(password, encoded, setter=lambda raw: rehashed.append(make_password(raw)))
+    return is_correct, rehashed[0] if rehashed else None
 
 
 class UserService:
+    @staticmethod
+    async def authenticate(email, password):
+        """
+        authenticate() with ModelBackend's rules, for the async login views:
+        the active user or None. The lookup and a rehash with the current
+        hasher use the async ORM, the hashing runs in the hashing pool.
+        """
+        try:
+            user = await User._default_manager.aget(**{User.USERNAME_FIELD: email})
+        except User.DoesNotExist:
+            # Hash anyway, so unknown emails take as long as wrong passwords
+            await run_hashing(make_password, password)
+            return None
+
+        is_correct, rehashed = await run_hashing(_check_password, password, user.password)
+        if not is_correct or not user.is_active:
+            return None
+        if rehashed:
+            user.password = rehashed
+            await user.asave(update_fields=["password"])
+        return user
+
     @staticmethod
     def register_user(data):
         from accounts.views import send_otp_email
@@ -29,11 +62,11 @@ class UserService:
 
         # Unverified user flow
         if existing and not existing.is_email_verified:
-            otp, created = OTPVerification.objects.get_or_create(user=existing, otp_type="email")
-            if not created:
-                otp.regenerate()
-                otp.save()
-            if send_otp_email(existing, otp.otp_code, "email"):
+            try:
+                otp_code = get_otp_backend().issue(existing, "email")
+            except OTPRateLimited:
+                return {"error": "Too many OTP requests. Please try again later."}, 429
+            if send_otp_email(existing, otp_code, "email"):
                 return {
                     "message": "User already exists but not verified. OTP resent to email.",
                     "user_id": str(existing.id),
@@ -47,8 +80,8 @@ class UserService:
             return {"error": "Invalid data provided.", "details": serializer.errors}, 400
 
         user = serializer.save()
-        otp = OTPVerification.objects.create(user=user, otp_type="email")
-        if send_otp_email(user, otp.otp_code, "email"):
+        otp_code = get_otp_backend().issue(user, "email")
+        if send_otp_email(user, otp_code, "email"):
             return {
                 "message": "User registered successfully. Please check your email for OTP.",
                 "user_id": str(user.id),
@@ -4,7 +4,7 @@ from django.dispatch import receiver
 from django.contrib.auth.signals import user_logged_in
 from .models import User, Business
 from referrals.models import Referral
-from referrals.utils import send_referral_notification
+from accounts.services.mail_service import MailService
 
 logger = logging.getLogger(__name__)
 
@@ -21,11 +21,7 @@ def business_created_handler(sender, instance, created, **kwargs):
 @receiver(post_save, sender=Referral)
 def referral_created_handler(sender, instance, created, **kwargs):
     if created:
-        send_referral_notification.delay(
-            instance.referrer.email,
-            instance.referred_email,
-            instance.deal.title
-        )
+        MailService.send_referral_notifications([instance])
         logger.info(f"New referral created by {instance.referrer.email}")
 
 @receiver(user_logged_in)
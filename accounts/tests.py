@@ -0,0 +1,456 @@
+import io
+import json
+import logging
+from unittest import mock
+
+import fakeredis
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core import mail
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.authentication import CachedRefreshToken, TokenUserAuthentication, tokens_for_user
+from accounts.models import Business, OTPVerification, User
+from accounts.services import otp_service
+from accounts.services.otp_service import DatabaseOTPBackend, OTPRateLimited, RedisOTPBackend
+from accounts.utils import send_otp_email_async
+from dealshark.logs import JSONFormatter, QueueLogHandler, RequestLog
+from dealshark.middleware import RequestLogMiddleware
+from dealshark.ratelimit import RateLimiter, RateLimitThrottle, parse_rate
+
+
+TEST_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+def run_eagerly(task):
+    return mock.patch.object(task, "delay", side_effect=lambda *args: task.apply(args=args, throw=True))
+
+
+def fake_redis(test_case, backend=RedisOTPBackend):
+    """Point `backend` at an in-memory Redis (with Lua) for the test"""
+    redis = fakeredis.FakeRedis()
+    patcher = mock.patch.object(backend, "_redis", return_value=redis)
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+    return redis
+
+
+class OTPEmailTests(TestCase):
+    url = "/auth/register/user/"
+    payload = {
+        "email": "new@example.com",
+        "phone_number": "+15552000001",
+        "password": "Str0ng-pass!",
+        "confirm_password": "Str0ng-pass!",
+    }
+
+    def setUp(self):
+        fake_redis(self)
+
+    def test_otp_email_is_sent_by_the_worker_after_commit(self):
+        with run_eagerly(send_otp_email_async) as delay:
+            with self.captureOnCommitCallbacks() as callbacks:
+                response = self.client.post(self.url, self.payload)
+            self.assertEqual(response.status_code, 201)
+            # Nothing is sent while the registration transaction is open
+            self.assertEqual(len(mail.outbox), 0)
+
+            for callback in callbacks:
+                callback()
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["new@example.com"])
+        otp_code = delay.call_args.args[2]
+        self.assertIn(otp_code, mail.outbox[0].body)
+        user = User.objects.get(email="new@example.com")
+        self.assertEqual(RedisOTPBackend().verify(user, "email", otp_code), otp_service.VERIFIED)
+
+
+@override_settings(OTP_TTL=600, OTP_MAX_ATTEMPTS=3, OTP_RATE_LIMIT=4, OTP_RATE_WINDOW=3600, OTP_AUDIT_LOG=False)
+class RedisOTPBackendTests(TestCase):
+    def setUp(self):
+        self.redis = fake_redis(self)
+        self.backend = RedisOTPBackend()
+        self.user = User.objects.create_user(
+            email="otp@example.com", username="otp", phone_number="+15552000002", password="Str0ng-pass!",
+        )
+
+    def test_code_is_stored_hashed_with_a_ttl_and_consumed_once(self):
+        code = self.backend.issue(self.user, "email")
+        code_key, _ = self.backend._keys(self.user, "email")
+        self.assertNotIn(code.encode(), b"".join(self.redis.hgetall(code_key).values()))
+        self.assertTrue(0 < self.redis.ttl(code_key) <= 600)
+
+        self.assertEqual(self.backend.verify(self.user, "email", code), otp_service.VERIFIED)
+        self.assertEqual(self.backend.verify(self.user, "email", code), otp_service.INVALID)
+        self.assertFalse(OTPVerification.objects.exists())
+
+    def test_codes_are_per_type_and_replaced_on_reissue(self):
+        first = self.backend.issue(self.user, "email")
+        phone = self.backend.issue(self.user, "phone")
+        second = self.backend.issue(self.user, "email")
+
+        if first != second:
+            self.assertEqual(self.backend.verify(self.user, "email", first), otp_service.INVALID)
+        self.assertEqual(self.backend.verify(self.user, "email", second), otp_service.VERIFIED)
+        self.assertEqual(self.backend.verify(self.user, "phone", phone), otp_service.VERIFIED)
+
+    def test_wrong_guesses_burn_the_code(self):
+        code = self.backend.issue(self.user, "email")
+        wrong = "000000" if code != "000000" else "111111"
+
+        self.assertEqual(self.backend.verify(self.user, "email", wrong), otp_service.INVALID)
+        self.assertEqual(self.backend.verify(self.user, "email", wrong), otp_service.INVALID)
+        self.assertEqual(self.backend.verify(self.user, "email", wrong), otp_service.LOCKED)
+        self.assertEqual(self.backend.verify(self.user, "email", code), otp_service.INVALID)
+
+    def test_expired_code_is_rejected(self):
+        code = self.backend.issue(self.user, "email")
+        self.redis.delete(self.backend._keys(self.user, "email")[0])  # what the TTL does
+        self.assertEqual(self.backend.verify(self.user, "email", code), otp_service.INVALID)
+
+    def test_issuing_is_rate_limited(self):
+        for _ in range(4):
+            self.backend.issue(self.user, "email")
+        with self.assertRaises(OTPRateLimited):
+            self.backend.issue(self.user, "email")
+        # Other OTP types have their own budget
+        self.backend.issue(self.user, "phone")
+
+        response = self.client.post("/auth/resend-otp/", {"email": self.user.email})
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(OTP_AUDIT_LOG=True)
+    def test_audit_log_records_issue_and_use_without_the_code(self):
+        code = self.backend.issue(self.user, "email")
+        audit = OTPVerification.objects.get(user=self.user)
+        self.assertEqual(audit.otp_code, otp_service.REDACTED_CODE)
+        self.assertFalse(audit.is_used)
+
+        self.backend.verify(self.user, "email", code)
+        audit.refresh_from_db()
+        self.assertTrue(audit.is_used)
+
+    def test_verify_endpoint_consumes_the_code_and_verifies_the_user(self):
+        code = self.backend.issue(self.user, "email")
+        payload = {"email": self.user.email, "otp_code": code, "otp_type": "email"}
+
+        response = self.client.post("/auth/verify-otp/", payload)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access", response.data["tokens"])
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_email_verified)
+
+        self.assertEqual(self.client.post("/auth/verify-otp/", payload).status_code, 400)
+
+
+@override_settings(OTP_TTL=600, OTP_RATE_LIMIT=2, OTP_RATE_WINDOW=3600)
+class DatabaseOTPBackendTests(TestCase):
+    def test_issue_verify_and_rate_limit(self):
+        backend = DatabaseOTPBackend()
+        user = User.objects.create_user(
+            email="db@example.com", username="db", phone_number="+15552000003", password="Str0ng-pass!",
+        )
+        first = backend.issue(user, "email")
+        second = backend.issue(user, "email")
+        with self.assertRaises(OTPRateLimited):
+            backend.issue(user, "email")
+
+        if first != second:
+            self.assertEqual(backend.verify(user, "email", first), otp_service.INVALID)
+        self.assertEqual(backend.verify(user, "email", second), otp_service.VERIFIED)
+        self.assertEqual(backend.verify(user, "email", second), otp_service.INVALID)
+
+
+@override_settings(RATE_LIMITS={
+    "login": [("ip", "5/m"), ("email", "2/m")],
+    "onboarding": [("user", "1/h")],
+})
+class RateLimitTests(TestCase):
+    def setUp(self):
+        RateLimiter._unavailable_until = 0.0
+        self.redis = fake_redis(self, RateLimiter)
+
+    def login(self, email, ip="203.0.113.7", **headers):
+        return self.client.post(
+            "/auth/login/", {"email": email, "password": "wrong"},
+            content_type="application/json", REMOTE_ADDR=ip, **headers,
+        )
+
+    def test_rates_parse(self):
+        self.assertEqual(parse_rate("10/m"), (10, 60))
+        self.assertEqual(parse_rate("5/15m"), (5, 900))
+        with self.assertRaises(ValueError):
+            parse_rate("5 per minute")
+
+    def test_over_limit_logins_are_rejected_before_any_query(self):
+        self.assertEqual(self.login("a@example.com").status_code, 400)
+        self.assertEqual(self.login("a@example.com").status_code, 400)
+        with self.assertNumQueries(0):
+            response = self.login("a@example.com")
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response["Retry-After"]) <= 30)
+
+        # Other emails still have budget on this IP, until the IP limit is reached
+        self.assertEqual(self.login("b@example.com").status_code, 400)
+        self.assertEqual(self.login("c@example.com").status_code, 400)
+        self.assertEqual(self.login("d@example.com").status_code, 400)
+        self.assertEqual(self.login("e@example.com").status_code, 429)
+        self.assertEqual(self.login("e@example.com", ip="198.51.100.1").status_code, 400)
+
+    def test_rejected_requests_do_not_use_up_other_rules(self):
+        for _ in range(3):
+            self.login("a@example.com")
+        # 2 allowed + 1 rejected by the email rule: the IP rule counted 2 of its 5
+        for email in ("b@example.com", "c@example.com", "d@example.com"):
+            self.assertEqual(self.login(email).status_code, 400)
+
+    def test_forwarded_for_is_only_trusted_behind_proxies(self):
+        for i in range(5):
+            self.login(f"{i}@example.com", HTTP_X_FORWARDED_FOR=f"198.51.100.{i}")
+        self.assertEqual(self.login("f@example.com", HTTP_X_FORWARDED_FOR="198.51.100.9").status_code, 429)
+
+        rest_framework = {**settings.REST_FRAMEWORK, "NUM_PROXIES": 1}
+        with self.settings(REST_FRAMEWORK=rest_framework):
+            self.assertEqual(self.login("f@example.com", HTTP_X_FORWARDED_FOR="198.51.100.9").status_code, 400)
+
+    def test_script_is_registered_once(self):
+        RateLimiter._script = None
+        with mock.patch.object(self.redis, "register_script", wraps=self.redis.register_script) as register:
+            self.login("a@example.com")
+            self.login("b@example.com")
+        register.assert_called_once()
+
+    def test_requests_go_through_when_redis_is_down(self):
+        with mock.patch.object(RateLimiter, "_redis", side_effect=ConnectionError("down")):
+            for _ in range(4):
+                self.assertEqual(self.login("a@example.com").status_code, 400)
+
+    def test_throttle_counts_the_authenticated_user(self):
+        user = User.objects.create_user(
+            email="rl@example.com", username="rl", phone_number="+15552000004", password="Str0ng-pass!",
+        )
+        request = Request(RequestFactory().get("/"))
+        request.user = user
+        view = mock.Mock(throttle_scope="onboarding")
+
+        throttle = RateLimitThrottle()
+        self.assertTrue(throttle.allow_request(request, view))
+        self.assertFalse(throttle.allow_request(request, view))
+        self.assertGreater(throttle.wait(), 3000)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TokenUserAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="biz@example.com", username="biz", phone_number="+15552000010",
+            password="Str0ng-pass!", user_type="business",
+        )
+        self.business = Business.objects.create(
+            user=self.user, business_name="Biz", business_email="biz@example.com",
+            business_phone="+15552000010", website="https://example.com", designation="Owner",
+            registration_no="REG-1", business_address="1 Main St", business_city="Austin",
+            business_state="TX", business_country="US", industry="Retail",
+        )
+
+    def get(self, url, access):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_AUTHORIZATION=f"Bearer {access}")
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_tokens_carry_the_user_claims(self):
+        access = CachedRefreshToken(tokens_for_user(self.user)["refresh"]).access_token
+        self.assertEqual(access["user_type"], "business")
+        self.assertEqual(access["business_id"], self.business.id)
+
+    def test_token_user_loads_the_row_once_when_touched(self):
+        authentication = TokenUserAuthentication()
+        token = authentication.get_validated_token(tokens_for_user(self.user)["access"])
+
+        with self.assertNumQueries(0):
+            user = authentication.get_user(token)
+            self.assertEqual(user.pk, self.user.pk)
+            self.assertTrue(user.is_business)
+            self.assertTrue(user.is_authenticated)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, "biz@example.com")
+            self.assertEqual(user.phone_number, "+15552000010")
+
+    def test_claims_save_the_user_query(self):
+        legacy = str(RefreshToken.for_user(self.user).access_token)
+        legacy_response, legacy_queries = self.get("/referrals/my-subscriptions/", legacy)
+        response, queries = self.get("/referrals/my-subscriptions/", tokens_for_user(self.user)["access"])
+
+        self.assertEqual(queries, legacy_queries - 1)
+        self.assertEqual(response.json()["referrer"], legacy_response.json()["referrer"])
+        self.assertEqual(response.json()["referrer"]["email"], "biz@example.com")
+
+    def test_token_user_saves_do_not_write_back_the_claims(self):
+        access = tokens_for_user(self.user)["access"]
+        User.objects.filter(pk=self.user.pk).update(is_active=False, user_type="customer")
+
+        authentication = TokenUserAuthentication()
+        user = authentication.get_user(authentication.get_validated_token(access))
+        user.first_name = "Renamed"
+        user.save()
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.first_name, "Renamed")
+        self.assertFalse(self.user.is_active)
+        self.assertEqual(self.user.user_type, "customer")
+
+    def test_business_views_take_the_business_from_the_claim(self):
+        access = tokens_for_user(self.user)["access"]
+        legacy = str(RefreshToken.for_user(self.user).access_token)
+        legacy_response, legacy_queries = self.get("/deals/my/", legacy)
+        response, queries = self.get("/deals/my/", access)
+
+        self.assertEqual(queries, legacy_queries - 2)
+        self.assertEqual(response.json(), legacy_response.json())
+
+    def test_rotated_refresh_token_is_blacklisted_and_cached(self):
+        refresh = tokens_for_user(self.user)["refresh"]
+        response = self.client.post("/auth/token/refresh/", {"refresh": refresh}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.json()["refresh"], refresh)
+
+        response = self.client.post("/auth/token/refresh/", {"refresh": refresh}, content_type="application/json")
+        self.assertEqual(response.status_code, 401)
+        with self.assertNumQueries(0), self.assertRaises(TokenError):
+            CachedRefreshToken(refresh)
+
+
+@override_settings(CACHES=TEST_CACHES, RATE_LIMITS={})
+class LoginTests(TestCase):
+    password = "Str0ng-pass!"
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="login@example.com", username="login", phone_number="+15552000020",
+            password=self.password, is_email_verified=True,
+        )
+
+    def login(self, password=None, url="/auth/login/"):
+        return self.client.post(
+            url, {"email": "login@example.com", "password": password or self.password},
+            content_type="application/json",
+        )
+
+    def test_new_passwords_use_the_preferred_hasher(self):
+        self.assertTrue(self.user.password.startswith("scrypt$16384$"))
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("access", response.json()["tokens"])
+
+    def test_legacy_hash_is_upgraded_on_login(self):
+        User.objects.filter(pk=self.user.pk).update(password=make_password(self.password, hasher="pbkdf2_sha256"))
+
+        self.assertEqual(self.login("wrong-password").status_code, 400)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$"))
+
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("scrypt$"))
+        self.assertTrue(self.user.check_password(self.password))
+
+    @override_settings(PASSWORD_SCRYPT_WORK_FACTOR=2 ** 12)
+    def test_hash_is_upgraded_when_the_parameters_change(self):
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("scrypt$4096$"))
+
+    def test_switching_to_argon2_rehashes_on_login(self):
+        with self.settings(PASSWORD_HASHERS=["accounts.hashers.Argon2PasswordHasher",
+                                             "accounts.hashers.ScryptPasswordHasher"]):
+            self.assertEqual(self.login().status_code, 200)
+            self.user.refresh_from_db()
+            self.assertTrue(self.user.password.startswith("argon2$argon2id$"))
+            self.assertTrue(self.user.check_password(self.password))
+
+    def test_business_login_is_only_for_businesses(self):
+        self.assertEqual(self.login(url="/auth/business/login/").status_code, 403)
+        User.objects.filter(pk=self.user.pk).update(user_type="business")
+        self.assertEqual(self.login(url="/auth/business/login/").status_code, 200)
+
+
+@override_settings(CACHES=TEST_CACHES, REQUEST_LOG_SAMPLE_RATE=1.0, REQUEST_LOG_SLOW_MS=60000)
+class RequestLogTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="log@example.com", username="log", phone_number="+15552000030", password="Str0ng-pass!",
+        )
+        self.access = tokens_for_user(self.user)["access"]
+
+    def test_one_structured_line_per_request(self):
+        with self.assertLogs("dealshark.requests", "INFO") as logs:
+            response = self.client.get(
+                "/referrals/my-subscriptions/", HTTP_AUTHORIZATION=f"Bearer {self.access}", HTTP_X_REQUEST_ID="req-1",
+            )
+        self.assertEqual(response["X-Request-ID"], "req-1")
+        [record] = logs.records
+        self.assertEqual(record.request_id, "req-1")
+        self.assertEqual(record.method, "GET")
+        self.assertEqual(record.route, "/referrals/my-subscriptions/")
+        self.assertEqual(record.status, 200)
+        self.assertEqual(record.user_id, str(self.user.pk))
+        self.assertEqual(record.db_queries, 2)
+        self.assertGreaterEqual(record.duration_ms, record.db_ms)
+
+    @override_settings(REQUEST_LOG_SAMPLE_RATE=0.0)
+    def test_errors_are_logged_with_their_traceback_whatever_the_sampling(self):
+        with self.assertNoLogs("dealshark.requests"):
+            self.client.get("/referrals/my-subscriptions/", HTTP_AUTHORIZATION=f"Bearer {self.access}")
+
+        client = Client(raise_request_exception=False)
+        with mock.patch("referrals.views.ReferralService.referrer_subscriptions", side_effect=RuntimeError("boom")), \
+                self.assertLogs("dealshark.requests", "ERROR") as logs:
+            response = client.get("/referrals/my-subscriptions/", HTTP_AUTHORIZATION=f"Bearer {self.access}")
+        self.assertEqual(response.status_code, 500)
+        line = json.loads(JSONFormatter().format(logs.records[0]))
+        self.assertEqual(line["status"], 500)
+        self.assertEqual(line["sample_rate"], 1.0)
+        self.assertEqual(line["exception"]["type"], "builtins.RuntimeError")
+        self.assertIn("referrer_subscriptions", line["exception"]["traceback"])
+
+    def test_streamed_response_is_logged_once_sent(self):
+        def body():
+            yield b"a"
+            User.objects.count()
+            yield b"b"
+
+        middleware = RequestLogMiddleware(lambda request: StreamingHttpResponse(body()))
+        response = middleware(RequestFactory().get("/export/"))
+        with self.assertLogs("dealshark.requests", "INFO") as logs:
+            self.assertEqual(b"".join(response.streaming_content), b"ab")
+        self.assertEqual(logs.records[0].db_queries, 1)
+
+    def test_queue_handler_writes_json_lines_off_thread(self):
+        stream = io.StringIO()
+        handler = QueueLogHandler(stream, maxsize=10)
+        handler.setFormatter(JSONFormatter())
+        logger = logging.getLogger("dealshark.tests.queue")
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        self.addCleanup(logger.removeHandler, handler)
+
+        token = RequestLog("req-2").activate()
+        try:
+            logger.warning("payout failed", extra={"batch": 7})
+        finally:
+            RequestLog.deactivate(token)
+        handler.close()
+
+        line = json.loads(stream.getvalue())
+        self.assertEqual(line["message"], "payout failed")
+        self.assertEqual(line["batch"], 7)
+        self.assertEqual(line["request_id"], "req-2")
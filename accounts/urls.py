@@ -1,9 +1,10 @@
 from django.db import router
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from rest_framework_simplejwt.views import TokenRefreshView
 
 from . import views
-from . views_business import BusinessAuthViewSet
+from . views_business import BusinessAuthViewSet, BusinessLoginView
 
 router = DefaultRouter()
 router.register(r'business', BusinessAuthViewSet, basename='business-auth')
@@ -15,9 +16,11 @@ urlpatterns = [
     path('verify-otp/', views.verify_otp, name='verify_otp'),
     path('resend-otp/', views.resend_otp, name='resend_otp'),
     path('login/', views.login_view, name='login'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('profile/', views.profile_view, name='profile'),
     path("profile/update/", views.update_profile, name="profile-update"),
 
+    path('business/login/', BusinessLoginView.as_view(), name='business-auth-login'),
     path('', include(router.urls)),
 ]
 
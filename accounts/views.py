@@ -1,54 +1,40 @@
-from django.contrib.auth import authenticate
+from asgiref.sync import sync_to_async
 from rest_framework import status, viewsets
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
-from django.core.mail import send_mail
-from django.conf import settings
 from django.db import transaction
 import logging
 
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 
+from dealshark.aio import AsyncAPIView
+from dealshark.serializers import prefetch_instances, sparse_fieldset
+from .authentication import tokens_for_user
 from .models import User, OTPVerification
 from .serializers import (
     UserRegistrationSerializer, BusinessRegistrationSerializer,
     OTPVerificationSerializer, LoginSerializer, UserProfileSerializer
 )
+from .services.mail_service import MailService
+from .services.otp_service import OTPRateLimited, get_otp_backend
 from .services.user_service import UserService
 
 logger = logging.getLogger(__name__)
 
 
 def get_tokens_for_user(user):
-    refresh = RefreshToken.for_user(user)
-    return {"refresh": str(refresh), "access": str(refresh.access_token)}
+    return tokens_for_user(user)
 
 
-def send_otp_email(user, otp_code, otp_type):
-    """Send OTP via email"""
-    subject_map = {
-        "email": "Verify your email - Deal Shark",
-        "password_reset": "Password Reset - Deal Shark",
-    }
-    subject = subject_map.get(otp_type, "OTP Verification - Deal Shark")
-    message = f"Your OTP code is: {otp_code}. It will expire in 10 minutes."
+def user_payload(user, request):
+    """UserProfileSerializer data shaped by ?fields= / ?expand=, with just those relations loaded"""
+    return prefetch_instances(UserProfileSerializer(user, **sparse_fieldset(request))).data
 
-    try:
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [user.email],
-            auth_user=settings.EMAIL_HOST_USER,
-            auth_password=settings.EMAIL_HOST_PASSWORD,
-            fail_silently=False,
-        )
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send OTP email: {str(e)}")
-        return False
+
+def send_otp_email(user, otp_code, otp_type):
+    """Queue the OTP email; a Celery worker sends it after the transaction commits"""
+    return MailService.send_otp_email(user, otp_code, otp_type)
 
 
 # ---------------------------
@@ -61,6 +47,7 @@ def send_otp_email(user, otp_code, otp_type):
         200: OpenApiResponse(description="Existing user, OTP resent."),
         400: OpenApiResponse(description="Validation error."),
         409: OpenApiResponse(description="User already registered but OTP sending failed."),
+        429: OpenApiResponse(description="Too many OTPs requested."),
         500: OpenApiResponse(description="Internal server error."),
     },
     tags=["Authentication"],
@@ -101,9 +88,9 @@ def register_business(request):
             if serializer.is_valid():
                 business = serializer.save()
                 user = business.user
-                otp = OTPVerification.objects.create(user=user, otp_type="email")
+                otp_code = get_otp_backend().issue(user, "email")
 
-                if send_otp_email(user, otp.otp_code, "email"):
+                if send_otp_email(user, otp_code, "email"):
                     return Response(
                         {
                             "message": "Business registered successfully. Please check your email for OTP.",
@@ -146,28 +133,24 @@ def verify_otp(request):
     serializer = OTPVerificationSerializer(data=request.data)
 
     if serializer.is_valid():
-        otp_instance = serializer.validated_data["otp_instance"]
         user = serializer.validated_data["user"]
         otp_type = serializer.validated_data["otp_type"]
 
-        otp_instance.is_used = True
-        otp_instance.save()
-
         if otp_type == "email":
             user.is_email_verified = True
-            user.save()
+            user.save(update_fields=["is_email_verified", "updated_at"])
             return Response(
                 {
                     "message": "Email verified successfully.",
                     "tokens": get_tokens_for_user(user),
-                    "user": UserProfileSerializer(user).data,
+                    "user": user_payload(user, request),
                 },
                 status=status.HTTP_200_OK,
             )
 
         elif otp_type == "phone":
             user.is_phone_verified = True
-            user.save()
+            user.save(update_fields=["is_phone_verified", "updated_at"])
             return Response({"message": "Phone verified successfully."}, status=200)
 
         return Response({"message": "OTP verified successfully."}, status=200)
@@ -184,6 +167,7 @@ def verify_otp(request):
         200: OpenApiResponse(description="OTP resent successfully."),
         400: OpenApiResponse(description="Email missing."),
         404: OpenApiResponse(description="User not found."),
+        429: OpenApiResponse(description="Too many OTPs requested."),
         500: OpenApiResponse(description="Failed to send OTP."),
     },
     tags=["Authentication"],
@@ -198,16 +182,20 @@ def resend_otp(request):
 
     if not email:
         return Response({"error": "Email is required."}, status=400)
+    if otp_type not in dict(OTPVerification.OTP_TYPES):
+        return Response({"error": "Invalid OTP type."}, status=400)
 
     try:
         user = User.objects.get(email=email)
     except User.DoesNotExist:
         return Response({"error": "User not found."}, status=404)
 
-    OTPVerification.objects.filter(user=user, otp_type=otp_type, is_used=False).update(is_used=True)
-    otp = OTPVerification.objects.create(user=user, otp_type=otp_type)
+    try:
+        otp_code = get_otp_backend().issue(user, otp_type)
+    except OTPRateLimited:
+        return Response({"error": "Too many OTP requests. Please try again later."}, status=429)
 
-    if send_otp_email(user, otp.otp_code, otp_type):
+    if send_otp_email(user, otp_code, otp_type):
         return Response({"message": "OTP sent successfully."}, status=200)
     return Response({"error": "Failed to send OTP."}, status=500)
 
@@ -215,40 +203,42 @@ def resend_otp(request):
 # ---------------------------
 # LOGIN USER
 # ---------------------------
-@extend_schema(
-    request=LoginSerializer,
-    responses={200: OpenApiResponse(response=UserProfileSerializer, description="Login successful."),
-               400: OpenApiResponse(description="Invalid credentials.")},
-    tags=["Authentication"],
-    summary="Login User",
-)
-@api_view(["POST"])
-@permission_classes([AllowAny])
-def login_view(request):
-    """User login"""
-    serializer = LoginSerializer(data=request.data)
-    serializer.is_valid(raise_exception=False)
-
-    if not serializer.is_valid():
-        field, msgs = next(iter(serializer.errors.items()))
-        error_message = msgs[0] if isinstance(msgs, list) else str(msgs)
-        return Response({"message": error_message}, status=400)
-
-    email = serializer.validated_data.get("email")
-    password = serializer.validated_data.get("password")
-
-    user = authenticate(username=email, password=password)
-    if not user:
-        return Response({"message": "Invalid credentials."}, status=400)
-
-    if not user.is_email_verified:
-        return Response({"message": "Please verify your email before logging in."}, status=403)
-
-    tokens = get_tokens_for_user(user)
-    return Response(
-        {"message": "Login successful.", "tokens": tokens, "user": UserProfileSerializer(user).data},
-        status=200,
+class LoginView(AsyncAPIView):
+    """User login; the password is checked in the hashing pool, off the event loop"""
+    permission_classes = [AllowAny]
+
+    @extend_schema(
+        request=LoginSerializer,
+        responses={200: OpenApiResponse(response=UserProfileSerializer, description="Login successful."),
+                   400: OpenApiResponse(description="Invalid credentials.")},
+        tags=["Authentication"],
+        summary="Login User",
     )
+    async def post(self, request):
+        serializer = LoginSerializer(data=request.data)
+        if not serializer.is_valid():
+            field, msgs = next(iter(serializer.errors.items()))
+            error_message = msgs[0] if isinstance(msgs, list) else str(msgs)
+            return Response({"message": error_message}, status=400)
+
+        email = serializer.validated_data.get("email")
+        password = serializer.validated_data.get("password")
+
+        user = await UserService.authenticate(email, password)
+        if not user:
+            return Response({"message": "Invalid credentials."}, status=400)
+
+        if not user.is_email_verified:
+            return Response({"message": "Please verify your email before logging in."}, status=403)
+
+        tokens = await sync_to_async(get_tokens_for_user)(user)
+        return Response(
+            {"message": "Login successful.", "tokens": tokens, "user": await sync_to_async(user_payload)(user, request)},
+            status=200,
+        )
+
+
+login_view = LoginView.as_view()
 
 
 # ---------------------------
@@ -262,9 +252,8 @@ def login_view(request):
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def profile_view(request):
-    """Get user profile"""
-    serializer = UserProfileSerializer(request.user)
-    return Response(serializer.data, status=200)
+    """Get user profile; `?fields=` / `?expand=business_profile.deals` select what is returned"""
+    return Response(user_payload(request.user, request), status=200)
 
 
 # ---------------------------
@@ -309,5 +298,4 @@ class UserViewSet(viewsets.ViewSet):
         except (User.DoesNotExist, ValueError):
             return Response({"error": "User not found."}, status=404)
 
-        serializer = UserProfileSerializer(user)
-        return Response(serializer.data, status=200)
+        return Response(user_payload(user, request), status=200)
@@ -1,42 +1,26 @@
-from django.contrib.auth import authenticate
+from asgiref.sync import sync_to_async
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework_simplejwt.tokens import RefreshToken
 
 from accounts.models import Business
 from accounts.serializers import LoginSerializer, UserProfileSerializer, BusinessRegistrationSerializer, \
     BusinessResponseSerializer
 from accounts.services.business_service import BusinessService
-from accounts.views import get_tokens_for_user
+from accounts.services.user_service import UserService
+from accounts.views import get_tokens_for_user, user_payload
+from dealshark.aio import AsyncAPIView
+from dealshark.cache import read_through
+from dealshark.serializers import fieldset_cache_key, optimize_queryset, sparse_fieldset
+from deals import cache as deal_cache
 
 
-class BusinessAuthViewSet(viewsets.ViewSet):
+class BusinessLoginView(AsyncAPIView):
+    """Business login; the password is checked in the hashing pool, off the event loop"""
     permission_classes = [AllowAny]
 
-    def get_tokens_for_user(self, user):
-        refresh = RefreshToken.for_user(user)
-        return {"refresh": str(refresh), "access": str(refresh.access_token)}
-
-    @action(detail=False, methods=["post"])
-    def register(self, request):
-        serializer = BusinessRegistrationSerializer(data=request.data)
-        if not serializer.is_valid():
-            return Response(serializer.errors, status=400)
-
-        try:
-            business, user = BusinessService.register_business(serializer.validated_data)
-            response_data = BusinessResponseSerializer(business).data
-            response_data["message"] = "Business registered successfully. OTP sent."
-            return Response(response_data, status=status.HTTP_201_CREATED)
-        except ValueError as ve:
-            return Response({"error": str(ve)}, status=400)
-        except Exception as e:
-            return Response({"error": str(e)}, status=500)
-
-    @action(detail=False, methods=["post"])
-    def login(self, request):
+    async def post(self, request):
         serializer = LoginSerializer(data=request.data)
 
         if not serializer.is_valid():
@@ -45,8 +29,7 @@ class BusinessAuthViewSet(viewsets.ViewSet):
         email = serializer.validated_data.get("email")
         password = serializer.validated_data.get("password")
 
-        # Authenticate manually
-        user = authenticate(username=email, password=password)
+        user = await UserService.authenticate(email, password)
 
         if not user:
             return Response({"message": "Invalid credentials."}, status=400)
@@ -57,17 +40,37 @@ class BusinessAuthViewSet(viewsets.ViewSet):
         if user.user_type != "business":  # restrict to business login
             return Response({"message": "This login is only for business accounts."}, status=403)
 
-        tokens = self.get_tokens_for_user(user)
+        tokens = await sync_to_async(get_tokens_for_user)(user)
 
         return Response(
             {
                 "message": "Login successful.",
                 "tokens": tokens,
-                "user": UserProfileSerializer(user).data,
+                "user": await sync_to_async(user_payload)(user, request),
             },
             status=200,
         )
 
+
+class BusinessAuthViewSet(viewsets.ViewSet):
+    permission_classes = [AllowAny]
+
+    @action(detail=False, methods=["post"])
+    def register(self, request):
+        serializer = BusinessRegistrationSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+
+        try:
+            business, user = BusinessService.register_business(serializer.validated_data)
+            response_data = BusinessResponseSerializer(business).data
+            response_data["message"] = "Business registered successfully. OTP sent."
+            return Response(response_data, status=status.HTTP_201_CREATED)
+        except ValueError as ve:
+            return Response({"error": str(ve)}, status=400)
+        except Exception as e:
+            return Response({"error": str(e)}, status=500)
+
     @action(detail=True, methods=["patch"], permission_classes=[IsAuthenticated])
     def update_business(self, request, pk=None):
         """Update business details like logo, cover, etc."""
@@ -95,11 +98,25 @@ class BusinessAuthViewSet(viewsets.ViewSet):
 
     @action(detail=True, methods=["get"], url_path="profile", permission_classes=[AllowAny])
     def profile(self, request, pk=None):
-        """Public: Get business profile by ID"""
+        """Public: Get business profile by ID; deals only with ?expand=deals"""
         try:
-            business = Business.objects.get(pk=pk)
-        except Business.DoesNotExist:
+            business_id = int(pk)
+        except ValueError:
             return Response({"error": "Business not found."}, status=404)
 
-        serializer = BusinessResponseSerializer(business)
-        return Response(serializer.data, status=200)
+        selection = sparse_fieldset(request)
+        businesses = optimize_queryset(
+            Business.objects.filter(pk=business_id), BusinessResponseSerializer(**selection)
+        )
+
+        def build():
+            business = businesses.first()
+            return BusinessResponseSerializer(business, **selection).data if business else None
+
+        data = read_through(
+            deal_cache.BUSINESS_PROFILE, fieldset_cache_key(business_id, request), build,
+            namespaces=[deal_cache.business_namespace(business_id)],
+        )
+        if data is None:
+            return Response({"error": "Business not found."}, status=404)
+        return Response(data, status=200)
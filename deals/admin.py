@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Deal
+from .models import Deal, DealDailyStats
 
 
 @admin.register(Deal)
@@ -7,4 +7,11 @@ class DealAdmin(admin.ModelAdmin):
     list_display = ('deal_name', 'business', 'reward_type', 'customer_incentive', 'is_active', 'created_at')
     list_filter = ('reward_type', 'customer_incentive', 'is_active', 'created_at')
     search_fields = ('deal_name', 'business__business_name', 'business__user__email')
-    raw_id_fields = ('business',)
\ No newline at end of file
+    raw_id_fields = ('business',)
+
+
+@admin.register(DealDailyStats)
+class DealDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ('deal', 'date', 'clicks', 'subscriptions', 'checkouts', 'conversions', 'revenue')
+    list_filter = ('date',)
+    raw_id_fields = ('deal',)
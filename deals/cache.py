@@ -0,0 +1,27 @@
+"""Cache names and invalidation namespaces for the public deal/business/referral endpoints"""
+
+# read_through() names, one per endpoint (also the keys of the hit/miss stats)
+DEAL_DETAIL = "deal-detail"
+DEAL_CATALOGUE = "deal-catalogue"
+BUSINESS_DEALS = "business-deals"
+BUSINESS_PROFILE = "business-profile"
+INDUSTRY_LIST = "industry-list"
+REFERRAL_CODE = "referral-code"  # referrals.resolver
+
+CACHE_NAMES = (DEAL_DETAIL, DEAL_CATALOGUE, BUSINESS_DEALS, BUSINESS_PROFILE, INDUSTRY_LIST, REFERRAL_CODE)
+
+# Namespaces
+CATALOGUE = "catalogue"
+INDUSTRIES = "industries"
+
+
+def deal_namespace(deal_id):
+    return f"deal:{deal_id}"
+
+
+def business_namespace(business_id):
+    return f"business:{business_id}"
+
+
+def user_namespace(user_id):
+    return f"user:{user_id}"
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from deals.services.stats_service import StatsService
+from referrals.models import LedgerEntry, ReferralClick, ReferralSubscription
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the clicks, subscriptions, conversions and revenue of DealDailyStats "
+        "from recorded clicks, subscriptions and the ledger, one date window at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from", dest="start", help="First day (YYYY-MM-DD), defaults to the oldest record")
+        parser.add_argument("--to", dest="end", help="Last day (YYYY-MM-DD), defaults to today")
+        parser.add_argument("--chunk-days", type=int, default=31, help="Days rebuilt per transaction")
+
+    def handle(self, *args, **options):
+        end = self._date(options["end"]) or timezone.localdate()
+        start = self._date(options["start"]) or self._oldest() or end
+        if start > end:
+            raise CommandError("--from must not be after --to")
+        if options["chunk_days"] < 1:
+            raise CommandError("--chunk-days must be at least 1")
+
+        for window_start, window_end in StatsService.backfill(start, end, options["chunk_days"]):
+            self.stdout.write(f"Rebuilt {window_start} to {window_end}")
+        self.stdout.write(self.style.SUCCESS(f"Deal stats rebuilt from {start} to {end}"))
+
+    def _date(self, value):
+        if value is None:
+            return None
+        date = parse_date(value)
+        if date is None:
+            raise CommandError(f"Invalid date {value}, expected YYYY-MM-DD")
+        return date
+
+    def _oldest(self):
+        oldest = [
+            model.objects.order_by(field).values_list(field, flat=True).first()
+            for model, field in (
+                (ReferralClick, "clicked_at"), (ReferralSubscription, "created_at"), (LedgerEntry, "created_at"),
+            )
+        ]
+        oldest = [timezone.localdate(value) for value in oldest if value]
+        return min(oldest) if oldest else None
@@ -0,0 +1,210 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from accounts.models import Business, User
+from deals import search
+from deals.models import Deal
+
+BENCH_EMAIL_DOMAIN = "bench.dealshark.invalid"
+PAGE_SIZE = 20
+
+WORDS = [
+    "running", "shoes", "coffee", "beans", "organic", "pizza", "yoga", "studio",
+    "laptop", "repair", "garden", "tools", "vintage", "jacket", "bakery", "bread",
+    "fitness", "membership", "spa", "massage", "pet", "grooming", "bike", "service",
+    "wine", "tasting", "sushi", "dinner", "hotel", "weekend", "camera", "lens",
+    "skincare", "bundle", "guitar", "lessons", "florist", "bouquet", "car", "wash",
+    "dental", "cleaning", "barber", "haircut", "tea", "sampler", "kids", "camp",
+]
+INDUSTRIES = ["Retail", "Food", "Fitness", "Beauty", "Travel", "Services", "Electronics"]
+CITIES = ["Austin", "Denver", "Seattle", "Boston", "Chicago", "Miami", "Portland"]
+
+SEED_DEALS_SQL = """
+    INSERT INTO deals_deal (
+        id, business_id, deal_name, deal_description, reward_type, customer_incentive,
+        poster_text, no_reward_reason, is_featured, is_active, subscribers_count, created_at, updated_at
+    )
+    SELECT
+        gen_random_uuid(),
+        (%(business_ids)s::bigint[])[1 + (g %% %(business_count)s)],
+        initcap(w[1 + (g * 7) %% %(word_count)s] || ' ' || w[1 + (g * 13) %% %(word_count)s]),
+        array_to_string(ARRAY(
+            SELECT w[1 + floor(random() * %(word_count)s)::int] FROM generate_series(1, 12)
+            WHERE g IS NOT NULL
+        ), ' '),
+        'commission',
+        5 + (g %% 20),
+        'Earn ' || (5 + (g %% 20)) || '%% commission by sharing this deal!',
+        NULL,
+        g %% 10 = 0,
+        true,
+        0,
+        now() - (g || ' seconds')::interval,
+        now()
+    FROM generate_series(%(start)s, %(stop)s) AS g, (SELECT %(words)s::text[] AS w) AS vocabulary
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare p50/p95 latency of the legacy icontains deal search against the "
+        "full-text search engine on a synthetic dataset."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--deals", type=int, default=1_000_000, help="Synthetic deals to seed")
+        parser.add_argument("--businesses", type=int, default=2_000, help="Synthetic businesses to seed")
+        parser.add_argument("--queries", type=int, default=200, help="Queries per search path")
+        parser.add_argument("--chunk-size", type=int, default=100_000, help="Deals inserted per statement")
+        parser.add_argument("--skip-seed", action="store_true", help="Reuse previously seeded data")
+        parser.add_argument("--cleanup", action="store_true", help="Delete the synthetic data afterwards")
+        parser.add_argument("--seed", type=int, default=42, help="Random seed for the query mix")
+
+    def handle(self, *args, **options):
+        if not options["skip_seed"]:
+            self.seed(options["businesses"], options["deals"], options["chunk_size"])
+
+        rng = random.Random(options["seed"])
+        queries = [self.random_query(rng) for _ in range(options["queries"])]
+
+        legacy = self.measure(self.legacy_search, queries)
+        fulltext = self.measure(self.fulltext_search, queries)
+
+        self.stdout.write(f"{'path':<12}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+        for name, timings in (("icontains", legacy), ("fulltext", fulltext)):
+            p50, p95 = self.percentiles(timings)
+            self.stdout.write(f"{name:<12}{p50:>10.2f}{p95:>10.2f}{max(timings):>10.2f}")
+
+        if options["cleanup"]:
+            self.cleanup()
+
+    # ---------------------------
+    # SEARCH PATHS
+    # ---------------------------
+    @staticmethod
+    def legacy_search(text):
+        """The pre-search-engine all_deals filter, limited to one page"""
+        return list(
+            Deal.objects.select_related("business")
+            .filter(
+                Q(deal_name__icontains=text)
+                | Q(deal_description__icontains=text)
+                | Q(business__business_name__icontains=text)
+            )
+            .order_by("-is_featured", "-created_at", "-id")[:PAGE_SIZE]
+        )
+
+    @staticmethod
+    def fulltext_search(text):
+        return list(
+            search.search_deals(Deal.objects.select_related("business"), text)
+            .order_by("-rank", "-id")[:PAGE_SIZE]
+        )
+
+    @staticmethod
+    def random_query(rng):
+        word = rng.choice(WORDS)
+        kind = rng.random()
+        if kind < 0.3:
+            return f"{word} {rng.choice(WORDS)}"
+        if kind < 0.6:
+            return word[: max(3, len(word) - 2)]  # prefix, as typed
+        if kind < 0.8 and len(word) > 4:
+            position = rng.randrange(1, len(word) - 1)
+            return word[:position] + word[position + 1:]  # dropped letter
+        return word
+
+    @staticmethod
+    def measure(search_path, queries):
+        search_path(queries[0])  # warm up connection and caches
+        timings = []
+        for text in queries:
+            started = time.perf_counter()
+            search_path(text)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    @staticmethod
+    def percentiles(timings):
+        if len(timings) < 2:
+            return timings[0], timings[0]
+        cuts = statistics.quantiles(timings, n=100, method="inclusive")
+        return cuts[49], cuts[94]
+
+    # ---------------------------
+    # SYNTHETIC DATA
+    # ---------------------------
+    def seed(self, business_count, deal_count, chunk_size):
+        self.cleanup()
+        self.stdout.write(f"Seeding {business_count} businesses and {deal_count} deals...")
+        password = make_password(None)
+
+        with transaction.atomic():
+            users = User.objects.bulk_create(
+                User(
+                    email=f"bench-{i}@{BENCH_EMAIL_DOMAIN}",
+                    username=f"bench-{i}@{BENCH_EMAIL_DOMAIN}",
+                    phone_number=f"+1999{i:08d}",
+                    user_type="business",
+                    password=password,
+                )
+                for i in range(business_count)
+            )
+            businesses = Business.objects.bulk_create(
+                Business(
+                    user=user,
+                    business_name=f"{WORDS[i % len(WORDS)].title()} {WORDS[(i * 5) % len(WORDS)].title()} Co",
+                    business_email=user.email,
+                    business_phone=user.phone_number,
+                    website="https://example.com",
+                    designation="Owner",
+                    registration_no=f"BENCH-{i}",
+                    business_address="1 Benchmark Way",
+                    business_city=CITIES[i % len(CITIES)],
+                    business_state="-",
+                    business_country="US",
+                    industry=INDUSTRIES[i % len(INDUSTRIES)],
+                )
+                for i, user in enumerate(users)
+            )
+
+        business_ids = [business.id for business in businesses]
+        with connection.cursor() as cursor:
+            for start in range(0, deal_count, chunk_size):
+                stop = min(start + chunk_size, deal_count) - 1
+                cursor.execute(SEED_DEALS_SQL, {
+                    "business_ids": business_ids,
+                    "business_count": len(business_ids),
+                    "words": WORDS,
+                    "word_count": len(WORDS),
+                    "start": start,
+                    "stop": stop,
+                })
+                self.stdout.write(f"  {stop + 1}/{deal_count} deals")
+
+        # Bulk inserts bypass the post_save signals that maintain the index
+        self.stdout.write("Building search vectors...")
+        search.rebuild_all()
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE deals_deal")
+            cursor.execute("ANALYZE deals_searchterm")
+
+    def cleanup(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                DELETE FROM deals_deal WHERE business_id IN (
+                    SELECT b.id FROM accounts_business b
+                    JOIN accounts_user u ON u.id = b.user_id
+                    WHERE u.email LIKE %s
+                )
+                """,
+                [f"%@{BENCH_EMAIL_DOMAIN}"],
+            )
+        User.objects.filter(email__endswith=f"@{BENCH_EMAIL_DOMAIN}").delete()
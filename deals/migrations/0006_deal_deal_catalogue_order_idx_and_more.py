@@ -0,0 +1,31 @@
+# Generated by Django 4.2.24 on 2026-10-18 11:07
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("deals", "0005_alter_deal_is_active"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="deal",
+            index=models.Index(
+                fields=["-is_featured", "-created_at", "-id"],
+                name="deal_catalogue_order_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="deal",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.search.SearchVector(
+                    "deal_name", "deal_description", config="simple"
+                ),
+                name="deal_search_vector_idx",
+            ),
+        ),
+    ]
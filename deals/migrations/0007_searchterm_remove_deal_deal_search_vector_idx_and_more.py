@@ -0,0 +1,91 @@
+# Generated by Django 4.2.24 on 2026-10-18 11:07
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+BACKFILL_SEARCH_VECTORS = """
+    UPDATE deals_deal AS d
+    SET search_vector =
+        setweight(to_tsvector('simple', COALESCE(d.deal_name, '')), 'A')
+        || setweight(to_tsvector('simple', COALESCE(b.business_name, '')), 'A')
+        || setweight(to_tsvector('simple', COALESCE(d.poster_text, '') || ' ' || COALESCE(d.deal_description, '')), 'B')
+        || setweight(to_tsvector('simple', COALESCE(b.industry, '') || ' ' || COALESCE(b.business_city, '')), 'C')
+    FROM accounts_business AS b
+    WHERE b.id = d.business_id;
+
+    INSERT INTO deals_searchterm (term)
+    SELECT DISTINCT lexeme
+    FROM deals_deal AS d, unnest(tsvector_to_array(d.search_vector)) AS lexeme
+    WHERE length(lexeme) <= 100
+    ON CONFLICT (term) DO NOTHING;
+"""
+
+
+def enable_trigram_correction(apps, schema_editor):
+    """pg_trgm is optional: without it deals.search falls back to difflib"""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS search_term_trgm_idx "
+            "ON deals_searchterm USING gin (term gin_trgm_ops)"
+        )
+
+
+def drop_trigram_index(apps, schema_editor):
+    schema_editor.execute("DROP INDEX IF EXISTS search_term_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("deals", "0006_deal_deal_catalogue_order_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchTerm",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("term", models.CharField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name="deal",
+            name="deal_search_vector_idx",
+        ),
+        migrations.AddField(
+            model_name="deal",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="deal",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="deal_search_gin_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="searchterm",
+            index=models.Index(
+                fields=["term"],
+                name="search_term_prefix_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+        migrations.RunSQL(BACKFILL_SEARCH_VECTORS, migrations.RunSQL.noop),
+        migrations.RunPython(enable_trigram_correction, drop_trigram_index),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.24 on 2026-10-18 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("deals", "0007_searchterm_remove_deal_deal_search_vector_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="deal",
+            name="subscribers_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="deal",
+            index=models.Index(
+                fields=["-subscribers_count", "-id"], name="deal_popularity_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.24 on 2026-10-18 11:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("deals", "0008_deal_subscribers_count_deal_deal_popularity_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DealDailyStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("clicks", models.PositiveIntegerField(default=0)),
+                ("subscriptions", models.PositiveIntegerField(default=0)),
+                ("checkouts", models.PositiveIntegerField(default=0)),
+                ("conversions", models.PositiveIntegerField(default=0)),
+                ("revenue", models.BigIntegerField(default=0)),
+                (
+                    "deal",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_stats",
+                        to="deals.deal",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["date"],
+                "unique_together": {("deal", "date")},
+            },
+        ),
+    ]
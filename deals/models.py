@@ -1,12 +1,10 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils import timezone
 import uuid
 from accounts.models import Business
-
-
-from django.db import models
-from accounts.models import Business
-import uuid
+from dealshark.utils import fields_except
 
 
 class Deal(models.Model):
@@ -29,5 +27,63 @@ class Deal(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Maintained by ReferralService from subscription changes, never set directly
+    subscribers_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Maintained by deals.search from Deal/Business saves, never set directly
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset order used by DealKeysetPagination
+            models.Index(fields=["-is_featured", "-created_at", "-id"], name="deal_catalogue_order_idx"),
+            GinIndex(fields=["search_vector"], name="deal_search_gin_idx"),
+            # Keyset order for ?sort=popular
+            models.Index(fields=["-subscribers_count", "-id"], name="deal_popularity_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Both columns are maintained with queryset updates, never write back a stale copy
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = fields_except(self, "subscribers_count", "search_vector")
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.deal_name} ({self.business.business_name})"
+
+
+class SearchTerm(models.Model):
+    """Every word present in a deal search vector, used for typo correction"""
+    term = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["term"], name="search_term_prefix_idx", opclasses=["varchar_pattern_ops"]),
+        ]
+
+    def __str__(self):
+        return self.term
+
+
+class DealDailyStats(models.Model):
+    """
+    Per deal, per day counters for the business dashboard. Maintained
+    incrementally from tracked events and rebuilt from history with
+    backfill_deal_stats, see deals.services.stats_service.
+    """
+    METRICS = ("clicks", "subscriptions", "checkouts", "conversions", "revenue")
+
+    deal = models.ForeignKey(Deal, on_delete=models.CASCADE, related_name="daily_stats")
+    date = models.DateField()
+    clicks = models.PositiveIntegerField(default=0)
+    subscriptions = models.PositiveIntegerField(default=0)
+    checkouts = models.PositiveIntegerField(default=0)
+    conversions = models.PositiveIntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)  # cents, the business's share
+
+    class Meta:
+        ordering = ["date"]
+        unique_together = ("deal", "date")
+
+    def __str__(self):
+        return f"{self.deal_id} {self.date}"
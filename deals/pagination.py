@@ -0,0 +1,139 @@
+import base64
+import datetime
+import json
+import uuid
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class CursorEncoder(json.JSONEncoder):
+    """Like DjangoJSONEncoder, but keeps full microsecond precision on datetimes."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        if isinstance(o, (uuid.UUID, Decimal)):
+            return str(o)
+        return super().default(o)
+
+
+class DealKeysetPagination(BasePagination):
+    """
+    Forward-only keyset pagination. The cursor carries the full sort key of
+    the last row, so every page is a bounded index range scan instead of an
+    OFFSET. Defaults to newest featured deals first; search results and the
+    subscription listings pass their own ordering (e.g. by rank).
+    """
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 100
+    ordering = ("-is_featured", "-created_at", "-id")
+    invalid_cursor_message = "Invalid cursor"
+
+    def __init__(self, ordering=None):
+        if ordering:
+            self.ordering = tuple(ordering)
+
+    @property
+    def fields(self):
+        return [field.lstrip("-") for field in self.ordering]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request)
+        queryset = queryset.order_by(*self.ordering)
+        try:
+            if position:
+                queryset = queryset.filter(self.build_position_filter(position))
+            # Fetch one extra row to know whether there is a next page
+            results = list(queryset[: self.page_size + 1])
+        except (ValidationError, TypeError, ValueError):
+            # Cursor values that do not fit the ordered fields (bad uuid, date...)
+            raise NotFound(self.invalid_cursor_message)
+        page = results[: self.page_size]
+        self.next_cursor = self.encode_cursor(page[-1]) if len(results) > self.page_size else None
+        return page
+
+    def resume(self, request, next_cursor):
+        """Restore state for a page whose results were served from cache"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.next_cursor = next_cursor
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def build_position_filter(self, position):
+        """
+        Rows strictly after `position` in the configured ordering, i.e. the
+        lexicographic (a, b, c) > (x, y, z) expanded into OR-ed prefixes.
+        """
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            prefix = {self.fields[i]: position[i] for i in range(index)}
+            condition |= Q(**prefix, **{f"{name}__{lookup}": position[index]})
+        return condition
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")).decode("utf-8"))
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, instance):
+        if isinstance(instance, dict):  # .values() querysets
+            position = [instance[field] for field in self.fields]
+        else:
+            position = [getattr(instance, field) for field in self.fields]
+        return base64.urlsafe_b64encode(
+            json.dumps(position, cls=CursorEncoder).encode("utf-8")
+        ).decode("ascii")
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("next", self.get_next_link()),
+            ("page_size", self.page_size),
+            ("results", data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "page_size": {"type": "integer"},
+                "results": schema,
+            },
+        }
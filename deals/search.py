@@ -0,0 +1,184 @@
+"""
+Full-text search over the deal catalogue.
+
+Every Deal stores a weighted ``search_vector`` built from its own fields and
+its business' name, industry and city:
+
+    A  deal_name, business_name
+    B  poster_text, deal_description
+    C  industry, business_city
+
+The vector is refreshed incrementally from Deal/Business saves (see
+``deals/signals.py``) and indexed with GIN, so queries never rebuild it.
+Words seen in any vector are also kept in ``SearchTerm``, which is what the
+typo correction looks candidates up in.
+"""
+import difflib
+import functools
+import re
+
+from django.contrib.postgres.search import (
+    SearchHeadline, SearchQuery, SearchRank, SearchVector, TrigramSimilarity,
+)
+from django.db import connection
+from django.db.models import CharField, DecimalField, F, Value
+from django.db.models.functions import Cast, Length
+
+from deals.models import Deal, SearchTerm
+
+SEARCH_CONFIG = "simple"
+MAX_QUERY_TERMS = 8
+MAX_TERM_LENGTH = 100
+# Shorter terms already match broadly by prefix, don't second-guess them
+MIN_CORRECTABLE_LENGTH = 4
+TRIGRAM_THRESHOLD = 0.3
+DIFFLIB_CUTOFF = 0.75
+DIFFLIB_MAX_CANDIDATES = 2000
+
+# ts_rank is a float4; as numeric it compares and serializes exactly in keyset cursors
+RANK_FIELD = DecimalField(max_digits=12, decimal_places=6)
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_STOP = "</mark>"
+
+TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+# Same weights as deal_search_vector(), for bulk rebuilds over a join
+REBUILD_SQL = """
+    UPDATE deals_deal AS d
+    SET search_vector =
+        setweight(to_tsvector('simple', COALESCE(d.deal_name, '')), 'A')
+        || setweight(to_tsvector('simple', COALESCE(b.business_name, '')), 'A')
+        || setweight(to_tsvector('simple', COALESCE(d.poster_text, '') || ' ' || COALESCE(d.deal_description, '')), 'B')
+        || setweight(to_tsvector('simple', COALESCE(b.industry, '') || ' ' || COALESCE(b.business_city, '')), 'C')
+    FROM accounts_business AS b
+    WHERE b.id = d.business_id
+"""
+
+LEXICON_SQL = """
+    INSERT INTO deals_searchterm (term)
+    SELECT DISTINCT lexeme
+    FROM deals_deal AS d, unnest(tsvector_to_array(d.search_vector)) AS lexeme
+    WHERE d.id IN ({deal_ids_sql}) AND length(lexeme) <= %s
+    ON CONFLICT (term) DO NOTHING
+"""
+
+
+def _text(value):
+    return Value(value or "", output_field=CharField())
+
+
+def deal_search_vector(business):
+    """Vector expression for the deals of `business`, usable in a queryset .update()"""
+    return (
+        SearchVector("deal_name", weight="A", config=SEARCH_CONFIG)
+        + SearchVector(_text(business.business_name), weight="A", config=SEARCH_CONFIG)
+        + SearchVector("poster_text", "deal_description", weight="B", config=SEARCH_CONFIG)
+        + SearchVector(
+            _text(business.industry), _text(business.business_city),
+            weight="C", config=SEARCH_CONFIG,
+        )
+    )
+
+
+def refresh_search_vectors(deals, business):
+    """Recompute the vectors of `deals` (a queryset of one business' deals) in one UPDATE"""
+    deals.update(search_vector=deal_search_vector(business))
+    update_lexicon(deals)
+
+
+def refresh_deal(deal):
+    refresh_search_vectors(Deal.objects.filter(pk=deal.pk), deal.business)
+
+
+def refresh_business(business):
+    refresh_search_vectors(Deal.objects.filter(business=business), business)
+
+
+def update_lexicon(deals):
+    """Add the words of `deals`' vectors to the SearchTerm lexicon"""
+    deal_ids_sql, params = deals.values("id").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            LEXICON_SQL.format(deal_ids_sql=deal_ids_sql), (*params, MAX_TERM_LENGTH)
+        )
+
+
+def rebuild_all():
+    """Rebuild every deal vector and the lexicon from scratch (bulk, set-based)"""
+    with connection.cursor() as cursor:
+        cursor.execute(REBUILD_SQL)
+    update_lexicon(Deal.objects.all())
+
+
+@functools.lru_cache(maxsize=None)
+def has_trigram_support():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def tokenize(text):
+    return [term.lower() for term in TERM_RE.findall(text or "")][:MAX_QUERY_TERMS]
+
+
+def correct_term(term):
+    """
+    Return `term` if some indexed word starts with it, otherwise the closest
+    indexed word (pg_trgm similarity when installed, difflib otherwise).
+    """
+    if len(term) < MIN_CORRECTABLE_LENGTH or SearchTerm.objects.filter(term__startswith=term).exists():
+        return term
+
+    if has_trigram_support():
+        candidate = (
+            SearchTerm.objects.filter(term__trigram_similar=term)
+            .annotate(similarity=TrigramSimilarity("term", term))
+            .filter(similarity__gte=TRIGRAM_THRESHOLD)
+            .order_by("-similarity")
+            .values_list("term", flat=True)
+            .first()
+        )
+        return candidate or term
+
+    # Same first letter and a similar length, served by the prefix index
+    candidates = list(
+        SearchTerm.objects.filter(term__startswith=term[0])
+        .annotate(length=Length("term"))
+        .filter(length__gte=len(term) - 2, length__lte=len(term) + 2)
+        .values_list("term", flat=True)[:DIFFLIB_MAX_CANDIDATES]
+    )
+    matches = difflib.get_close_matches(term, candidates, n=1, cutoff=DIFFLIB_CUTOFF)
+    return matches[0] if matches else term
+
+
+def build_query(text):
+    """Prefix-matching tsquery over typo-corrected terms ("runing sho" -> running:* & sho:*)"""
+    terms = [correct_term(term) for term in tokenize(text)]
+    if not terms:
+        return None
+    return SearchQuery(
+        " & ".join(f"{term}:*" for term in terms), search_type="raw", config=SEARCH_CONFIG
+    )
+
+
+def search_deals(queryset, text):
+    """
+    Filter `queryset` to deals matching `text`, annotated with `rank` and
+    `name_highlight` / `description_highlight` (matches wrapped in <mark>).
+    Order by ("-rank", "-id") for relevance.
+    """
+    query = build_query(text)
+    if query is None:
+        return queryset.none()
+
+    highlight = dict(
+        config=SEARCH_CONFIG, start_sel=HIGHLIGHT_START, stop_sel=HIGHLIGHT_STOP,
+    )
+    return queryset.filter(search_vector=query).annotate(
+        rank=Cast(SearchRank(F("search_vector"), query), RANK_FIELD),
+        name_highlight=SearchHeadline("deal_name", query, highlight_all=True, **highlight),
+        description_highlight=SearchHeadline(
+            "deal_description", query, max_words=35, min_words=15, **highlight
+        ),
+    )
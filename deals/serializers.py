@@ -2,14 +2,18 @@ from rest_framework import serializers
 from django.utils import timezone
 
 from accounts.models import Business
-from referrals.models import ReferralSubscription
+from dealshark.serializers import SparseFieldsetMixin
+from uploads.serializers import SrcsetField
 from .models import Deal
 
 
 
 
-class BusinessMiniSerializer(serializers.ModelSerializer):
-    business_subscribers_count = serializers.SerializerMethodField()
+class BusinessMiniSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    business_subscribers_count = serializers.IntegerField(source="subscribers_count", read_only=True)
+    business_logo_srcset = SrcsetField("business_logo_url", "business_logo_variants")
+    business_cover_srcset = SrcsetField("business_cover_url", "business_cover_variants")
+
     class Meta:
         model = Business
         fields = [
@@ -23,16 +27,15 @@ class BusinessMiniSerializer(serializers.ModelSerializer):
             "industry",
             "business_logo_url",
             "business_cover_url",
+            "business_logo_srcset",
+            "business_cover_srcset",
         ]
 
-    def get_business_subscribers_count(self, obj):
-        return ReferralSubscription.objects.filter(deal__business=obj).count()
-
 
-class DealSerializer(serializers.ModelSerializer):
+class DealSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     business = BusinessMiniSerializer(read_only=True)
     #business = serializers.SerializerMethodField()
-    subscribers_count = serializers.SerializerMethodField()
+    subscribers_count = serializers.IntegerField(read_only=True)
     subscription_info = serializers.SerializerMethodField()
 
     class Meta:
@@ -49,9 +52,6 @@ class DealSerializer(serializers.ModelSerializer):
     #     from accounts.serializers import BusinessResponseSerializer
     #     return BusinessResponseSerializer(obj.business).data
 
-    def get_subscribers_count(self, obj):
-        return obj.subscriptions.count()
-
     def get_subscription_info(self, obj):
         """
         Return subscription info for the current user:
@@ -61,6 +61,18 @@ class DealSerializer(serializers.ModelSerializer):
           "referral_code": "XXXX"
         }
         """
+        # Batched path: DealService.get_serializer_context already resolved the user
+        user_subscriptions = self.context.get("user_subscriptions")
+        if user_subscriptions is not None:
+            subscription = user_subscriptions.get(obj.id)
+            if subscription:
+                return {
+                    "is_subscribed": True,
+                    "referral_link": subscription["referral_link"],
+                    "referral_code": subscription["referral_code"],
+                }
+            return {"is_subscribed": False}
+
         request = self.context.get("request")
         user = None
 
@@ -90,6 +102,21 @@ class DealSerializer(serializers.ModelSerializer):
         return {"is_subscribed": False}
 
 
+class DealSearchResultSerializer(DealSerializer):
+    """DealSerializer plus the rank and highlights annotated by deals.search.search_deals"""
+    search_rank = serializers.FloatField(source="rank", read_only=True)
+    highlight = serializers.SerializerMethodField()
+
+    class Meta(DealSerializer.Meta):
+        fields = DealSerializer.Meta.fields + ["search_rank", "highlight"]
+
+    def get_highlight(self, obj):
+        return {
+            "deal_name": obj.name_highlight,
+            "deal_description": obj.description_highlight,
+        }
+
+
 class DealCreateSerializer(DealSerializer):
     def create(self, validated_data):
         request = self.context.get('request')
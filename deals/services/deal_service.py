@@ -1,6 +1,10 @@
+from uuid import UUID
+
+from django.core.exceptions import ValidationError
 from django.db import transaction
 
 from deals.models import Deal
+from referrals.models import ReferralSubscription
 
 class DealService:
     @staticmethod
@@ -50,3 +54,70 @@ class DealService:
             poster_text=poster_text,
         )
         return deal
+
+    @staticmethod
+    def resolve_user(request=None, user_id=None):
+        """Logged-in user, or the user the frontend passes explicitly as user_id"""
+        if request and request.user and request.user.is_authenticated:
+            return request.user
+        if user_id:
+            from accounts.models import User
+            try:
+                return User.objects.filter(id=user_id).first()
+            except ValidationError:
+                return None
+        return None
+
+    @staticmethod
+    def get_user_subscriptions(deal_ids, request=None, user_id=None):
+        """{deal_id: {"referral_link", "referral_code"}} for the current user, one query"""
+        user = DealService.resolve_user(request, user_id)
+        if not user or not deal_ids:
+            return {}
+        return {
+            sub["deal_id"]: sub
+            for sub in ReferralSubscription.objects.filter(
+                referrer=user, deal_id__in=deal_ids
+            ).values("deal_id", "referral_link", "referral_code")
+        }
+
+    @staticmethod
+    def get_serializer_context(deals, request=None, user_id=None):
+        """
+        Build DealSerializer context for a page of deals, resolving the user's
+        subscriptions in one query instead of one lookup per deal. Without
+        request/user_id the output holds no per-user data and can be cached
+        and shared (see apply_subscription_info).
+        """
+        deal_ids = [deal.id for deal in deals]
+        return {
+            "request": request,
+            "user_id": user_id,
+            "user_subscriptions": DealService.get_user_subscriptions(deal_ids, request, user_id),
+        }
+
+    @staticmethod
+    def apply_subscription_info(deals_data, request=None, user_id=None):
+        """
+        Overlay the per-user `subscription_info` on shared (cached) DealSerializer
+        output. Returns new dicts; the shared payload is left untouched.
+        Payloads whose fieldset left `subscription_info` out are returned as is.
+        """
+        if not any("subscription_info" in deal for deal in deals_data):
+            return deals_data
+        subscriptions = DealService.get_user_subscriptions(
+            [deal["id"] for deal in deals_data], request, user_id
+        )
+        results = []
+        for deal in deals_data:
+            subscription = subscriptions.get(UUID(str(deal["id"])))
+            if subscription:
+                info = {
+                    "is_subscribed": True,
+                    "referral_link": subscription["referral_link"],
+                    "referral_code": subscription["referral_code"],
+                }
+            else:
+                info = {"is_subscribed": False}
+            results.append({**deal, "subscription_info": info})
+        return results
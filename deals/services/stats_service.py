@@ -0,0 +1,195 @@
+import logging
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from deals.models import Deal, DealDailyStats
+from referrals.services.ledger_service import LedgerService
+
+logger = logging.getLogger(__name__)
+
+METRICS = DealDailyStats.METRICS
+MAX_RANGE_DAYS = 366
+
+UPSERT_STATS_SQL = """
+    INSERT INTO deals_dealdailystats (deal_id, date, clicks, subscriptions, checkouts, conversions, revenue)
+    VALUES {values}
+    ON CONFLICT (deal_id, date) DO UPDATE SET
+        clicks = deals_dealdailystats.clicks + EXCLUDED.clicks,
+        subscriptions = deals_dealdailystats.subscriptions + EXCLUDED.subscriptions,
+        checkouts = deals_dealdailystats.checkouts + EXCLUDED.checkouts,
+        conversions = deals_dealdailystats.conversions + EXCLUDED.conversions,
+        revenue = deals_dealdailystats.revenue + EXCLUDED.revenue
+"""
+
+# Clicks come from the recorded clicks, subscriptions from the subscriptions
+# still in place, conversions and revenue from the ledger's per-subscription
+# revenue accounts ("revenue:deal:<deal id>:referrer:<referrer id>", see LedgerService).
+RESET_HISTORY_SQL = """
+    UPDATE deals_dealdailystats SET clicks = 0, subscriptions = 0, conversions = 0, revenue = 0
+    WHERE date >= %(start_date)s AND date < %(end_date)s
+"""
+
+BACKFILL_HISTORY_SQL = """
+    WITH clicks AS (
+        SELECT deal_id, (clicked_at AT TIME ZONE %(tz)s)::date AS day, COUNT(*) AS n
+        FROM referrals_referralclick
+        WHERE clicked_at >= %(start)s AND clicked_at < %(end)s
+        GROUP BY 1, 2
+    ), subs AS (
+        SELECT deal_id, (created_at AT TIME ZONE %(tz)s)::date AS day, COUNT(*) AS n
+        FROM referrals_referralsubscription
+        WHERE created_at >= %(start)s AND created_at < %(end)s
+        GROUP BY 1, 2
+    ), sales AS (
+        SELECT split_part(account, ':', 3)::uuid AS deal_id, (created_at AT TIME ZONE %(tz)s)::date AS day,
+               COUNT(DISTINCT transaction_id) AS conversions, SUM(amount) AS revenue
+        FROM referrals_ledgerentry
+        WHERE account LIKE 'revenue:deal:%%' AND created_at >= %(start)s AND created_at < %(end)s
+        GROUP BY 1, 2
+    ), keys AS (
+        SELECT deal_id, day FROM clicks
+        UNION SELECT deal_id, day FROM subs
+        UNION SELECT deal_id, day FROM sales
+    )
+    INSERT INTO deals_dealdailystats (deal_id, date, clicks, subscriptions, checkouts, conversions, revenue)
+    SELECT k.deal_id, k.day, COALESCE(c.n, 0), COALESCE(s.n, 0), 0,
+           COALESCE(p.conversions, 0), COALESCE(p.revenue, 0)
+    FROM keys k
+    JOIN deals_deal d ON d.id = k.deal_id
+    LEFT JOIN clicks c ON c.deal_id = k.deal_id AND c.day = k.day
+    LEFT JOIN subs s ON s.deal_id = k.deal_id AND s.day = k.day
+    LEFT JOIN sales p ON p.deal_id = k.deal_id AND p.day = k.day
+    ON CONFLICT (deal_id, date) DO UPDATE SET
+        clicks = EXCLUDED.clicks,
+        subscriptions = EXCLUDED.subscriptions,
+        conversions = EXCLUDED.conversions,
+        revenue = EXCLUDED.revenue
+"""
+
+
+class StatsService:
+    # ---------------------------
+    # INGEST
+    # ---------------------------
+    @staticmethod
+    def track(deal_id, at=None, **counts):
+        """
+        Count deal events, e.g. track(deal_id, conversions=1, revenue=250),
+        towards the day they happened. The events are handed to Celery once
+        the current transaction commits; the request never writes to the
+        rollups itself.
+        """
+        from deals.utils import record_deal_events
+
+        date = timezone.localdate(at).isoformat()
+        events = [
+            {"deal_id": str(deal_id), "metric": metric, "value": value, "date": date}
+            for metric, value in counts.items()
+        ]
+
+        def enqueue():
+            try:
+                record_deal_events.delay(events)
+            except Exception as e:
+                logger.error(f"Failed to queue stats for deal {deal_id}: {str(e)}")
+
+        transaction.on_commit(enqueue)
+
+    @staticmethod
+    def apply(events):
+        """
+        Add a batch of events to the rollups with a single upsert, one row
+        per deal and day. Events for unknown metrics or deleted deals are
+        dropped. Returns the number of rows touched.
+        """
+        rows = {}
+        for event in events:
+            if event["metric"] not in METRICS:
+                logger.warning(f"Dropping deal event with unknown metric {event['metric']}")
+                continue
+            totals = rows.setdefault((event["deal_id"], event["date"]), dict.fromkeys(METRICS, 0))
+            totals[event["metric"]] += event["value"]
+
+        existing = {
+            str(deal_id)
+            for deal_id in Deal.objects.filter(id__in={deal_id for deal_id, _ in rows}).values_list("id", flat=True)
+        }
+        params = []
+        # Sorted, so concurrent batches lock rows in the same order
+        for (deal_id, date), totals in sorted(rows.items()):
+            if deal_id in existing:
+                params += [deal_id, date, *(totals[metric] for metric in METRICS)]
+        if not params:
+            return 0
+
+        row_count = len(params) // (len(METRICS) + 2)
+        placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * row_count)
+        with connection.cursor() as cursor:
+            cursor.execute(UPSERT_STATS_SQL.format(values=placeholders), params)
+        return row_count
+
+    # ---------------------------
+    # QUERIES
+    # ---------------------------
+    @staticmethod
+    def daily(deal, start, end):
+        """Per day and total figures for `deal` between two dates (inclusive)"""
+        stats = {
+            row["date"]: row
+            for row in DealDailyStats.objects.filter(deal=deal, date__gte=start, date__lte=end).values("date", *METRICS)
+        }
+        days = []
+        totals = dict.fromkeys(METRICS, 0)
+        day = start
+        while day <= end:
+            row = stats.get(day) or dict.fromkeys(METRICS, 0)
+            for metric in METRICS:
+                totals[metric] += row[metric]
+            days.append({"date": day, **StatsService._format(row)})
+            day += timedelta(days=1)
+        return {
+            "deal_id": str(deal.id),
+            "from": start,
+            "to": end,
+            "totals": StatsService._format(totals),
+            "days": days,
+        }
+
+    @staticmethod
+    def _format(row):
+        return {
+            **{metric: row[metric] for metric in METRICS if metric != "revenue"},
+            "revenue": LedgerService.to_amount(row["revenue"]),
+        }
+
+    # ---------------------------
+    # BACKFILL
+    # ---------------------------
+    @staticmethod
+    def backfill(start, end, chunk_days=31):
+        """
+        Rebuild clicks, subscriptions, conversions and revenue between two
+        dates (inclusive) from history, one window of `chunk_days` per
+        transaction, so neither memory nor lock time grows with the range.
+        Checkouts have no history and are left as tracked.
+        Yields each (window_start, window_end) once done.
+        """
+        tz = timezone.get_default_timezone()
+        window_start = start
+        while window_start <= end:
+            window_end = min(window_start + timedelta(days=chunk_days), end + timedelta(days=1))
+            params = {
+                "tz": settings.TIME_ZONE,
+                "start_date": window_start,
+                "end_date": window_end,
+                "start": timezone.make_aware(datetime.combine(window_start, time.min), tz),
+                "end": timezone.make_aware(datetime.combine(window_end, time.min), tz),
+            }
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(RESET_HISTORY_SQL, params)
+                cursor.execute(BACKFILL_HISTORY_SQL, params)
+            yield window_start, window_end - timedelta(days=1)
+            window_start = window_end
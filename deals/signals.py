@@ -0,0 +1,114 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from accounts.models import Business, User
+from dealshark.cache import invalidate
+from deals import cache as deal_cache
+from deals import search
+from deals.models import Deal
+from referrals.models import ReferralSubscription
+
+DEAL_SEARCH_FIELDS = {"deal_name", "deal_description", "poster_text", "business"}
+BUSINESS_SEARCH_FIELDS = {"business_name", "industry", "business_city"}
+# User columns rendered in cached payloads: business profiles embed their owner, referral
+# snapshots their referrer. updated_at is left out, a save alone doesn't make a payload stale
+USER_PAYLOAD_FIELDS = {
+    "username", "email", "first_name", "last_name", "phone_number", "user_type", "is_email_verified",
+    "is_phone_verified", "profile_picture", "profile_picture_variants", "stripe_account_id",
+}
+
+
+def _touches(update_fields, fields):
+    return update_fields is None or bool(fields & set(update_fields))
+
+
+# ---------------------------
+# SEARCH INDEX
+# ---------------------------
+@receiver(post_save, sender=Deal)
+def refresh_deal_search_vector(sender, instance, update_fields=None, raw=False, **kwargs):
+    if not raw and _touches(update_fields, DEAL_SEARCH_FIELDS):
+        search.refresh_deal(instance)
+
+
+@receiver(post_save, sender=Business)
+def refresh_business_search_vectors(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    # A new business has no deals to index yet
+    if not raw and not created and _touches(update_fields, BUSINESS_SEARCH_FIELDS):
+        search.refresh_business(instance)
+
+
+# ---------------------------
+# API CACHE
+# ---------------------------
+@receiver([post_save, post_delete], sender=Deal)
+def invalidate_deal_cache(sender, instance, **kwargs):
+    invalidate(
+        deal_cache.deal_namespace(instance.id),
+        deal_cache.business_namespace(instance.business_id),
+        deal_cache.CATALOGUE,
+    )
+
+
+@receiver([post_save, post_delete], sender=Business)
+def invalidate_business_cache(sender, instance, **kwargs):
+    # Deal payloads embed their business
+    deal_ids = Deal.objects.filter(business_id=instance.id).values_list("id", flat=True)
+    invalidate(
+        deal_cache.business_namespace(instance.id),
+        deal_cache.CATALOGUE,
+        deal_cache.INDUSTRIES,
+        *[deal_cache.deal_namespace(deal_id) for deal_id in deal_ids],
+    )
+
+
+@receiver(pre_save, sender=User)
+def remember_user_payload_fields(sender, instance, update_fields=None, raw=False, **kwargs):
+    instance._payload_fields_before = None
+    if raw or instance._state.adding:
+        return
+    fields = USER_PAYLOAD_FIELDS if update_fields is None else USER_PAYLOAD_FIELDS & set(update_fields)
+    before = {}
+    # Saves of other columns only (last_login...) cost no query
+    if fields:
+        before = User.objects.filter(pk=instance.pk).values(*fields).first() or {}
+    instance._payload_fields_before = before
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_cache(sender, instance, created, **kwargs):
+    before = getattr(instance, "_payload_fields_before", None)
+    if created or before is None:
+        return
+    if all(getattr(instance, field) == value for field, value in before.items()):
+        return
+    # Referral code snapshots embed the referrer
+    namespaces = [deal_cache.user_namespace(instance.id)]
+    # Business profiles embed their owner
+    if instance.user_type == "business":
+        namespaces += [
+            deal_cache.business_namespace(business_id)
+            for business_id in Business.objects.filter(user=instance).values_list("id", flat=True)
+        ]
+    invalidate(*namespaces)
+
+
+@receiver(post_save, sender=ReferralSubscription)
+def invalidate_subscription_cache(sender, instance, created, **kwargs):
+    # Subscriber counts on the deal and its business; the catalogue's counts catch up when its
+    # entries expire (API_CACHE_TIMEOUT) rather than on every subscription
+    if created:
+        _invalidate_subscription_counts(instance)
+
+
+@receiver(post_delete, sender=ReferralSubscription)
+def invalidate_unsubscription_cache(sender, instance, **kwargs):
+    _invalidate_subscription_counts(instance)
+
+
+def _invalidate_subscription_counts(subscription):
+    business_id = Deal.objects.filter(id=subscription.deal_id).values_list("business_id", flat=True).first()
+    invalidate(
+        deal_cache.deal_namespace(subscription.deal_id),
+        deal_cache.business_namespace(business_id) if business_id else None,
+    )
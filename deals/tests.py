@@ -1,3 +1,421 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from accounts.models import User, Business
+from referrals.models import ReferralClick, ReferralSubscription
+from referrals.resolver import resolve
+from referrals.services.ledger_service import LedgerService
+from .models import Deal, DealDailyStats
+from .services.stats_service import StatsService
+
+
+TEST_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+def create_user(email, phone_number, user_type="customer"):
+    return User.objects.create_user(
+        email=email,
+        username=email,
+        phone_number=phone_number,
+        password="testpass123",
+        user_type=user_type,
+    )
+
+
+def create_business(email, phone_number):
+    user = create_user(email, phone_number, user_type="business")
+    return Business.objects.create(
+        user=user,
+        business_name=f"Business {email}",
+        business_email=email,
+        business_phone=phone_number,
+        website="https://example.com",
+        designation="Owner",
+        registration_no="REG-1",
+        business_address="1 Main St",
+        business_city="Austin",
+        business_state="TX",
+        business_country="US",
+        industry="Retail",
+    )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AllDealsQueryCountTests(APITestCase):
+    url = "/deals/all/"
+
+    def setUp(self):
+        cache.clear()
+        self.referrer = create_user("referrer@example.com", "+15550000001")
+        self.businesses = [
+            create_business("biz1@example.com", "+15550000002"),
+            create_business("biz2@example.com", "+15550000003"),
+        ]
+        self.deal_counter = 0
+
+    def _create_deals(self, count):
+        for _ in range(count):
+            self.deal_counter += 1
+            deal = Deal.objects.create(
+                business=self.businesses[self.deal_counter % 2],
+                deal_name=f"Deal {self.deal_counter}",
+                reward_type="commission",
+                customer_incentive=10,
+            )
+            ReferralSubscription.objects.create(deal=deal, referrer=self.referrer)
+
+    def _count_queries(self, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_is_constant_for_anonymous_users(self):
+        self._create_deals(2)
+        small, _ = self._count_queries()
+
+        self._create_deals(8)
+        large, response = self._count_queries()
+
+        self.assertEqual(small, large)
+        self.assertEqual(len(response.data["results"]), 10)
+
+    def test_query_count_is_constant_with_user_id(self):
+        params = {"user_id": str(self.referrer.id)}
+        self._create_deals(2)
+        small, _ = self._count_queries(params)
+
+        self._create_deals(8)
+        large, response = self._count_queries(params)
+
+        self.assertEqual(small, large)
+        deal = response.data["results"][0]
+        self.assertEqual(deal["subscribers_count"], 1)
+        self.assertEqual(deal["business"]["business_subscribers_count"], 5)
+        self.assertTrue(deal["subscription_info"]["is_subscribed"])
+        self.assertTrue(deal["subscription_info"]["referral_code"])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AllDealsPaginationTests(APITestCase):
+    url = "/deals/all/"
+
+    def setUp(self):
+        cache.clear()
+        business = create_business("biz@example.com", "+15550000010")
+        for i in range(7):
+            Deal.objects.create(
+                business=business,
+                deal_name=f"Running shoes {i}" if i % 2 else f"Coffee beans {i}",
+                reward_type="commission",
+                customer_incentive=5,
+                is_featured=i < 3,
+            )
+
+    def test_keyset_pages_cover_all_deals_once_in_order(self):
+        seen = []
+        url = self.url
+        params = {"page_size": 3}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data["results"]), 3)
+            seen.extend(response.data["results"])
+            url, params = response.data["next"], None
+
+        self.assertEqual(len({deal["id"] for deal in seen}), 7)
+        featured = [deal["is_featured"] for deal in seen]
+        self.assertEqual(featured, sorted(featured, reverse=True))
+
+    def test_page_size_is_capped(self):
+        response = self.client.get(self.url, {"page_size": 10000})
+        self.assertEqual(response.data["page_size"], 100)
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.client.get(self.url, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_popular_sort_orders_by_subscribers(self):
+        deals = list(Deal.objects.order_by("created_at"))
+        for i in range(3):
+            ReferralSubscription.objects.create(
+                deal=deals[4], referrer=create_user(f"fan{i}@example.com", f"+1555001{i:04d}")
+            )
+        ReferralSubscription.objects.create(deal=deals[1], referrer=User.objects.get(email="fan0@example.com"))
+
+        results = self.client.get(self.url, {"sort": "popular"}).data["results"]
+        self.assertEqual([deal["subscribers_count"] for deal in results[:3]], [3, 1, 0])
+        self.assertEqual(results[0]["id"], str(deals[4].id))
+
+    def test_saving_a_stale_deal_keeps_its_subscriber_count(self):
+        deal = Deal.objects.first()
+        ReferralSubscription.objects.create(deal=deal, referrer=create_user("late@example.com", "+15550009999"))
+        deal.deal_name = "Renamed"
+        deal.save()
+        deal.business.save()
+
+        deal.refresh_from_db()
+        self.assertEqual(deal.subscribers_count, 1)
+        self.assertEqual(deal.business.subscribers_count, 1)
+
+    def test_search_matches_word_prefixes(self):
+        response = self.client.get(self.url, {"search": "runn sho"})
+        names = {deal["deal_name"] for deal in response.data["results"]}
+        self.assertEqual(names, {"Running shoes 1", "Running shoes 3", "Running shoes 5"})
+
+    def test_search_matches_business_name(self):
+        response = self.client.get(self.url, {"search": "biz"})
+        self.assertEqual(len(response.data["results"]), 7)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class DealSearchTests(APITestCase):
+    url = "/deals/all/"
+
+    def setUp(self):
+        cache.clear()
+        self.business = create_business("shoes@example.com", "+15550000020")
+        self.business.business_name = "Trail Outfitters"
+        self.business.save()
+        Deal.objects.create(
+            business=self.business,
+            deal_name="Running shoes",
+            deal_description="Lightweight trainers for road running",
+            reward_type="commission",
+            customer_incentive=10,
+        )
+        Deal.objects.create(
+            business=self.business,
+            deal_name="Hiking socks",
+            deal_description="Merino socks, great with running shoes",
+            reward_type="commission",
+            customer_incentive=5,
+        )
+
+    def _search(self, text):
+        response = self.client.get(self.url, {"search": text})
+        self.assertEqual(response.status_code, 200)
+        return response.data["results"]
+
+    def test_results_are_ranked_and_highlighted(self):
+        results = self._search("running shoes")
+        self.assertEqual([deal["deal_name"] for deal in results], ["Running shoes", "Hiking socks"])
+        self.assertGreater(results[0]["search_rank"], results[1]["search_rank"])
+        self.assertEqual(
+            results[0]["highlight"]["deal_name"], "<mark>Running</mark> <mark>shoes</mark>"
+        )
+
+    def test_pages_of_tied_ranks_move_forward(self):
+        for i in range(5):
+            Deal.objects.create(
+                business=self.business, deal_name=f"Trail pack {i}", reward_type="commission", customer_incentive=5,
+            )
+        seen = []
+        url, params = self.url, {"search": "pack", "page_size": 2}
+        while url and len(seen) <= 5:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(deal["id"] for deal in response.data["results"])
+            url, params = response.data["next"], None
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_typos_are_corrected(self):
+        results = self._search("runing")
+        self.assertEqual(len(results), 2)
+
+    def test_vectors_follow_business_updates(self):
+        self.assertEqual(self._search("summit"), [])
+        self.business.business_name = "Summit Gear"
+        self.business.save()
+        self.assertEqual(len(self._search("summit")), 2)
+
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SparseFieldsetTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.business = create_business("sparse@example.com", "+15550000040")
+        for i in range(5):
+            Deal.objects.create(
+                business=self.business, deal_name=f"Deal {i}", reward_type="commission", customer_incentive=5,
+            )
+
+    def test_deal_list_renders_only_the_requested_fields(self):
+        response = self.client.get("/deals/all/", {"fields": "deal_name,business.business_name"})
+        self.assertEqual(response.status_code, 200)
+        deal = response.data["results"][0]
+        self.assertEqual(set(deal), {"id", "deal_name", "business"})
+        self.assertEqual(set(deal["business"]), {"id", "business_name"})
+
+        response = self.client.get("/deals/all/", {"fields": "deal_name,colour"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_business_profile_deals_are_opt_in(self):
+        url = f"/auth/business/{self.business.id}/profile/"
+        response = self.client.get(url)
+        self.assertEqual(response.data["user"]["email"], "sparse@example.com")
+        self.assertNotIn("deals", response.data)
+
+        with self.assertNumQueries(2):  # the business with its user, then its deals
+            response = self.client.get(url, {"expand": "deals"})
+        self.assertEqual(len(response.data["deals"]), 5)
+
+    def test_profile_queries_do_not_grow_with_deals(self):
+        self.client.force_authenticate(self.business.user)
+        response = self.client.get("/auth/profile/")
+        self.assertEqual(response.data["business_profile"]["business_name"], self.business.business_name)
+        self.assertNotIn("deals", response.data["business_profile"])
+
+        with self.assertNumQueries(1):  # all the deals at once (the business is already loaded)
+            response = self.client.get("/auth/profile/", {"expand": "business_profile.deals"})
+        self.assertEqual(len(response.data["business_profile"]["deals"]), 5)
+
+        response = self.client.get("/auth/profile/", {"fields": "email,business_profile.business_name"})
+        self.assertEqual(set(response.data), {"id", "email", "business_profile"})
+        self.assertEqual(set(response.data["business_profile"]), {"id", "business_name"})
+
+@override_settings(CACHES=TEST_CACHES)
+class PublicEndpointCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.referrer = create_user("cached@example.com", "+15550000030")
+        self.business = create_business("cachebiz@example.com", "+15550000031")
+        self.deal = Deal.objects.create(
+            business=self.business,
+            deal_name="Cached deal",
+            reward_type="commission",
+            customer_incentive=10,
+        )
+        self.url = f"/deals/{self.deal.id}/"
+
+    def test_second_read_is_served_from_cache(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data["deal_name"], "Cached deal")
+
+    def test_subscription_invalidates_counts(self):
+        self.assertEqual(self.client.get(self.url).data["subscribers_count"], 0)
+        ReferralSubscription.objects.create(deal=self.deal, referrer=self.referrer)
+        self.assertEqual(self.client.get(self.url).data["subscribers_count"], 1)
+
+    def test_subscription_info_is_per_user(self):
+        ReferralSubscription.objects.create(deal=self.deal, referrer=self.referrer)
+        mine = self.client.get(self.url, {"user_id": str(self.referrer.id)})
+        anonymous = self.client.get(self.url)
+        self.assertTrue(mine.data["subscription_info"]["is_subscribed"])
+        self.assertFalse(anonymous.data["subscription_info"]["is_subscribed"])
+
+    def test_business_update_invalidates_profile_and_deals(self):
+        profile_url = f"/auth/business/{self.business.id}/profile/"
+        self.client.get(profile_url)
+        self.client.get(self.url)
+        self.business.business_name = "Renamed"
+        self.business.save()
+        self.assertEqual(self.client.get(profile_url).data["business_name"], "Renamed")
+        self.assertEqual(self.client.get(self.url).data["business"]["business_name"], "Renamed")
+
+    def test_cache_failure_midway_falls_back_to_database(self):
+        with mock.patch("dealshark.cache.count", side_effect=ConnectionError("cache down")):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["deal_name"], "Cached deal")
+
+    def test_owner_saves_only_invalidate_on_rendered_changes(self):
+        profile_url = f"/auth/business/{self.business.id}/profile/"
+        owner = User.objects.get(pk=self.business.user_id)
+        self.client.get(profile_url)
+
+        owner.save(update_fields=["last_login"])
+        owner.save()
+        with self.assertNumQueries(0):
+            self.client.get(profile_url)
+
+        owner.phone_number = "+15550000039"
+        owner.save()
+        self.assertEqual(self.client.get(profile_url).data["user"]["phone_number"], "+15550000039")
+
+    def test_subscription_updates_keep_the_catalogue_cached(self):
+        self.client.get("/deals/all/")
+        subscription = ReferralSubscription.objects.create(deal=self.deal, referrer=self.referrer)
+        subscription.save()
+        with self.assertNumQueries(0):
+            self.client.get("/deals/all/")
+
+
+@override_settings(CACHES=TEST_CACHES)
+class DealStatsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.business = create_business("stats@example.com", "+15550000040")
+        self.deal = Deal.objects.create(
+            business=self.business, deal_name="Tracked", reward_type="commission", customer_incentive=10
+        )
+        self.url = f"/deals/{self.deal.id}/stats/"
+
+    def event(self, metric, value=1, day=date(2026, 3, 1)):
+        return {"deal_id": str(self.deal.id), "metric": metric, "value": value, "date": day.isoformat()}
+
+    def test_events_are_rolled_up_per_day(self):
+        StatsService.apply([self.event("clicks"), self.event("clicks"), self.event("bogus")])
+        StatsService.apply([
+            self.event("conversions"), self.event("revenue", 9000), self.event("clicks", day=date(2026, 3, 3)),
+        ])
+
+        self.client.force_authenticate(self.business.user)
+        response = self.client.get(self.url, {"from": "2026-03-01", "to": "2026-03-04"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["days"]), 4)
+        self.assertEqual(response.data["days"][0]["clicks"], 2)
+        self.assertEqual(response.data["days"][1]["clicks"], 0)
+        self.assertEqual(response.data["totals"]["clicks"], 3)
+        self.assertEqual(response.data["totals"]["revenue"], Decimal("90.00"))
+
+    def test_stats_are_private_to_the_business(self):
+        other = create_business("other@example.com", "+15550000041")
+        self.client.force_authenticate(other.user)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+        self.client.force_authenticate(self.business.user)
+        self.assertEqual(len(self.client.get(self.url).data["days"]), 30)
+        self.assertEqual(self.client.get(self.url, {"from": "2026-02-30"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"from": "2020-01-01", "to": "2026-01-01"}).status_code, 400)
+
+    @mock.patch("deals.utils.record_deal_events.delay")
+    def test_subscriptions_are_tracked_on_commit(self, delay):
+        referrer = create_user("tracked@example.com", "+15550000042")
+        with self.captureOnCommitCallbacks(execute=True):
+            ReferralSubscription.objects.create(deal=self.deal, referrer=referrer)
+        [events] = delay.call_args.args
+        self.assertEqual([(e["metric"], e["value"]) for e in events], [("subscriptions", 1)])
+
+    def test_backfill_rebuilds_from_history(self):
+        referrer = create_user("history@example.com", "+15550000043")
+        sub = ReferralSubscription.objects.create(deal=self.deal, referrer=referrer)
+        LedgerService.record_payment("evt_history", resolve(sub.referral_code), 5000, (4500, 500))
+        today = sub.created_at.date()
+        ReferralClick.objects.create(
+            referral_code=sub.referral_code, deal=self.deal, clicked_at=sub.created_at, visitor_hash="v", ua_hash="u"
+        )
+        DealDailyStats.objects.create(deal=self.deal, date=today, clicks=7, subscriptions=99, checkouts=3)
+
+        call_command(
+            "backfill_deal_stats", "--from", str(today - timedelta(days=3)), "--chunk-days", "2",
+            stdout=mock.MagicMock(),
+        )
+        stats = DealDailyStats.objects.get(deal=self.deal, date=today)
+        self.assertEqual(
+            (stats.clicks, stats.subscriptions, stats.checkouts, stats.conversions, stats.revenue),
+            (1, 1, 3, 1, 4500),
+        )
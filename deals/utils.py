@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from deals.services.stats_service import StatsService
+
+
+@shared_task
+def record_deal_events(events):
+    """Add tracked deal events to the DealDailyStats rollups"""
+    return StatsService.apply(events)
@@ -1,9 +1,21 @@
-from django.db.models import Q
+from datetime import timedelta
+from urllib.parse import urlencode
+from uuid import UUID
+
+from django.http import Http404
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework.decorators import action
 
+from accounts.authentication import request_business_id
 from accounts.models import Business
+from dealshark.cache import read_through
+from dealshark.serializers import fieldset_cache_key, optimize_queryset, sparse_fieldset
+from deals import cache as deal_cache
 from deals.models import Deal
-from deals.serializers import DealSerializer
+from deals.pagination import DealKeysetPagination
+from deals.search import search_deals
+from deals.serializers import DealSerializer, DealSearchResultSerializer
 
 
 from rest_framework import viewsets
@@ -11,6 +23,18 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 
 from deals.services.deal_service import DealService
+from deals.services.stats_service import MAX_RANGE_DAYS, StatsService
+
+
+def _query_date(request, name):
+    """Date query parameter, None if absent; ValueError if malformed"""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    date = parse_date(value)
+    if date is None:
+        raise ValueError(value)
+    return date
 
 
 class DealViewSet(viewsets.ModelViewSet):
@@ -53,62 +77,147 @@ class DealViewSet(viewsets.ModelViewSet):
     def retrieve(self, request, *args, **kwargs):
         """Get a single deal by ID (public, with optional user_id)"""
         user_id = request.query_params.get("user_id")
-        instance = self.get_object()
-        serializer = self.get_serializer(
-            instance, context={"request": request, "user_id": user_id}
+        try:
+            deal_id = str(UUID(kwargs["pk"]))
+        except ValueError:
+            raise Http404
+        selection = sparse_fieldset(request)
+        deals = optimize_queryset(Deal.objects.all(), DealSerializer(**selection))
+
+        def build():
+            instance = deals.filter(pk=deal_id).first()
+            if instance is None:
+                raise Http404
+            return DealSerializer(
+                instance, context=DealService.get_serializer_context([instance]), **selection
+            ).data
+
+        data = read_through(
+            deal_cache.DEAL_DETAIL, fieldset_cache_key(deal_id, request), build,
+            namespaces=[deal_cache.deal_namespace(deal_id)],
         )
-        return Response(serializer.data)
+        return Response(DealService.apply_subscription_info([data], request, user_id)[0])
 
     @action(detail=False, methods=["get"], url_path="my")
     def my_deals(self, request):
         """Deals belonging to logged-in business"""
-        business = getattr(request.user, "business_profile", None)
-        if not business:
+        business_id = request_business_id(request)
+        if not business_id:
             return Response({"error": "Only businesses can view their deals."}, status=403)
 
-        deals = Deal.objects.filter(business=business)
-        serializer = DealSerializer(deals, many=True)
+        selection = sparse_fieldset(request)
+        deals = list(optimize_queryset(Deal.objects.filter(business_id=business_id), DealSerializer(**selection)))
+        serializer = DealSerializer(
+            deals, many=True, context=DealService.get_serializer_context(deals, request), **selection
+        )
         return Response(serializer.data)
 
     @action(detail=False, methods=["get"], url_path="all")
     def all_deals(self, request):
-        """All deals across all businesses (for referrers)"""
+        """
+        All deals across all businesses (for referrers).
+        Keyset-paginated: follow `next`, optionally pass `page_size` (max 100).
+        `sort=popular` orders by subscriber count (ignored when searching).
+        `fields` picks the fields returned, e.g. `fields=id,deal_name,business.business_name`.
+        """
         user_id = request.query_params.get("user_id")
         search_query = request.query_params.get("search").strip() if request.query_params.get("search") else None
         reward_type = request.query_params.get("filter", "").strip().lower()
         industry = request.query_params.get("industry", "").strip()
-
-        deals = Deal.objects.all()
+        sort = request.query_params.get("sort", "").strip().lower()
+
+        selection = sparse_fieldset(request)
+        serializer_class = DealSearchResultSerializer if search_query else DealSerializer
+        deals = optimize_queryset(Deal.objects.all(), serializer_class(**selection))
+        paginator = DealKeysetPagination()
+        if sort == "popular":
+            paginator = DealKeysetPagination(ordering=("-subscribers_count", "-id"))
         if search_query:
-            deals = deals.filter(
-                Q(deal_name__icontains=search_query) |
-                Q(deal_description__icontains=search_query) |
-                Q(business__business_name__icontains=search_query)
-            )
+            # Ranked full-text results, best matches first
+            deals = search_deals(deals, search_query)
+            paginator = DealKeysetPagination(ordering=("-rank", "-id"))
         if reward_type in ["commission", "no_reward"]:
             deals = deals.filter(reward_type=reward_type)
 
         if industry:
             deals = deals.filter(business__industry__icontains=industry)
-        serializer = DealSerializer(
-            deals,
-            many=True,
-            context={"request": request, "user_id": user_id}
+
+        def build():
+            page = paginator.paginate_queryset(deals, request, view=self)
+            serializer = serializer_class(
+                page,
+                many=True,
+                context=DealService.get_serializer_context(page),
+                **selection
+            )
+            return {"results": serializer.data, "next_cursor": paginator.next_cursor}
+
+        # Everything except user_id shapes the shared page
+        cache_key = urlencode(sorted(
+            (name, value) for name, value in request.query_params.items() if name != "user_id"
+        ))
+        cached = read_through(
+            deal_cache.DEAL_CATALOGUE, cache_key, build, namespaces=[deal_cache.CATALOGUE]
         )
-        return Response(serializer.data)
+        paginator.resume(request, cached["next_cursor"])
+        return paginator.get_paginated_response(
+            DealService.apply_subscription_info(cached["results"], request, user_id)
+        )
+
+    @action(detail=True, methods=["get"], url_path="stats")
+    def stats(self, request, pk=None):
+        """
+        Daily clicks, subscriptions, checkouts, conversions and revenue for
+        one of the business's deals, from the DealDailyStats rollups.
+        `from`/`to` are inclusive dates (YYYY-MM-DD), default the last 30 days.
+        """
+        business_id = request_business_id(request)
+        if not business_id:
+            return Response({"error": "Only businesses can view deal stats."}, status=403)
+        try:
+            deal = Deal.objects.get(id=UUID(pk), business_id=business_id)
+        except (ValueError, Deal.DoesNotExist):
+            return Response({"error": "Deal not found."}, status=404)
+
+        try:
+            end = _query_date(request, "to") or timezone.localdate()
+            start = _query_date(request, "from") or end - timedelta(days=29)
+        except ValueError:
+            return Response({"error": "Dates must be formatted as YYYY-MM-DD."}, status=400)
+        if start > end:
+            return Response({"error": "`from` must not be after `to`."}, status=400)
+        if (end - start).days >= MAX_RANGE_DAYS:
+            return Response({"error": f"Date range is limited to {MAX_RANGE_DAYS} days."}, status=400)
+
+        return Response(StatsService.daily(deal, start, end))
 
     @action(detail=True, methods=["get"], url_path="by-business")
     def by_business(self, request, pk=None):
         """Public: Get all deals for a specific business by its ID"""
         try:
-            business = Business.objects.get(id=pk)
-        except Business.DoesNotExist:
+            business_id = int(pk)
+        except ValueError:
+            return Response({"error": "Business not found."}, status=404)
+        selection = sparse_fieldset(request)
+        business_deals = optimize_queryset(Deal.objects.filter(business_id=business_id), DealSerializer(**selection))
+
+        def build():
+            if not Business.objects.filter(id=business_id).exists():
+                return None
+            deals = list(business_deals)
+            return DealSerializer(
+                deals, many=True, context=DealService.get_serializer_context(deals), **selection
+            ).data
+
+        deals = read_through(
+            deal_cache.BUSINESS_DEALS, fieldset_cache_key(business_id, request), build,
+            namespaces=[deal_cache.business_namespace(business_id)],
+        )
+        if deals is None:
             return Response({"error": "Business not found."}, status=404)
 
-        deals = Deal.objects.filter(business=business)
-        serializer = DealSerializer(deals, many=True)
         return Response({
-            "deals": serializer.data
+            "deals": DealService.apply_subscription_info(deals, request)
         })
 
 
@@ -145,13 +254,17 @@ class IndustryViewSet(viewsets.ViewSet):
         Public: Return all unique industries from registered businesses.
         Example: GET /industries/all
         """
-        industries = (
-            Business.objects
-            .exclude(industry__isnull=True)
-            .exclude(industry__exact="")
-            .values_list("industry", flat=True)
-            .distinct()
-            .order_by("industry")
-        )
+        def build():
+            return list(
+                Business.objects
+                .exclude(industry__isnull=True)
+                .exclude(industry__exact="")
+                .values_list("industry", flat=True)
+                .distinct()
+                .order_by("industry")
+            )
 
-        return Response({"industries": list(industries)}, status=200)
+        industries = read_through(
+            deal_cache.INDUSTRY_LIST, "all", build, namespaces=[deal_cache.INDUSTRIES]
+        )
+        return Response({"industries": industries}, status=200)
@@ -0,0 +1,93 @@
+"""
+Async views for endpoints that spend most of their time waiting on Stripe
+or Firebase. Served by uvicorn (dealshark.asgi), a request waiting on the
+network holds a coroutine instead of a whole worker; under gunicorn/WSGI
+the same views still work, Django running each one in its own event loop.
+
+The Stripe and Firebase SDKs are blocking, so their calls go through
+run_blocking(), a thread pool bounded by BLOCKING_IO_MAX_WORKERS: a slow
+upstream queues calls instead of piling up threads. Password hashing is
+CPU bound and has a pool of its own, run_hashing(), bounded by
+PASSWORD_HASHING_MAX_WORKERS (hashlib and argon2 release the GIL, so the
+threads hash in parallel): a burst of logins waits for a core instead of
+stalling the event loop. Database access in the views uses the async ORM,
+or sync_to_async for the sync services.
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.views import APIView
+
+# Pool name -> setting bounding its threads
+POOLS = {
+    "blocking-io": "BLOCKING_IO_MAX_WORKERS",
+    "password-hashing": "PASSWORD_HASHING_MAX_WORKERS",
+}
+_executors = {}
+
+
+def get_executor(pool="blocking-io"):
+    if pool not in _executors:
+        _executors[pool] = ThreadPoolExecutor(
+            max_workers=getattr(settings, POOLS[pool]), thread_name_prefix=pool
+        )
+    return _executors[pool]
+
+
+async def _run_in(pool, func, *args, **kwargs):
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(get_executor(pool), call)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking (network) call in the shared pool; it must not touch the database"""
+    return await _run_in("blocking-io", func, *args, **kwargs)
+
+
+async def run_hashing(func, *args, **kwargs):
+    """Run a password hashing call in the hashing pool; it must not touch the database"""
+    return await _run_in("password-hashing", func, *args, **kwargs)
+
+
+class AsyncAPIView(APIView):
+    """
+    APIView whose handlers (get, post...) are coroutines. Authentication,
+    permissions and throttling keep using the regular DRF classes; they may
+    hit the database, so they run through sync_to_async.
+
+    A user authenticated from its token claims (accounts.authentication)
+    loads its other columns on first access, a query the handler could not
+    run on the event loop: the row is loaded here, with the authentication.
+    """
+
+    def _initial(self, request, *args, **kwargs):
+        self.initial(request, *args, **kwargs)
+        deferred = request.user.get_deferred_fields() if hasattr(request.user, "get_deferred_fields") else None
+        if deferred:
+            request.user.refresh_from_db(fields=list(deferred))
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self._initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
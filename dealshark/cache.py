@@ -0,0 +1,170 @@
+"""
+Read-through cache for shared (non per-user) API payloads.
+
+Every cached payload is filed under one or more *namespaces* (e.g. a deal,
+a business, the deal catalogue). Each namespace has a version token stored
+in the cache and the token is part of the payload key, so invalidating a
+namespace is a single write that orphans every key built from it; orphaned
+keys simply expire.
+
+Stampedes are avoided in two ways:
+  * entries carry a soft expiry; past it, one worker rebuilds (under a
+    short lock) while the others keep serving the stale copy until the
+    hard expiry;
+  * on a cold miss only the lock holder builds, the others wait briefly
+    for its result.
+
+Hits, stale hits and misses are counted per cache name (see get_stats()).
+If the cache backend is unreachable, payloads are built straight from the
+database instead of failing the request.
+"""
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = getattr(settings, "API_CACHE_TIMEOUT", 300)
+STALE_GRACE = getattr(settings, "API_CACHE_STALE_GRACE", 60)
+LOCK_TIMEOUT = getattr(settings, "API_CACHE_LOCK_TIMEOUT", 10)
+LOCK_WAIT = getattr(settings, "API_CACHE_LOCK_WAIT", 2.0)
+LOCK_POLL_INTERVAL = 0.05
+# Outlives any payload; an expired token only orphans payloads, which is safe
+VERSION_TIMEOUT = 7 * 24 * 60 * 60
+
+KEY_PREFIX = "rt"
+STAT_KINDS = ("hit", "stale", "miss")
+
+
+def _version_key(namespace):
+    return f"{KEY_PREFIX}:ns:{namespace}"
+
+
+def _stat_key(name, kind):
+    return f"{KEY_PREFIX}:stats:{name}:{kind}"
+
+
+def namespace_versions(namespaces):
+    """Current version token of each namespace, in order"""
+    keys = [_version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    if missing:
+        for key, token in missing.items():
+            # add() so concurrent first readers agree on a single token
+            cache.add(key, token, VERSION_TIMEOUT)
+        versions.update(cache.get_many(list(missing)))
+    return [versions.get(key, "0") for key in keys]
+
+
+def count(name, kind):
+    """Bump the `kind` ("hit", "stale" or "miss") counter of cache `name`"""
+    key = _stat_key(name, kind)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+class _BuilderError(Exception):
+    """Wraps an exception raised by a builder, so it is not mistaken for a cache failure"""
+
+
+def read_through(name, key, builder, namespaces=(), timeout=DEFAULT_TIMEOUT):
+    """
+    Return the cached payload for (`name`, `key`), building it with
+    `builder()` on a miss. `namespaces` are the invalidation scopes the
+    payload depends on. `builder` must return picklable, shared data.
+    """
+    built = []
+
+    def build():
+        try:
+            built.append(builder())
+        except Exception as e:
+            raise _BuilderError() from e
+        return built[-1]
+
+    try:
+        return _read_through(name, key, build, namespaces, timeout)
+    except _BuilderError as e:
+        raise e.__cause__
+    except Exception as e:
+        logger.warning(f"Cache unavailable for {name}, serving from database: {str(e)}")
+        # The payload may already be built, only storing it failed
+        return built[-1] if built else builder()
+
+
+def _read_through(name, key, builder, namespaces, timeout):
+    versions = namespace_versions(namespaces)
+    cache_key = ":".join([KEY_PREFIX, name, str(key), *versions])
+    lock_key = f"{cache_key}:lock"
+    envelope = cache.get(cache_key)
+
+    if envelope is not None:
+        soft_expiry, value = envelope
+        if time.time() < soft_expiry:
+            count(name, "hit")
+            return value
+        count(name, "stale")
+        if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+            # Someone else is refreshing, keep serving the stale copy
+            return value
+        return _rebuild(cache_key, lock_key, builder, timeout)
+
+    count(name, "miss")
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        return _rebuild(cache_key, lock_key, builder, timeout)
+
+    # Another worker is building this key: wait for it rather than piling on
+    deadline = time.time() + LOCK_WAIT
+    while time.time() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        envelope = cache.get(cache_key)
+        if envelope is not None:
+            return envelope[1]
+    return builder()
+
+
+def _rebuild(cache_key, lock_key, builder, timeout):
+    try:
+        value = builder()
+        cache.set(cache_key, (time.time() + timeout, value), timeout + STALE_GRACE)
+        return value
+    finally:
+        cache.delete(lock_key)
+
+
+def _bump(namespaces):
+    try:
+        cache.set_many({_version_key(namespace): uuid.uuid4().hex for namespace in namespaces}, VERSION_TIMEOUT)
+    except Exception as e:
+        logger.error(f"Failed to invalidate cache namespaces {namespaces}: {str(e)}")
+
+
+def invalidate(*namespaces):
+    """
+    Invalidate every payload filed under `namespaces`. Bumps immediately and
+    again once the current transaction commits, so a concurrent reader cannot
+    re-cache data read before the commit.
+    """
+    namespaces = [namespace for namespace in namespaces if namespace]
+    if not namespaces:
+        return
+    _bump(namespaces)
+    transaction.on_commit(lambda: _bump(namespaces))
+
+
+def get_stats(names):
+    """{name: {"hit": n, "stale": n, "miss": n}} for the given cache names"""
+    keys = {(name, kind): _stat_key(name, kind) for name in names for kind in STAT_KINDS}
+    values = cache.get_many(list(keys.values()))
+    stats = {}
+    for (name, kind), key in keys.items():
+        stats.setdefault(name, {})[kind] = values.get(key, 0)
+    return stats
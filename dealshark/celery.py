@@ -0,0 +1,10 @@
+import os
+
+from celery import Celery
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "dealshark.settings")
+
+app = Celery("dealshark")
+app.config_from_object("django.conf:settings", namespace="CELERY")
+# Tasks live next to the helpers that use them (<app>/utils.py)
+app.autodiscover_tasks(related_name="utils")
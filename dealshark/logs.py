@@ -0,0 +1,156 @@
+"""
+Structured, non-blocking logging.
+
+JSONFormatter renders a record as one JSON object per line: time, level,
+logger and message, the fields passed with `extra=`, the id of the request
+being served (so every line a view logs can be joined with its request
+line) and, for exceptions, the type, message and full traceback.
+
+QueueLogHandler formats a record in the thread that logs it, then only
+puts it on a bounded in-memory queue; a QueueListener thread does the
+actual write. A slow or blocked stdout never holds up a request, and when
+the queue is full records are dropped (and counted) rather than waited on.
+
+RequestLog is what RequestLogMiddleware fills in for the request being
+served: the request id, and the queries the request ran, counted by a
+wrapper installed on every database connection.
+"""
+import json
+import logging
+import os
+import queue
+import time
+import traceback
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# Attributes every LogRecord has; anything else on a record came from `extra=`
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_current = ContextVar("request_log", default=None)
+
+
+class RequestLog:
+    """Per request state, shared with the threads and tasks serving the request"""
+
+    def __init__(self, request_id=None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_ms = 0.0
+        self.exc_info = None
+
+    def activate(self):
+        return _current.set(self)
+
+    @staticmethod
+    def deactivate(token):
+        _current.reset(token)
+
+    @staticmethod
+    def current():
+        return _current.get()
+
+    @property
+    def duration_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+
+def _count_query(execute, sql, params, many, context):
+    entry = _current.get()
+    if entry is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        entry.db_queries += 1
+        entry.db_ms += (time.perf_counter() - started) * 1000
+
+
+def _install_query_counter(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+def install_query_counter():
+    """Count the queries of every connection of this thread, and of every new one"""
+    connection_created.connect(_install_query_counter, dispatch_uid="dealshark.logs.query_counter")
+    for connection in connections.all(initialized_only=True):
+        _install_query_counter(connection)
+
+
+def format_exception(exc_info):
+    exc_type, exc, tb = exc_info
+    return {
+        "type": f"{exc_type.__module__}.{exc_type.__qualname__}",
+        "message": str(exc),
+        "traceback": "".join(traceback.format_exception(exc_type, exc, tb)),
+    }
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(
+            (key, value) for key, value in vars(record).items()
+            if key not in RECORD_ATTRIBUTES and not key.startswith("_")
+        )
+        current = _current.get()
+        if current is not None:
+            entry.setdefault("request_id", current.request_id)
+        if record.exc_info:
+            entry["exception"] = format_exception(record.exc_info)
+        elif record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, default=str)
+
+
+class QueueLogHandler(QueueHandler):
+    """
+    Writes formatted records to `stream` from a background thread. The
+    thread is restarted in forked children (gunicorn --preload), which
+    would otherwise inherit a queue nobody reads.
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        self.maxsize = maxsize
+        self.target = logging.StreamHandler(stream)
+        self.dropped = 0
+        super().__init__(queue.Queue(maxsize))
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        os.register_at_fork(after_in_child=self._restart)
+
+    def _restart(self):
+        self.queue = queue.Queue(self.maxsize)
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def enqueue(self, record):
+        try:
+            if self.dropped:
+                self.queue.put_nowait(self.prepare(logging.makeLogRecord({
+                    "name": __name__, "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": f"Log queue full, {self.dropped} record(s) dropped",
+                })))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        # Flushes what is queued; logging.shutdown() calls this at exit
+        if self.listener._thread is not None:
+            self.listener.stop()
+        super().close()
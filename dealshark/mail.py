@@ -0,0 +1,71 @@
+"""
+Outgoing mail for Celery workers.
+
+Each worker process keeps one mail connection open and reuses it across
+tasks instead of doing an SMTP handshake (and TLS negotiation) per email.
+Web processes never send mail themselves: they queue the Celery tasks in
+accounts.services.mail_service once their transaction commits.
+"""
+import logging
+import smtplib
+
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+from django.core import mail
+
+logger = logging.getLogger(__name__)
+
+# Retry policy for the mail tasks
+MAX_RETRIES = 3
+RETRY_BACKOFF = 60  # seconds, doubled on every retry
+
+_connection = None
+_connection_backend = None
+
+
+def get_connection():
+    """This process's mail connection, created on first use"""
+    global _connection, _connection_backend
+    if _connection is None or _connection_backend != settings.EMAIL_BACKEND:
+        close_connection()
+        _connection = mail.get_connection(fail_silently=False)
+        _connection_backend = settings.EMAIL_BACKEND
+    return _connection
+
+
+def close_connection():
+    global _connection, _connection_backend
+    if _connection is not None:
+        try:
+            _connection.close()
+        except Exception as e:
+            logger.warning(f"Failed to close mail connection: {str(e)}")
+    _connection = None
+    _connection_backend = None
+
+
+def deliver(send):
+    """
+    Call `send(connection)` with the pooled connection, e.g.
+    ``deliver(lambda connection: connection.send_messages(messages))``.
+    A connection the server dropped while idle is reopened once.
+    """
+    connection = get_connection()
+    try:
+        connection.open()
+        return send(connection)
+    except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+        logger.info(f"Mail connection dropped, reconnecting: {str(e)}")
+        close_connection()
+        connection = get_connection()
+        connection.open()
+        return send(connection)
+
+
+def retry_countdown(retries):
+    return RETRY_BACKOFF * (2 ** retries)
+
+
+@worker_process_shutdown.connect
+def _close_on_shutdown(**kwargs):
+    close_connection()
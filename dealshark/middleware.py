@@ -1,26 +1,195 @@
 import logging
+import math
+import random
+import re
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject, empty
 from django.http import JsonResponse
+from whitenoise.middleware import WhiteNoiseMiddleware
 
-logger = logging.getLogger(__name__)
+from dealshark.logs import RequestLog, install_query_counter
+from dealshark.ratelimit import RateLimiter
 
-class APILoggingMiddleware(MiddlewareMixin):
-    def process_request(self, request):
-        if request.path.startswith('/api/'):
-            logger.info(f"API Request: {request.method} {request.path} from {request.META.get('REMOTE_ADDR')}")
+request_logger = logging.getLogger("dealshark.requests")
 
-    def process_response(self, request, response):
-        if request.path.startswith('/api/'):
-            logger.info(f"API Response: {response.status_code} for {request.method} {request.path}")
-        return response
+# Client supplied request ids are kept if they look like one
+REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+class RequestLogMiddleware:
+    """
+    One JSON line per request on the "dealshark.requests" logger: method,
+    route template, status, duration, queries and their time, user id and
+    request id (also returned as X-Request-ID). Server errors, exceptions
+    (with their traceback) and requests slower than REQUEST_LOG_SLOW_MS
+    are always logged, other requests at REQUEST_LOG_SAMPLE_RATE. Streamed
+    responses are logged once the body has been sent.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        install_query_counter()
 
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        entry = self.start(request)
+        token = entry.activate()
+        try:
+            response = self.get_response(request)
+        finally:
+            RequestLog.deactivate(token)
+        return self.finish(request, response, entry)
+
+    async def __acall__(self, request):
+        entry = self.start(request)
+        token = entry.activate()
+        try:
+            response = await self.get_response(request)
+        finally:
+            RequestLog.deactivate(token)
+        return self.finish(request, response, entry)
 
-class ErrorHandlingMiddleware(MiddlewareMixin):
     def process_exception(self, request, exception):
-        if request.path.startswith('/api/'):
-            logger.error(f"API Exception: {str(exception)} for {request.method} {request.path}")
-            return JsonResponse({
-                'error': 'An internal server error occurred.',
-                'message': 'Please try again later.'
-            }, status=500)
+        entry = RequestLog.current()
+        if entry is not None:
+            entry.exc_info = (type(exception), exception, exception.__traceback__)
+        return None
+
+    @staticmethod
+    def start(request):
+        request_id = request.headers.get("X-Request-ID", "")
+        return RequestLog(request_id if REQUEST_ID_RE.match(request_id) else None)
+
+    def finish(self, request, response, entry):
+        response["X-Request-ID"] = entry.request_id
+        if not response.streaming:
+            self.log(request, response, entry)
+        elif response.is_async:
+            response.streaming_content = self.astream(request, response, entry, response.streaming_content)
+        else:
+            response.streaming_content = self.stream(request, response, entry, response.streaming_content)
+        return response
+
+    def stream(self, request, response, entry, content):
+        # Queries run while the body is produced, make them count for this request
+        iterator = iter(content)
+        try:
+            while True:
+                token = entry.activate()
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    RequestLog.deactivate(token)
+                yield chunk
+        finally:
+            self.log(request, response, entry)
+
+    async def astream(self, request, response, entry, content):
+        iterator = content.__aiter__()
+        try:
+            while True:
+                token = entry.activate()
+                try:
+                    chunk = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    RequestLog.deactivate(token)
+                yield chunk
+        finally:
+            self.log(request, response, entry)
+
+    @staticmethod
+    def log(request, response, entry):
+        duration_ms = entry.duration_ms
+        always = response.status_code >= 500 or entry.exc_info or duration_ms >= settings.REQUEST_LOG_SLOW_MS
+        if not always and random.random() >= settings.REQUEST_LOG_SAMPLE_RATE:
+            return
+
+        match = request.resolver_match
+        fields = {
+            "request_id": entry.request_id,
+            "method": request.method,
+            "route": f"/{match.route}".rstrip("$") if match else None,
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            "duration_ms": round(duration_ms, 2),
+            "db_queries": entry.db_queries,
+            "db_ms": round(entry.db_ms, 2),
+            "user_id": _user_id(request),
+            "sample_rate": 1.0 if always else settings.REQUEST_LOG_SAMPLE_RATE,
+        }
+        level = logging.ERROR if entry.exc_info or response.status_code >= 500 else logging.INFO
+        request_logger.log(
+            level, f"{request.method} {request.path} {response.status_code}",
+            exc_info=entry.exc_info, extra=fields,
+        )
+
+
+def _user_id(request):
+    """Id of the authenticated user, without evaluating a session user nobody looked at"""
+    user = request.__dict__.get("user")
+    if isinstance(user, SimpleLazyObject):
+        if user._wrapped is empty:
+            return None
+        user = user._wrapped
+    if user is None or not user.is_authenticated:
         return None
+    return str(user.pk)
+
+
+class RateLimitMiddleware(MiddlewareMixin):
+    """
+    Enforces settings.RATE_LIMITS on the views named there by URL name, before
+    the view (and CSRF checks, authentication, any query) runs. Rules keyed by
+    user need the authenticated user and are left to RateLimitThrottle.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        if url_name not in settings.RATE_LIMITS:
+            return None
+
+        wait = RateLimiter().check(url_name, request, keys=("ip", "email", "code"))
+        if not wait:
+            return None
+        response = JsonResponse({"error": "Too many requests. Please try again later."}, status=429)
+        response["Retry-After"] = str(math.ceil(wait))
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise, usable by both handlers. The stock middleware is sync only,
+    which under ASGI makes Django run every request (async views included)
+    through a thread; here only static file hits go to a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
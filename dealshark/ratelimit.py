@@ -0,0 +1,177 @@
+"""
+Rate limits for the login, OTP and public referral endpoints, enforced in
+Redis with GCRA (generic cell rate algorithm): per rule and identity one
+key holds the "theoretical arrival time" of the next request, so a limit
+of N per period allows bursts of up to N and then one request every
+period / N, with no per-request bookkeeping to expire.
+
+settings.RATE_LIMITS maps a scope to its rules, (key, "count/period"),
+e.g. ("email", "10/15m"). Keys identify who is counted:
+  * ip: the client address (honouring REST_FRAMEWORK NUM_PROXIES);
+  * email: the `email` field of the request body;
+  * code: the referral code in the body (`referral_code`) or query (`code`);
+  * user: the authenticated user (RateLimitThrottle only).
+A rule whose identity is missing from the request does not apply. All
+rules of a scope are checked and consumed in one Lua script: a request
+rejected by one rule does not use up the others.
+
+Scopes are applied by RateLimitMiddleware to the view with that URL name,
+before the view runs (an over-limit request costs one Redis round trip
+and no query), and by RateLimitThrottle to DRF views naming the scope in
+`throttle_scope`. If Redis is unreachable requests are let through.
+"""
+import hashlib
+import json
+import logging
+import re
+import time
+
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+RATE_RE = re.compile(r"^(\d+)/(\d*)([smhd])$")
+
+# KEYS: one per rule; ARGV: emission interval and period (ms) of each rule.
+# Returns 0 and records the request if every rule allows it, else the ms to wait.
+GCRA_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local wait = 0
+local arrivals = {}
+for i, key in ipairs(KEYS) do
+    local tat = math.max(tonumber(redis.call('GET', key) or now), now)
+    arrivals[i] = tat + tonumber(ARGV[2 * i - 1])
+    wait = math.max(wait, arrivals[i] - tonumber(ARGV[2 * i]) - now)
+end
+if wait > 0 then
+    return math.ceil(wait)
+end
+for i, key in ipairs(KEYS) do
+    redis.call('SET', key, arrivals[i], 'PX', math.ceil(arrivals[i] - now))
+end
+return 0
+"""
+
+
+def parse_rate(rate):
+    """"10/15m" -> (10, 900): count per period in seconds"""
+    match = RATE_RE.match(rate)
+    if not match:
+        raise ValueError(f"Invalid rate {rate}, expected e.g. 10/m or 5/15m")
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * PERIODS[unit]
+
+
+def _payload(request):
+    """Parsed body of a DRF or plain Django request, {} if it can't be read"""
+    if hasattr(request, "data"):
+        return request.data
+    if not hasattr(request, "_ratelimit_payload"):
+        try:
+            if request.content_type == "application/json":
+                request._ratelimit_payload = json.loads(request.body or b"{}")
+            else:
+                request._ratelimit_payload = request.POST
+        except Exception:
+            request._ratelimit_payload = {}
+        if not hasattr(request._ratelimit_payload, "get"):
+            request._ratelimit_payload = {}
+    return request._ratelimit_payload
+
+
+def _query(request, name):
+    params = request.query_params if hasattr(request, "query_params") else request.GET
+    return params.get(name)
+
+
+def _user(request):
+    user = getattr(request, "user", None)
+    return str(user.pk) if user is not None and user.is_authenticated else None
+
+
+def _email(request):
+    email = _payload(request).get("email")
+    return email.strip().lower() if isinstance(email, str) else None
+
+
+def _code(request):
+    code = _payload(request).get("referral_code") or _query(request, "code")
+    return code.strip().upper() if isinstance(code, str) else None
+
+
+IDENTITIES = {
+    "ip": lambda request: BaseThrottle().get_ident(request),
+    "user": _user,
+    "email": _email,
+    "code": _code,
+}
+
+
+class RateLimiter:
+    # Seconds to stop calling Redis after it failed, so an outage costs one timeout, not one per request
+    BACKOFF = 5
+    _unavailable_until = 0.0
+    _script = None
+
+    def _redis(self):
+        from django_redis import get_redis_connection
+
+        return get_redis_connection("default")
+
+    def _run_script(self, keys, args):
+        client = self._redis()
+        if RateLimiter._script is None:
+            # Once per process: the Script only holds the SHA, and loads itself on a server missing it
+            RateLimiter._script = client.register_script(GCRA_SCRIPT)
+        return RateLimiter._script(keys=keys, args=args, client=client)
+
+    def check(self, scope, request, keys=None):
+        """
+        Count `request` against the rules of `scope` (only those keyed by
+        `keys`, if given). Returns 0 if allowed, else seconds to wait.
+        """
+        rules = [
+            (key, rate) for key, rate in settings.RATE_LIMITS.get(scope, ())
+            if keys is None or key in keys
+        ]
+        redis_keys, args = [], []
+        for key, rate in rules:
+            identity = IDENTITIES[key](request)
+            if not identity:
+                continue
+            count, period = parse_rate(rate)
+            digest = hashlib.blake2b(identity.encode(), digest_size=12).hexdigest()
+            # Braces keep a scope's keys in one Redis Cluster slot, for the multi-key script
+            redis_keys.append(f"rl:{{{scope}}}:{key}:{count}/{period}:{digest}")
+            args += [period * 1000 / count, period * 1000]
+        if not redis_keys or time.monotonic() < RateLimiter._unavailable_until:
+            return 0
+
+        try:
+            wait_ms = self._run_script(redis_keys, args)
+        except Exception as e:
+            RateLimiter._unavailable_until = time.monotonic() + self.BACKOFF
+            logger.warning(f"Rate limiter unavailable, letting requests through: {str(e)}")
+            return 0
+        if wait_ms:
+            logger.info(f"Rate limit {scope} hit by {BaseThrottle().get_ident(request)}")
+        return wait_ms / 1000
+
+
+class RateLimitThrottle(BaseThrottle):
+    """
+    Applies settings.RATE_LIMITS[view.throttle_scope], user keyed rules
+    included. Use scopes of their own: a scope named after the view's URL
+    is already enforced by RateLimitMiddleware.
+    """
+
+    def allow_request(self, request, view):
+        scope = getattr(view, "throttle_scope", None)
+        self._wait = RateLimiter().check(scope, request) if scope else 0
+        return not self._wait
+
+    def wait(self):
+        return self._wait
@@ -0,0 +1,140 @@
+"""
+Sparse fieldsets for the deal, business and user payloads.
+
+Clients pick the fields they render with `?fields=` and opt in to the
+heavy nested lists with `?expand=`, both comma separated, nested fields
+dotted:
+
+    ?fields=id,deal_name,business.business_name
+    ?expand=business_profile.deals
+
+Without `fields` a serializer renders its fields minus Meta.expandable
+(e.g. a business's deals); `id` is always rendered. The selection also
+decides what to load: optimize_queryset / prefetch_instances plan the
+select_related / prefetch_related lookups for exactly the nested
+serializers that will render.
+"""
+from urllib.parse import urlencode
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import prefetch_related_objects
+from rest_framework import serializers
+
+
+def parse_fieldset(value):
+    """"a,b.c,b.d" -> {"a": {}, "b": {"c": {}, "d": {}}}; None stays None"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    tree = {}
+    for path in value:
+        node = tree
+        for name in path.strip().split("."):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+def sparse_fieldset(request):
+    """Serializer kwargs for the `fields` / `expand` query parameters of a request"""
+    if request is None:
+        return {}
+    return {
+        name: request.query_params[name] for name in ("fields", "expand") if request.query_params.get(name)
+    }
+
+
+def fieldset_cache_key(key, request):
+    """Cache key of a payload shaped by the request's `fields` / `expand`"""
+    selection = sparse_fieldset(request)
+    return f"{key}?{urlencode(sorted(selection.items()))}" if selection else key
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer taking `fields` and `expand` (strings as in the query
+    string, or lists of dotted paths). Nested serializers using the mixin
+    get their part of the selection from their parent.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        self._fieldset = parse_fieldset(fields)
+        self._expand = parse_fieldset(expand) or {}
+        super().__init__(*args, **kwargs)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expandable = set(getattr(self.Meta, "expandable", ()))
+
+        requested = set(self._fieldset or ()) | set(self._expand)
+        unknown = requested - set(fields)
+        if unknown:
+            raise serializers.ValidationError({"fields": f"Unknown field(s): {', '.join(sorted(unknown))}."})
+
+        if self._fieldset:
+            keep = set(self._fieldset) | {"id"}
+        else:
+            keep = (set(fields) - expandable) | set(self._expand)
+        for name in list(fields):
+            if name not in keep:
+                del fields[name]
+
+        for name, field in fields.items():
+            nested = getattr(field, "child", field)
+            if isinstance(nested, SparseFieldsetMixin):
+                nested._fieldset = (self._fieldset or {}).get(name) or None
+                nested._expand = self._expand.get(name, {})
+        return fields
+
+
+def related_lookups(serializer, prefix="", joined=True):
+    """
+    (select_related, prefetch_related) lookups for the nested model
+    serializers `serializer` renders. To-one relations are joined as long
+    as everything above them is; the rest is prefetched.
+    """
+    serializer = getattr(serializer, "child", serializer)
+    model = serializer.Meta.model
+    select, prefetch = [], []
+    for field in serializer.fields.values():
+        nested = getattr(field, "child", field)
+        if not isinstance(nested, serializers.ModelSerializer) or "." in field.source or field.source == "*":
+            continue
+        try:
+            relation = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if not relation.is_relation:
+            continue
+
+        path = f"{prefix}{field.source}"
+        to_one = relation.many_to_one or relation.one_to_one
+        (select if to_one and joined else prefetch).append(path)
+        nested_select, nested_prefetch = related_lookups(nested, f"{path}__", joined and to_one)
+        select += nested_select
+        prefetch += nested_prefetch
+    return select, prefetch
+
+
+def optimize_queryset(queryset, serializer):
+    """`queryset` loading what `serializer` (built with the same fields / expand) renders"""
+    select, prefetch = related_lookups(serializer)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+def prefetch_instances(serializer):
+    """Load the relations `serializer` renders onto its already fetched instance(s)"""
+    instances = serializer.instance
+    if instances is None:
+        return serializer
+    if not isinstance(instances, (list, tuple)):
+        instances = [instances]
+    select, prefetch = related_lookups(serializer)
+    # Already loaded relations are left as they are
+    prefetch_related_objects(instances, *select, *prefetch)
+    return serializer
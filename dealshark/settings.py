@@ -11,8 +11,11 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 
+from celery.schedules import crontab
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -37,6 +40,8 @@ FRONTEND_URL = env("FRONTEND_URL", default="http://localhost:3000")
 STRIPE_SECRET_KEY = env("STRIPE_SECRET_KEY")
 STRIPE_PUBLISHABLE_KEY = env("STRIPE_PUBLISHABLE_KEY")
 WEBHOOK_SECRET = env("WEBHOOK_SECRET")
+# Keys the referral code permutation; must never change once codes are issued
+REFERRAL_CODE_KEY = env("REFERRAL_CODE_KEY", default="dealshark-referral-codes")
 
 INSTALLED_APPS = [
     "django_extensions",
@@ -46,20 +51,25 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'drf_spectacular',
+    'rest_framework_simplejwt.token_blacklist',
     'accounts',
     'deals',
-    'referrals'
+    'referrals',
+    'uploads',
 ]
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'dealshark.middleware.StaticFilesMiddleware',
+    'dealshark.middleware.RequestLogMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'dealshark.middleware.RateLimitMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -137,6 +147,25 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing (see accounts.hashers). New passwords use PASSWORD_HASHER, "scrypt"
+# or "argon2"; the other hashers only verify older hashes.
+PASSWORD_HASHER = os.getenv("PASSWORD_HASHER", "scrypt")
+PASSWORD_HASHERS = {
+    "scrypt": ["accounts.hashers.ScryptPasswordHasher", "accounts.hashers.Argon2PasswordHasher"],
+    "argon2": ["accounts.hashers.Argon2PasswordHasher", "accounts.hashers.ScryptPasswordHasher"],
+}[PASSWORD_HASHER] + [
+    "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+]
+PASSWORD_SCRYPT_WORK_FACTOR = int(os.getenv("PASSWORD_SCRYPT_WORK_FACTOR", 2 ** 14))  # N, a power of 2
+PASSWORD_SCRYPT_BLOCK_SIZE = int(os.getenv("PASSWORD_SCRYPT_BLOCK_SIZE", 8))  # r
+PASSWORD_SCRYPT_PARALLELISM = int(os.getenv("PASSWORD_SCRYPT_PARALLELISM", 1))  # p
+PASSWORD_ARGON2_TIME_COST = int(os.getenv("PASSWORD_ARGON2_TIME_COST", 2))
+PASSWORD_ARGON2_MEMORY_COST = int(os.getenv("PASSWORD_ARGON2_MEMORY_COST", 19456))  # KiB
+PASSWORD_ARGON2_PARALLELISM = int(os.getenv("PASSWORD_ARGON2_PARALLELISM", 1))
+# Async login views: threads hashing passwords at once, hashing is CPU bound (see dealshark.aio)
+PASSWORD_HASHING_MAX_WORKERS = int(os.getenv("PASSWORD_HASHING_MAX_WORKERS", os.cpu_count() or 1))
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -166,9 +195,8 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "accounts.authentication.TokenUserAuthentication",
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 20,
@@ -177,6 +205,9 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    # Proxies in front of the app, for the client IP used by throttles and rate limits: 0 uses
+    # REMOTE_ADDR and ignores X-Forwarded-For; a deployment behind N proxies (load balancer, CDN) sets N
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", "0")),
 }
 
 SPECTACULAR_SETTINGS = {
@@ -211,13 +242,19 @@ SIMPLE_JWT = {
     "BLACKLIST_AFTER_ROTATION": True,
     "UPDATE_LAST_LOGIN": True,
     "AUTH_HEADER_TYPES": ("Bearer",),
+    "TOKEN_REFRESH_SERIALIZER": "accounts.authentication.CachedTokenRefreshSerializer",
 }
+JWT_BLACKLIST_CACHE_TIMEOUT = int(os.getenv("JWT_BLACKLIST_CACHE_TIMEOUT", 60))  # seconds a "not blacklisted" answer is cached
 
 # settings.py
 import os
 
 # Email (development / production)
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Use django.core.mail.backends.console.EmailBackend (or filebased with
+# EMAIL_FILE_PATH) to develop without an SMTP server
+EMAIL_BACKEND = os.getenv("EMAIL_BACKEND", 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = os.getenv("EMAIL_FILE_PATH", os.path.join(BASE_DIR, 'tmp', 'emails'))
+EMAIL_TIMEOUT = int(os.getenv("EMAIL_TIMEOUT", 30))
 EMAIL_HOST = os.getenv("EMAIL_HOST", "smtp.gmail.com")
 EMAIL_PORT = int(os.getenv("EMAIL_PORT", 587))
 EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "True").lower() in ("true", "1", "yes")
@@ -248,6 +285,98 @@ CACHES = {
     }
 }
 
+# One-time codes (accounts.services.otp_service)
+OTP_BACKEND = os.getenv("OTP_BACKEND", "accounts.services.otp_service.RedisOTPBackend")
+OTP_TTL = int(os.getenv("OTP_TTL", 600))  # seconds a code stays valid
+OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", 5))  # wrong guesses before a code is burnt
+OTP_RATE_LIMIT = int(os.getenv("OTP_RATE_LIMIT", 5))  # codes issued per user and type...
+OTP_RATE_WINDOW = int(os.getenv("OTP_RATE_WINDOW", 3600))  # ...within this many seconds
+# Also record issued / used codes (without the code) in OTPVerification
+OTP_AUDIT_LOG = os.getenv("OTP_AUDIT_LOG", "False").lower() in ("true", "1", "yes")
+
+# Rate limits (dealshark.ratelimit): URL name or throttle_scope -> [(key, "count/period")],
+# keys: ip, email, code (referral code), user (throttle only)
+RATE_LIMITS = {
+    "login": [("ip", "20/m"), ("email", "10/15m")],
+    "business-auth-login": [("ip", "20/m"), ("email", "10/15m")],
+    "verify_otp": [("ip", "20/m"), ("email", "10/15m")],
+    "resend_otp": [("ip", "10/m"), ("email", "5/15m")],
+    "referral-subscription-verify-code": [("ip", "60/m")],
+    "create_payment": [("ip", "20/m"), ("code", "60/m")],
+    # RateLimitThrottle scopes
+    "stripe_onboarding": [("user", "30/m")],
+}
+
+# Read-through cache for public deal/business endpoints (see dealshark/cache.py)
+API_CACHE_TIMEOUT = int(os.getenv("API_CACHE_TIMEOUT", 300))  # seconds before a rebuild
+API_CACHE_STALE_GRACE = int(os.getenv("API_CACHE_STALE_GRACE", 60))  # stale copy served while rebuilding
+API_CACHE_LOCK_TIMEOUT = 10
+API_CACHE_LOCK_WAIT = 2.0
+
+# Referral code resolution (see referrals/resolver.py)
+REFERRAL_CODE_CACHE_TIMEOUT = int(os.getenv("REFERRAL_CODE_CACHE_TIMEOUT", 300))
+REFERRAL_CODE_NEGATIVE_TIMEOUT = int(os.getenv("REFERRAL_CODE_NEGATIVE_TIMEOUT", 60))  # unknown codes
+REFERRAL_CODE_LOCAL_TTL = int(os.getenv("REFERRAL_CODE_LOCAL_TTL", 15))  # per-process LRU, not invalidated
+REFERRAL_CODE_LOCAL_SIZE = int(os.getenv("REFERRAL_CODE_LOCAL_SIZE", 10000))
+
+# Referral link click tracking (referrals.services.click_service)
+CLICK_BUFFER = os.getenv("CLICK_BUFFER", "redis")  # "redis", or "local" for a single process
+CLICK_DEDUP_WINDOW = int(os.getenv("CLICK_DEDUP_WINDOW", 30 * 60))  # seconds a visitor's repeat clicks are ignored
+CLICK_FLUSH_INTERVAL = float(os.getenv("CLICK_FLUSH_INTERVAL", 10))  # seconds
+CLICK_FLUSH_BATCH = int(os.getenv("CLICK_FLUSH_BATCH", 500))
+CLICK_FLUSH_MAX_BATCHES = int(os.getenv("CLICK_FLUSH_MAX_BATCHES", 20))  # per flush run
+CLICK_LOCAL_BUFFER_SIZE = int(os.getenv("CLICK_LOCAL_BUFFER_SIZE", 10000))
+
+# Logging: JSON lines to stdout, written by a background thread (see dealshark.logs).
+# Test runs keep stdout for the test output; tests check records with assertLogs
+TESTING = sys.argv[1:2] == ["test"] or "pytest" in sys.modules
+LOG_LEVEL = os.getenv("LOG_LEVEL", "CRITICAL" if TESTING else "WARNING")
+# One INFO line per request (ERROR for failures), see dealshark.middleware.RequestLogMiddleware
+REQUEST_LOG_LEVEL = os.getenv("REQUEST_LOG_LEVEL", "CRITICAL" if TESTING else "INFO")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))  # records waiting to be written, more are dropped
+REQUEST_LOG_SAMPLE_RATE = float(os.getenv("REQUEST_LOG_SAMPLE_RATE", 1.0))  # share of requests logged
+REQUEST_LOG_SLOW_MS = float(os.getenv("REQUEST_LOG_SLOW_MS", 1000))  # slower requests are always logged
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "dealshark.logs.JSONFormatter"},
+    },
+    "handlers": {
+        "queue": {
+            "class": "dealshark.logs.QueueLogHandler",
+            "formatter": "json",
+            "stream": "ext://sys.stdout",
+            "maxsize": LOG_QUEUE_SIZE,
+        },
+    },
+    "root": {"handlers": ["queue"], "level": LOG_LEVEL},
+    "loggers": {
+        # In place of Django's defaults, which log django.* at INFO whatever LOG_LEVEL says
+        "django": {"handlers": ["queue"], "level": LOG_LEVEL, "propagate": False},
+        "dealshark.requests": {"handlers": ["queue"], "level": REQUEST_LOG_LEVEL, "propagate": False},
+    },
+}
+
+# Async views: threads running blocking Stripe / Firebase SDK calls (see dealshark.aio)
+BLOCKING_IO_MAX_WORKERS = int(os.getenv("BLOCKING_IO_MAX_WORKERS", 32))
+
+# Direct-to-storage uploads (uploads app)
+UPLOAD_STORAGE = os.getenv("UPLOAD_STORAGE", "uploads.services.storage.FirebaseUploadStorage")
+UPLOAD_SESSION_TTL = int(os.getenv("UPLOAD_SESSION_TTL", 3600))  # seconds the signed URL stays valid
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 10 * 1024 * 1024))
+UPLOAD_ALLOWED_TYPES = os.getenv(
+    "UPLOAD_ALLOWED_TYPES", "image/jpeg,image/png,image/webp,image/gif,application/pdf"
+).split(",")
+# LocalUploadStorage only
+UPLOAD_LOCAL_ROOT = os.getenv("UPLOAD_LOCAL_ROOT", os.path.join(BASE_DIR, "media"))
+UPLOAD_LOCAL_URL = os.getenv("UPLOAD_LOCAL_URL", "http://localhost:8000/uploads/files/")
+# Image variants (uploads.utils.generate_image_variants)
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", 40_000_000))  # larger originals are not decoded
+
+# Streaming exports: rows fetched per server-side cursor round trip (and encoded per chunk)
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 2000))
+
 # Celery Configuration (for async tasks like sending emails)
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
@@ -255,6 +384,48 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Run tasks inline (no broker/worker needed) for local development
+CELERY_TASK_ALWAYS_EAGER = os.getenv("CELERY_TASK_ALWAYS_EAGER", "False").lower() in ("true", "1", "yes")
+# Webhook events must survive a worker crash mid-task: ack after running
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_BEAT_SCHEDULE = {
+    "reconcile-subscriber-counts": {
+        "task": "referrals.utils.reconcile_subscriber_counts",
+        "schedule": crontab(hour=3, minute=0),
+    },
+    "sync-stripe-accounts": {
+        "task": "referrals.utils.sync_stripe_accounts",
+        "schedule": crontab(minute="*/15"),
+    },
+    "flush-clicks": {
+        "task": "referrals.utils.flush_clicks",
+        "schedule": float(os.getenv("CLICK_FLUSH_INTERVAL", 10)),
+    },
+    "run-payouts": {
+        "task": "referrals.utils.run_payouts",
+        "schedule": crontab(minute=0),  # one transfer per account per hour
+    },
+}
+
+# Stripe webhook processing (referrals.services.stripe_event_service)
+STRIPE_EVENT_MAX_ATTEMPTS = int(os.getenv("STRIPE_EVENT_MAX_ATTEMPTS", 5))
+STRIPE_EVENT_RETRY_BACKOFF = int(os.getenv("STRIPE_EVENT_RETRY_BACKOFF", 30))
+
+# Stripe calls from the request path (referrals.services.stripe_gateway)
+STRIPE_GATEWAY = os.getenv("STRIPE_GATEWAY", "referrals.services.stripe_gateway.StripeGateway")
+STRIPE_API_TIMEOUT = float(os.getenv("STRIPE_API_TIMEOUT", 5))  # seconds
+STRIPE_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("STRIPE_CIRCUIT_FAILURE_THRESHOLD", 5))
+STRIPE_CIRCUIT_RESET_TIMEOUT = int(os.getenv("STRIPE_CIRCUIT_RESET_TIMEOUT", 30))  # seconds the circuit stays open
+# Local account state (referrals.services.stripe_account_service)
+STRIPE_ACCOUNT_CACHE_TIMEOUT = int(os.getenv("STRIPE_ACCOUNT_CACHE_TIMEOUT", 300))
+STRIPE_ACCOUNT_SYNC_MAX_AGE = int(os.getenv("STRIPE_ACCOUNT_SYNC_MAX_AGE", 6 * 60 * 60))  # seconds
+STRIPE_ACCOUNT_SYNC_BATCH = int(os.getenv("STRIPE_ACCOUNT_SYNC_BATCH", 100))
+
+# Payout batches (referrals.services.payout_service). Stripe keeps idempotency
+# keys for 24h, so retries with these defaults all land well inside that window
+PAYOUT_MAX_ATTEMPTS = int(os.getenv("PAYOUT_MAX_ATTEMPTS", 6))
+PAYOUT_RETRY_BACKOFF = int(os.getenv("PAYOUT_RETRY_BACKOFF", 120))  # seconds, doubled per attempt
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
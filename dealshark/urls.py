@@ -26,7 +26,7 @@ from django.urls import re_path
 
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
-from dealshark.views import FirebaseUploadView
+from dealshark.views import FirebaseUploadView, CacheStatsView
 from referrals.views import stripe_onboarding_redirect
 
 
@@ -69,12 +69,14 @@ urlpatterns = [
     path('auth/', include('accounts.urls')),
     path('deals/', include('deals.urls')),
     path('referrals/', include('referrals.urls')),
+    path('uploads/', include('uploads.urls')),
     # path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     # path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
     # path('swagger.json', schema_view.without_ui(cache_timeout=0), name='schema-json'),
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('upload/', FirebaseUploadView.as_view(), name='upload'),
+    path('cache-stats/', CacheStatsView.as_view(), name='cache-stats'),
     path("stripe/onboarding/redirect/", stripe_onboarding_redirect, name="stripe-onboarding-redirect"),
 ]
 
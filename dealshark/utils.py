@@ -31,17 +31,13 @@ def format_currency(amount):
     return f"${amount:.2f}"
 
 
-class OTPRateLimiter:
-    def __init__(self, max_attempts=5, window_minutes=60):
-        self.max_attempts = max_attempts
-        self.window_minutes = window_minutes
-
-    def can_request_otp(self, user, otp_type):
-        from accounts.models import OTPVerification
-        window_start = timezone.now() - timezone.timedelta(minutes=self.window_minutes)
-        recent_otps = OTPVerification.objects.filter(
-            user=user,
-            otp_type=otp_type,
-            created_at__gte=window_start
-        ).count()
-        return recent_otps < self.max_attempts
+def fields_except(instance, *excluded):
+    """
+    Concrete field names of `instance` for save(update_fields=...), minus
+    `excluded`. Used to keep saves of a possibly stale instance from writing
+    back columns that are maintained elsewhere (F() updates, background jobs).
+    """
+    return [
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key and field.name not in excluded
+    ]
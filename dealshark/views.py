@@ -1,25 +1,52 @@
-from django.db import transaction
-from rest_framework.permissions import IsAuthenticated, AllowAny
+import hashlib
+
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 
 from config.firebase import upload_file_to_firebase
+from dealshark.aio import AsyncAPIView, run_blocking
+from dealshark.cache import get_stats
+from deals.cache import CACHE_NAMES
+from uploads.services.upload_service import UploadService
+
+
+def _sha256(file):
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
 
 
-class FirebaseUploadView(APIView):
+class FirebaseUploadView(AsyncAPIView):
+    """
+    Deprecated: the bytes go through this server. Clients should use the
+    upload sessions (/uploads/sessions/) and send files to storage directly.
+    """
     permission_classes = [AllowAny]
 
-    def post(self, request):
-        with transaction.atomic():
-            if "file" not in request.FILES:
-                return Response({"error": "No file uploaded."}, status=400)
+    async def post(self, request):
+        # Parsing may spool a large upload to disk
+        files = await run_blocking(lambda: request.FILES)
+        if "file" not in files:
+            return Response({"error": "No file uploaded."}, status=400)
+
+        file = files["file"]
+        owner = request.user.id if request.user.is_authenticated else "public"
+        path = UploadService.path_for(owner, await run_blocking(_sha256, file), file.content_type)
+
+        try:
+            url = await run_blocking(upload_file_to_firebase, file, path)
+            return Response({"url": url}, status=201)
+        except Exception as e:
+            return Response({"error": str(e)}, status=500)
+
 
-            file = request.FILES["file"]
-            path = f"uploads/{file.name}"
+class CacheStatsView(APIView):
+    """Admin: hit / stale / miss counters of the public API cache"""
+    permission_classes = [IsAdminUser]
 
-            try:
-                url = upload_file_to_firebase(file, path)
-                return Response({"url": url}, status=201)
-            except Exception as e:
-                return Response({"error": str(e)}, status=500)
\ No newline at end of file
+    def get(self, request):
+        return Response({"caches": get_stats(CACHE_NAMES)}, status=200)
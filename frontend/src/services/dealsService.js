@@ -181,9 +181,11 @@ export const dealsService = {
       const response = await api.get(url);
 
       if (response.success) {
+        // Endpoint is keyset-paginated: { next, page_size, results }
         return {
           success: true,
-          deals: response.data,
+          deals: response.data.results,
+          next: response.data.next,
         };
       }
 
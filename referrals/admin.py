@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import Referral
+from .models import (
+    LedgerBalance, LedgerEntry, PayoutBatch, PayoutEntry, Referral, StripeAccountState, StripeEvent,
+)
+from .services.payout_service import PayoutService
+from .services.stripe_event_service import StripeEventService
 
 
 @admin.register(Referral)
@@ -8,3 +12,66 @@ class ReferralAdmin(admin.ModelAdmin):
     list_filter = ('status', 'created_at', 'conversion_date')
     search_fields = ('referrer__email', 'referred_email', 'deal__title')
     raw_id_fields = ('deal', 'referrer')
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'type', 'status', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('status', 'type', 'livemode')
+    search_fields = ('event_id',)
+    readonly_fields = ('event_id', 'type', 'payload', 'livemode', 'received_at', 'claimed_at', 'processed_at')
+    actions = ('replay_events',)
+
+    @admin.action(description="Replay selected events")
+    def replay_events(self, request, queryset):
+        event_ids = StripeEventService.replay(queryset)
+        self.message_user(request, f"Queued {len(event_ids)} event(s)")
+
+
+@admin.register(StripeAccountState)
+class StripeAccountStateAdmin(admin.ModelAdmin):
+    list_display = ('account_id', 'details_submitted', 'charges_enabled', 'payouts_enabled', 'synced_at')
+    list_filter = ('details_submitted', 'charges_enabled', 'payouts_enabled')
+    search_fields = ('account_id',)
+
+
+@admin.register(PayoutBatch)
+class PayoutBatchAdmin(admin.ModelAdmin):
+    list_display = ('id', 'destination', 'amount', 'currency', 'status', 'attempts', 'created_at', 'paid_at')
+    list_filter = ('status', 'currency')
+    search_fields = ('destination', 'transfer_id')
+    readonly_fields = ('destination', 'currency', 'amount', 'transfer_id', 'created_at', 'claimed_at', 'paid_at')
+    actions = ('retry_batches',)
+
+    @admin.action(description="Retry selected batches")
+    def retry_batches(self, request, queryset):
+        retried = PayoutService.retry(queryset)
+        self.message_user(request, f"{retried} batch(es) will be sent on the next payout run")
+
+
+@admin.register(PayoutEntry)
+class PayoutEntryAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'role', 'destination', 'amount', 'currency', 'status', 'created_at')
+    list_filter = ('status', 'role')
+    search_fields = ('event_id', 'destination')
+    raw_id_fields = ('referral', 'batch')
+
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ('transaction_id', 'account', 'amount', 'currency', 'created_at')
+    search_fields = ('transaction_id', 'account', 'rollup')
+
+    # Append-only: corrections are posted as new transactions
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(LedgerBalance)
+class LedgerBalanceAdmin(admin.ModelAdmin):
+    list_display = ('account', 'balance', 'currency', 'updated_at')
+    search_fields = ('account',)
+    readonly_fields = ('account', 'currency', 'balance', 'updated_at')
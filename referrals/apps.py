@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ReferralsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'referrals'
+
+    def ready(self):
+        from referrals import signals  # noqa: F401
@@ -0,0 +1,93 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+
+from referrals.models import ReferralSubscription
+
+URL = "/referrals/create-payment/"
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test create-payment against a simulated slow Stripe: a fixed number of "
+        "sync workers (gunicorn style, one request each) versus the async view with "
+        "every request in flight on one event loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Requests per run")
+        parser.add_argument("--latency", type=float, default=0.5, help="Simulated Stripe latency, seconds")
+        parser.add_argument("--workers", type=int, default=4, help="Sync workers in the baseline run")
+        parser.add_argument("--concurrency", type=int, default=200, help="Async requests in flight at once")
+        parser.add_argument("--code", help="Referral code to pay for (default: any existing subscription)")
+
+    def handle(self, *args, **options):
+        code = options["code"] or ReferralSubscription.objects.values_list("referral_code", flat=True).first()
+        if not code:
+            raise CommandError("No referral subscription to pay for, create one or pass --code.")
+        payload = {"referral_code": code, "amount": "25.00"}
+        latency = options["latency"]
+
+        def slow_checkout(**params):
+            time.sleep(latency)
+            return SimpleNamespace(id="cs_loadtest", url="https://checkout.stripe.invalid/cs_loadtest")
+
+        # Stripe is simulated, stats events are not queued and every request comes from one IP
+        with mock.patch("stripe.checkout.Session.create", side_effect=slow_checkout), \
+                mock.patch("referrals.views.StatsService.track"), override_settings(RATE_LIMITS={}):
+            runs = [
+                (f"sync x{options['workers']}", self.run_sync(payload, options["requests"], options["workers"])),
+                (f"async x{options['concurrency']}", asyncio.run(
+                    self.run_async(payload, options["requests"], options["concurrency"])
+                )),
+            ]
+
+        self.stdout.write(f"{'path':<14}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'wall s':>10}")
+        for name, (timings, wall) in runs:
+            p50, p95 = self.percentiles(timings)
+            self.stdout.write(f"{name:<14}{len(timings) / wall:>10.1f}{p50:>10.0f}{p95:>10.0f}{wall:>10.2f}")
+
+    def run_sync(self, payload, count, workers):
+        def request(_):
+            started = time.perf_counter()
+            response = Client().post(URL, payload, content_type="application/json")
+            self.expect_ok(response)
+            return (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            timings = list(pool.map(request, range(count)))
+        return timings, time.perf_counter() - started
+
+    async def run_async(self, payload, count, concurrency):
+        client = AsyncClient()
+        slots = asyncio.Semaphore(concurrency)
+
+        async def request():
+            async with slots:
+                started = time.perf_counter()
+                response = await client.post(URL, payload, content_type="application/json")
+                self.expect_ok(response)
+                return (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        timings = await asyncio.gather(*(request() for _ in range(count)))
+        return list(timings), time.perf_counter() - started
+
+    @staticmethod
+    def expect_ok(response):
+        if response.status_code != 200:
+            raise CommandError(f"create-payment returned {response.status_code}: {response.content[:200]}")
+
+    @staticmethod
+    def percentiles(timings):
+        if len(timings) < 2:
+            return timings[0], timings[0]
+        cuts = statistics.quantiles(timings, n=100, method="inclusive")
+        return cuts[49], cuts[94]
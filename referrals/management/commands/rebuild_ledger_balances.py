@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from referrals.services.ledger_service import LedgerService
+
+
+class Command(BaseCommand):
+    help = "Recompute ledger balances from the ledger entries and fix the ones that drifted."
+
+    def handle(self, *args, **options):
+        fixed = LedgerService.rebuild_balances()
+        self.stdout.write(self.style.SUCCESS(f"Fixed {fixed} ledger balance(s)"))
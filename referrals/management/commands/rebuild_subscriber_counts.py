@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from referrals.services.referral_service import ReferralService
+
+
+class Command(BaseCommand):
+    help = "Recount subscribers for every deal and business and fix drifted counters."
+
+    def handle(self, *args, **options):
+        deals_fixed, businesses_fixed = ReferralService.rebuild_subscriber_counts()
+        self.stdout.write(self.style.SUCCESS(
+            f"Fixed {deals_fixed} deal counter(s) and {businesses_fixed} business counter(s)"
+        ))
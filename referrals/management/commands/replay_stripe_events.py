@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from referrals.models import StripeEvent
+from referrals.services.stripe_event_service import StripeEventService
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-queue stored Stripe webhook events, by id or by status "
+        "(dead-lettered events by default)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("event_ids", nargs="*", help="Stripe event ids (evt_...) to replay")
+        parser.add_argument(
+            "--status",
+            default=StripeEvent.STATUS_DEAD_LETTER,
+            choices=[choice for choice, _ in StripeEvent.STATUS_CHOICES],
+            help="Replay events in this status when no ids are given",
+        )
+        parser.add_argument("--type", help="Only replay events of this type, e.g. payment_intent.succeeded")
+        parser.add_argument("--limit", type=int, default=1000, help="Maximum events to replay")
+        parser.add_argument("--sync", action="store_true", help="Process in this process instead of Celery")
+
+    def handle(self, *args, **options):
+        events = StripeEvent.objects.order_by("received_at")
+        if options["event_ids"]:
+            events = events.filter(event_id__in=options["event_ids"])
+        else:
+            events = events.filter(status=options["status"])
+        if options["type"]:
+            events = events.filter(type=options["type"])
+        events = events[: options["limit"]]
+
+        if not options["sync"]:
+            event_ids = StripeEventService.replay(events)
+            self.stdout.write(self.style.SUCCESS(f"Queued {len(event_ids)} event(s)"))
+            return
+
+        event_ids = StripeEventService.reset(events)
+        if not event_ids:
+            raise CommandError("No matching events")
+        for event_id in event_ids:
+            try:
+                status = StripeEventService.process(event_id)
+            except Exception as e:
+                status = f"failed ({str(e)})"
+            self.stdout.write(f"{event_id}: {status}")
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.24 on 2026-10-18 11:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("referrals", "0004_stripeevent"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="referralsubscription",
+            index=models.Index(
+                fields=["referrer", "-created_at", "-id"],
+                name="subscription_referrer_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.24 on 2026-10-18 11:19
+
+from django.db import migrations
+
+BACKFILL_DEALS_SQL = """
+    UPDATE deals_deal AS d SET subscribers_count = c.total
+    FROM (
+        SELECT deal_id, COUNT(*) AS total
+        FROM referrals_referralsubscription
+        GROUP BY deal_id
+    ) AS c
+    WHERE c.deal_id = d.id
+"""
+
+BACKFILL_BUSINESSES_SQL = """
+    UPDATE accounts_business AS b SET subscribers_count = c.total
+    FROM (
+        SELECT d.business_id, COUNT(*) AS total
+        FROM referrals_referralsubscription s
+        JOIN deals_deal d ON d.id = s.deal_id
+        GROUP BY d.business_id
+    ) AS c
+    WHERE c.business_id = b.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("referrals", "0005_subscription_referrer_idx"),
+        ("deals", "0008_deal_subscribers_count_deal_deal_popularity_idx"),
+        ("accounts", "0014_business_subscribers_count"),
+    ]
+
+    operations = [
+        migrations.RunSQL(BACKFILL_DEALS_SQL, migrations.RunSQL.noop),
+        migrations.RunSQL(BACKFILL_BUSINESSES_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.24 on 2026-10-18 11:25
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("referrals", "0006_backfill_subscriber_counts"),
+    ]
+
+    operations = [
+        # Source of referral codes, see referrals.services.code_service
+        migrations.RunSQL(
+            "CREATE SEQUENCE referral_code_seq START 1",
+            "DROP SEQUENCE referral_code_seq",
+        ),
+    ]
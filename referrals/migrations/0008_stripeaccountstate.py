@@ -0,0 +1,39 @@
+# Generated by Django 4.2.24 on 2026-10-18 11:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("referrals", "0007_referral_code_sequence"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StripeAccountState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("account_id", models.CharField(max_length=255, unique=True)),
+                ("details_submitted", models.BooleanField(default=False)),
+                ("charges_enabled", models.BooleanField(default=False)),
+                ("payouts_enabled", models.BooleanField(default=False)),
+                ("synced_at", models.DateTimeField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["synced_at"], name="referrals_s_synced__35c844_idx"
+                    )
+                ],
+            },
+        ),
+    ]
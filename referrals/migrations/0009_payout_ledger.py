@@ -0,0 +1,135 @@
+# Generated by Django 4.2.24 on 2026-10-18 11:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("referrals", "0008_stripeaccountstate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PayoutBatch",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("destination", models.CharField(max_length=255)),
+                ("currency", models.CharField(default="usd", max_length=3)),
+                ("amount", models.PositiveBigIntegerField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("processing", "Processing"),
+                            ("paid", "Paid"),
+                            ("failed", "Failed"),
+                            ("dead_letter", "Dead letter"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("last_error", models.TextField(blank=True)),
+                ("transfer_id", models.CharField(blank=True, max_length=255)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("claimed_at", models.DateTimeField(blank=True, null=True)),
+                ("next_attempt_at", models.DateTimeField(blank=True, null=True)),
+                ("paid_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="PayoutEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("event_id", models.CharField(max_length=255)),
+                (
+                    "role",
+                    models.CharField(
+                        choices=[("business", "Business"), ("referrer", "Referrer")],
+                        max_length=20,
+                    ),
+                ),
+                ("destination", models.CharField(max_length=255)),
+                ("currency", models.CharField(default="usd", max_length=3)),
+                ("amount", models.PositiveBigIntegerField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("batched", "Batched"),
+                            ("paid", "Paid"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "batch",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="entries",
+                        to="referrals.payoutbatch",
+                    ),
+                ),
+                (
+                    "referral",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="payout_entries",
+                        to="referrals.referral",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="payoutbatch",
+            index=models.Index(
+                fields=["status", "next_attempt_at"],
+                name="referrals_p_status_a88f28_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="payoutentry",
+            index=models.Index(
+                fields=["status", "destination", "currency"],
+                name="referrals_p_status_f1019e_idx",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="payoutentry",
+            unique_together={("event_id", "role")},
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.24 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("referrals", "0009_payout_ledger"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LedgerEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("transaction_id", models.CharField(max_length=255)),
+                ("account", models.CharField(max_length=255)),
+                ("rollup", models.CharField(blank=True, max_length=255)),
+                ("amount", models.BigIntegerField()),
+                ("currency", models.CharField(default="usd", max_length=3)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["-created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["account", "created_at"],
+                        name="referrals_l_account_112c0f_idx",
+                    )
+                ],
+                "unique_together": {("transaction_id", "account")},
+            },
+        ),
+        migrations.CreateModel(
+            name="LedgerBalance",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("account", models.CharField(max_length=255)),
+                ("currency", models.CharField(default="usd", max_length=3)),
+                ("balance", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "unique_together": {("account", "currency")},
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.24 on 2026-10-18 11:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("deals", "0009_dealdailystats"),
+        ("referrals", "0010_commission_ledger"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="referralsubscription",
+            name="clicks_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name="ReferralClick",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("referral_code", models.CharField(max_length=20)),
+                ("clicked_at", models.DateTimeField()),
+                ("visitor_hash", models.CharField(max_length=32)),
+                ("ua_hash", models.CharField(max_length=16)),
+                ("referer", models.CharField(blank=True, max_length=500)),
+                (
+                    "deal",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="clicks",
+                        to="deals.deal",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["deal", "clicked_at"],
+                        name="referrals_r_deal_id_fa421d_idx",
+                    ),
+                    models.Index(
+                        fields=["referral_code", "clicked_at"],
+                        name="referrals_r_referra_68ae5f_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
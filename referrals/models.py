@@ -1,10 +1,10 @@
 from django.conf import settings
 from django.db import models
 import uuid
-import random
-import string
 from deals.models import Deal
 from accounts.models import User, Business
+from dealshark.utils import fields_except
+from referrals.services.code_service import ReferralCodeService
 
 
 class Referral(models.Model):
@@ -28,7 +28,7 @@ class Referral(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.referral_code:
-            self.referral_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
+            self.referral_code = ReferralCodeService.allocate()
         super().save(*args, **kwargs)
 
     class Meta:
@@ -49,20 +49,256 @@ class ReferralSubscription(models.Model):
     referral_code = models.CharField(max_length=20, unique=True, blank=True)
     referral_link = models.URLField(unique=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Deduplicated clicks, added in batches by ClickService.flush
+    clicks_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         unique_together = ("deal", "referrer")
         ordering = ["-created_at"]
+        indexes = [
+            # my-subscriptions keyset pages
+            models.Index(fields=["referrer", "-created_at", "-id"], name="subscription_referrer_idx"),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.referral_code:
-            self.referral_code = "".join(
-                random.choices(string.ascii_uppercase + string.digits, k=8)
-            )
+            self.referral_code = ReferralCodeService.allocate()
         if not self.referral_link:
             base_url = getattr(settings, "FRONTEND_URL", "http://localhost:3000")
             self.referral_link = f"{base_url}/ref/{self.referral_code}"
+        # clicks_count is maintained with queryset updates, never write back a stale copy
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = fields_except(self, "clicks_count")
         super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"{self.referrer.email} subscribed to deal {self.deal.deal_name}"
\ No newline at end of file
+        return f"{self.referrer.email} subscribed to deal {self.deal.deal_name}"
+
+
+class StripeEvent(models.Model):
+    """
+    Raw Stripe webhook deliveries, keyed by Stripe's event id so retried
+    deliveries are stored (and processed) once. Processing happens in
+    Celery, see referrals.services.stripe_event_service.
+    """
+    STATUS_PENDING = "pending"
+    STATUS_PROCESSING = "processing"
+    STATUS_PROCESSED = "processed"
+    STATUS_FAILED = "failed"
+    STATUS_DEAD_LETTER = "dead_letter"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "Pending"),
+        (STATUS_PROCESSING, "Processing"),
+        (STATUS_PROCESSED, "Processed"),
+        (STATUS_FAILED, "Failed"),
+        (STATUS_DEAD_LETTER, "Dead letter"),
+    )
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    livemode = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-received_at"]
+        indexes = [
+            models.Index(fields=["status", "received_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.type} {self.event_id} ({self.status})"
+
+
+class StripeAccountState(models.Model):
+    """
+    Local copy of the onboarding flags of a connected Stripe account, kept
+    current by the account.updated webhook and the sync_stripe_accounts
+    task so the request path does not have to call Account.retrieve.
+    See referrals.services.stripe_account_service.
+    """
+    account_id = models.CharField(max_length=255, unique=True)
+    details_submitted = models.BooleanField(default=False)
+    charges_enabled = models.BooleanField(default=False)
+    payouts_enabled = models.BooleanField(default=False)
+    synced_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["synced_at"]),
+        ]
+
+    @property
+    def is_complete(self):
+        return self.details_submitted and self.charges_enabled and self.payouts_enabled
+
+    def __str__(self):
+        return f"{self.account_id} ({'complete' if self.is_complete else 'incomplete'})"
+
+
+class PayoutBatch(models.Model):
+    """
+    One Stripe transfer to one connected account, covering every pending
+    PayoutEntry for that account when the batch was cut. The idempotency
+    key is fixed at creation, so retries never transfer twice.
+    See referrals.services.payout_service.
+    """
+    STATUS_PENDING = "pending"
+    STATUS_PROCESSING = "processing"
+    STATUS_PAID = "paid"
+    STATUS_FAILED = "failed"
+    STATUS_DEAD_LETTER = "dead_letter"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "Pending"),
+        (STATUS_PROCESSING, "Processing"),
+        (STATUS_PAID, "Paid"),
+        (STATUS_FAILED, "Failed"),
+        (STATUS_DEAD_LETTER, "Dead letter"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    destination = models.CharField(max_length=255)
+    currency = models.CharField(max_length=3, default="usd")
+    amount = models.PositiveBigIntegerField()  # cents
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    transfer_id = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    paid_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+
+    @property
+    def idempotency_key(self):
+        return f"payout-batch:{self.id}"
+
+    def __str__(self):
+        return f"{self.amount} {self.currency} to {self.destination} ({self.status})"
+
+
+class PayoutEntry(models.Model):
+    """
+    What a successful payment owes one party (the business or the
+    referrer). Entries are written by the payment_intent.succeeded handler
+    and paid out in batches.
+    """
+    ROLE_BUSINESS = "business"
+    ROLE_REFERRER = "referrer"
+    ROLE_CHOICES = (
+        (ROLE_BUSINESS, "Business"),
+        (ROLE_REFERRER, "Referrer"),
+    )
+    STATUS_PENDING = "pending"
+    STATUS_BATCHED = "batched"
+    STATUS_PAID = "paid"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "Pending"),
+        (STATUS_BATCHED, "Batched"),
+        (STATUS_PAID, "Paid"),
+    )
+
+    event_id = models.CharField(max_length=255)  # the StripeEvent that produced it
+    role = models.CharField(max_length=20, choices=ROLE_CHOICES)
+    referral = models.ForeignKey(
+        Referral, on_delete=models.SET_NULL, null=True, blank=True, related_name="payout_entries"
+    )
+    destination = models.CharField(max_length=255)
+    currency = models.CharField(max_length=3, default="usd")
+    amount = models.PositiveBigIntegerField()  # cents
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    batch = models.ForeignKey(
+        PayoutBatch, on_delete=models.SET_NULL, null=True, blank=True, related_name="entries"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        unique_together = ("event_id", "role")
+        indexes = [
+            models.Index(fields=["status", "destination", "currency"]),
+        ]
+
+    def __str__(self):
+        return f"{self.role} {self.amount} {self.currency} for {self.event_id} ({self.status})"
+
+
+class LedgerEntry(models.Model):
+    """
+    Append-only, double-entry record of money moving through the platform,
+    in integer cents (credits positive). The entries of one transaction
+    always sum to zero. Balances are materialized in LedgerBalance in the
+    same database transaction, see referrals.services.ledger_service.
+    """
+    transaction_id = models.CharField(max_length=255)  # e.g. the StripeEvent id
+    account = models.CharField(max_length=255)
+    rollup = models.CharField(max_length=255, blank=True)  # summary account the entry also counts towards
+    amount = models.BigIntegerField()  # cents
+    currency = models.CharField(max_length=3, default="usd")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        unique_together = ("transaction_id", "account")
+        indexes = [
+            models.Index(fields=["account", "created_at"]),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Ledger entries are append-only, post a correcting transaction instead")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Ledger entries are append-only, post a correcting transaction instead")
+
+    def __str__(self):
+        return f"{self.transaction_id} {self.account} {self.amount} {self.currency}"
+
+
+class LedgerBalance(models.Model):
+    """Current balance of a ledger account (or rollup), kept in step with LedgerEntry"""
+    account = models.CharField(max_length=255)
+    currency = models.CharField(max_length=3, default="usd")
+    balance = models.BigIntegerField(default=0)  # cents
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("account", "currency")
+
+    def __str__(self):
+        return f"{self.account} {self.balance} {self.currency}"
+
+
+class ReferralClick(models.Model):
+    """
+    A landing on a referral link (verify_code), deduplicated per visitor.
+    Clicks are buffered and written in batches, see
+    referrals.services.click_service.
+    """
+    referral_code = models.CharField(max_length=20)
+    deal = models.ForeignKey(Deal, on_delete=models.CASCADE, related_name="clicks")
+    clicked_at = models.DateTimeField()
+    visitor_hash = models.CharField(max_length=32)  # keyed hash of IP and user agent
+    ua_hash = models.CharField(max_length=16)
+    referer = models.CharField(max_length=500, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["deal", "clicked_at"]),
+            models.Index(fields=["referral_code", "clicked_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.referral_code} at {self.clicked_at}"
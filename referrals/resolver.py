@@ -0,0 +1,202 @@
+"""
+Referral code resolution for the landing funnel (verify, checkout) and the
+Stripe webhook, cached in two tiers:
+
+  * a small in-process LRU with a short TTL, which absorbs repeated clicks
+    on the same link without any network hop. It is not invalidated across
+    processes, so callers that move money pass local=False;
+  * the shared cache (Redis). Each snapshot records the version tokens of
+    the deal, business and referrer namespaces it was built from
+    (see dealshark/cache.py). A bump of any of them (deal edit, new
+    subscriber, profile change...) makes the next read rebuild it.
+
+Unknown codes are cached too, briefly, so scanners guessing codes do not
+reach the database on every request.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+from accounts.serializers import BusinessResponseSerializer, UserProfileSerializer
+from deals import cache as deal_cache
+from deals.serializers import DealSerializer
+from dealshark.cache import count, namespace_versions
+from referrals.models import ReferralSubscription
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT = getattr(settings, "REFERRAL_CODE_CACHE_TIMEOUT", 300)
+NEGATIVE_TIMEOUT = getattr(settings, "REFERRAL_CODE_NEGATIVE_TIMEOUT", 60)
+LOCAL_TTL = getattr(settings, "REFERRAL_CODE_LOCAL_TTL", 15)
+LOCAL_SIZE = getattr(settings, "REFERRAL_CODE_LOCAL_SIZE", 10000)
+
+UNKNOWN = "unknown"  # shared cache marker for codes that do not exist
+_ABSENT = object()
+
+
+@dataclass(frozen=True)
+class ReferralSnapshot:
+    """What the funnel needs to know about a referral code. Treat as read-only."""
+    referral_code: str
+    referral_link: str
+    deal_id: str
+    deal_name: str
+    deal_description: str
+    customer_incentive: Optional[Decimal]
+    business_id: int
+    business_stripe_account_id: Optional[str]
+    referrer_id: str
+    referrer_stripe_account_id: Optional[str]
+    # Serialized sections of the verify response
+    deal: dict
+    business: dict
+    referrer: dict
+    namespaces: tuple
+    versions: tuple
+
+    def verify_payload(self):
+        return {
+            "referral_code": self.referral_code,
+            "referral_link": self.referral_link,
+            "deal": self.deal,
+            "business": self.business,
+            "referrer": self.referrer,
+        }
+
+
+class LocalLRU:
+    """Thread-safe LRU with a per-entry TTL"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _ABSENT
+            expires_at, value = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return _ABSENT
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local = LocalLRU(LOCAL_SIZE, LOCAL_TTL)
+
+
+def _cache_key(code):
+    return f"refcode:{code}"
+
+
+def resolve(code, local=True):
+    """
+    ReferralSnapshot for a (normalized) referral code, or None if there is
+    no such code. local=False skips the in-process tier.
+    """
+    if not code:
+        return None
+    if local:
+        snapshot = _local.get(code)
+        if snapshot is not _ABSENT:
+            return snapshot
+
+    snapshot = _resolve_shared(code)
+    _local.set(code, snapshot)
+    return snapshot
+
+
+def _resolve_shared(code):
+    key = _cache_key(code)
+    try:
+        entry = cache.get(key)
+        if entry == UNKNOWN:
+            count(deal_cache.REFERRAL_CODE, "hit")
+            return None
+        if entry is not None:
+            if tuple(namespace_versions(entry.namespaces)) == entry.versions:
+                count(deal_cache.REFERRAL_CODE, "hit")
+                return entry
+            count(deal_cache.REFERRAL_CODE, "stale")
+        else:
+            count(deal_cache.REFERRAL_CODE, "miss")
+    except Exception as e:
+        logger.warning(f"Cache unavailable for referral codes, serving from database: {str(e)}")
+        return _load(code, versioned=False)
+
+    snapshot = _load(code)
+    try:
+        if snapshot is None:
+            cache.set(key, UNKNOWN, NEGATIVE_TIMEOUT)
+        else:
+            cache.set(key, snapshot, TIMEOUT)
+    except Exception as e:
+        logger.warning(f"Failed to cache referral code {code}: {str(e)}")
+    return snapshot
+
+
+def _load(code, versioned=True):
+    sub = ReferralSubscription.objects.select_related(
+        "deal", "referrer", "deal__business"
+    ).filter(referral_code=code).first()
+    if sub is None:
+        return None
+
+    deal, business, referrer = sub.deal, sub.deal.business, sub.referrer
+    namespaces = (
+        deal_cache.deal_namespace(deal.id),
+        deal_cache.business_namespace(business.id),
+        deal_cache.user_namespace(referrer.id),
+    )
+    return ReferralSnapshot(
+        referral_code=sub.referral_code,
+        referral_link=sub.referral_link,
+        deal_id=str(deal.id),
+        deal_name=deal.deal_name,
+        deal_description=deal.deal_description,
+        customer_incentive=deal.customer_incentive,
+        business_id=business.id,
+        business_stripe_account_id=business.stripe_account_id,
+        referrer_id=str(referrer.id),
+        referrer_stripe_account_id=referrer.stripe_account_id,
+        deal=DealSerializer(deal).data,
+        business=BusinessResponseSerializer(business).data,
+        referrer=UserProfileSerializer(referrer).data,
+        namespaces=namespaces,
+        versions=tuple(namespace_versions(namespaces)) if versioned else (),
+    )
+
+
+def forget(code):
+    """Drop a code from both tiers of this process (e.g. a cached "unknown")"""
+    _local.discard(code)
+    try:
+        cache.delete(_cache_key(code))
+    except Exception as e:
+        logger.error(f"Failed to forget referral code {code}: {str(e)}")
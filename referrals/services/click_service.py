@@ -0,0 +1,216 @@
+"""
+Referral link clicks are recorded without touching Postgres in the request:
+each click is deduplicated per visitor and time window in the cache, then
+pushed to a buffer. Batches are written later with bulk_create, together
+with the per-code counters (ReferralSubscription.clicks_count) and the
+daily deal stats that the read paths use.
+
+Buffers (settings.CLICK_BUFFER):
+  * "redis": a Redis list shared by all processes, flushed by the
+    flush_clicks beat task;
+  * "local": an in-process ring buffer for single process setups and
+    tests, flushed by the process that records the clicks.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.throttling import BaseThrottle
+
+from deals.models import Deal
+from deals.services.stats_service import StatsService
+from referrals.models import ReferralClick
+
+logger = logging.getLogger(__name__)
+
+BUFFER_KEY = "clicks:buffer"
+
+ADD_CLICK_COUNTS_SQL = """
+    UPDATE referrals_referralsubscription AS s
+    SET clicks_count = s.clicks_count + v.clicks
+    FROM (VALUES {values}) AS v(referral_code, clicks)
+    WHERE s.referral_code = v.referral_code
+"""
+
+
+class RedisClickBuffer:
+    flush_inline = False
+
+    def _redis(self):
+        from django_redis import get_redis_connection
+
+        return get_redis_connection("default")
+
+    def push(self, items):
+        self._redis().rpush(BUFFER_KEY, *items)
+
+    def pop(self, count):
+        pipe = self._redis().pipeline(transaction=True)
+        pipe.lrange(BUFFER_KEY, 0, count - 1)
+        pipe.ltrim(BUFFER_KEY, count, -1)
+        items, _ = pipe.execute()
+        return [item.decode() if isinstance(item, bytes) else item for item in items]
+
+    def push_back(self, items):
+        self._redis().lpush(BUFFER_KEY, *reversed(items))
+
+    def due(self):
+        return False
+
+
+class LocalClickBuffer:
+    """Keeps the newest `size` clicks; older ones are dropped if flushing falls behind"""
+    flush_inline = True
+
+    def __init__(self, size):
+        self._items = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def push(self, items):
+        with self._lock:
+            self._items.extend(items)
+
+    def pop(self, count):
+        with self._lock:
+            self._last_flush = time.monotonic()
+            return [self._items.popleft() for _ in range(min(count, len(self._items)))]
+
+    def push_back(self, items):
+        with self._lock:
+            self._items.extendleft(reversed(items))
+
+    def due(self):
+        with self._lock:
+            return bool(self._items) and (
+                len(self._items) >= settings.CLICK_FLUSH_BATCH
+                or time.monotonic() - self._last_flush >= settings.CLICK_FLUSH_INTERVAL
+            )
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+_local = LocalClickBuffer(settings.CLICK_LOCAL_BUFFER_SIZE)
+
+
+def get_buffer():
+    return _local if settings.CLICK_BUFFER == "local" else RedisClickBuffer()
+
+
+def _hash(value, size):
+    return hashlib.blake2b(value.encode(), key=settings.SECRET_KEY.encode()[:64], digest_size=size).hexdigest()
+
+
+def _client_ip(request):
+    # Same proxy aware address (NUM_PROXIES) as the throttles and rate limits
+    return BaseThrottle().get_ident(request)
+
+
+class ClickService:
+    @staticmethod
+    def record(snapshot, request):
+        """
+        Buffer a click on `snapshot`'s referral link. Returns False if the
+        visitor already clicked it within CLICK_DEDUP_WINDOW.
+        """
+        user_agent = request.META.get("HTTP_USER_AGENT", "")
+        visitor = _hash(f"{_client_ip(request)}|{user_agent}", 16)
+        try:
+            if not cache.add(f"clicks:seen:{snapshot.referral_code}:{visitor}", 1, settings.CLICK_DEDUP_WINDOW):
+                return False
+        except Exception as e:
+            logger.warning(f"Cache unavailable for click deduplication: {str(e)}")
+
+        click = json.dumps({
+            "referral_code": snapshot.referral_code,
+            "deal_id": snapshot.deal_id,
+            "clicked_at": timezone.now().isoformat(),
+            "visitor_hash": visitor,
+            "ua_hash": _hash(user_agent, 8),
+            "referer": request.META.get("HTTP_REFERER", "")[:500],
+        })
+        buffer = get_buffer()
+        try:
+            buffer.push([click])
+        except Exception as e:
+            logger.error(f"Failed to buffer click on {snapshot.referral_code}: {str(e)}")
+            return False
+        if buffer.flush_inline and buffer.due():
+            try:
+                ClickService.flush(max_batches=1)
+            except Exception as e:
+                logger.error(f"Failed to flush clicks: {str(e)}")
+        return True
+
+    @staticmethod
+    def flush(max_batches=None):
+        """
+        Write buffered clicks in batches of CLICK_FLUSH_BATCH until the
+        buffer is empty (or after `max_batches`). A batch that fails to
+        write goes back to the buffer. Returns the number of clicks written.
+        """
+        buffer = get_buffer()
+        max_batches = max_batches or settings.CLICK_FLUSH_MAX_BATCHES
+        written = 0
+        for _ in range(max_batches):
+            items = buffer.pop(settings.CLICK_FLUSH_BATCH)
+            if not items:
+                break
+            try:
+                written += ClickService._write([json.loads(item) for item in items])
+            except Exception:
+                buffer.push_back(items)
+                raise
+        return written
+
+    @staticmethod
+    @transaction.atomic
+    def _write(clicks):
+        deal_ids = {click["deal_id"] for click in clicks}
+        existing = {str(deal_id) for deal_id in Deal.objects.filter(id__in=deal_ids).values_list("id", flat=True)}
+        clicks = [click for click in clicks if click["deal_id"] in existing]
+        if not clicks:
+            return 0
+
+        rows = [
+            ReferralClick(
+                referral_code=click["referral_code"],
+                deal_id=click["deal_id"],
+                clicked_at=parse_datetime(click["clicked_at"]),
+                visitor_hash=click["visitor_hash"],
+                ua_hash=click["ua_hash"],
+                referer=click["referer"],
+            )
+            for click in clicks
+        ]
+        ReferralClick.objects.bulk_create(rows, batch_size=1000)
+
+        per_code = {}
+        for row in rows:
+            per_code[row.referral_code] = per_code.get(row.referral_code, 0) + 1
+        params = []
+        for code in sorted(per_code):
+            params += [code, per_code[code]]
+        with connection.cursor() as cursor:
+            cursor.execute(ADD_CLICK_COUNTS_SQL.format(values=", ".join(["(%s, %s)"] * len(per_code))), params)
+
+        StatsService.apply([
+            {
+                "deal_id": str(row.deal_id),
+                "metric": "clicks",
+                "value": 1,
+                "date": timezone.localdate(row.clicked_at).isoformat(),
+            }
+            for row in rows
+        ])
+        return len(rows)
@@ -0,0 +1,74 @@
+import hashlib
+
+from django.conf import settings
+from django.db import connection
+
+# Crockford base32: no I, L, O or U, so codes survive being read aloud or retyped
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+ALIASES = str.maketrans({"O": "0", "I": "1", "L": "1"})
+
+CODE_LENGTH = 10  # legacy random codes are 8 characters, so the two never collide
+HALF_BITS = CODE_LENGTH * 5 // 2
+HALF_MASK = (1 << HALF_BITS) - 1
+MAX_SEQUENCE = 1 << (HALF_BITS * 2)
+ROUNDS = 4
+
+SEQUENCE_NAME = "referral_code_seq"
+
+
+class ReferralCodeService:
+    """
+    Referral codes are allocated from a Postgres sequence, so every code
+    comes from a distinct integer without a uniqueness check or a retry. The
+    integer goes through a keyed Feistel network, a bijection on 50 bits,
+    so consecutive codes look unrelated. The result is then base32 encoded
+    to a fixed 10 characters.
+
+    REFERRAL_CODE_KEY must never change once codes have been issued:
+    codes made under another key could collide with the existing ones.
+    """
+
+    @staticmethod
+    def allocate():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT nextval(%s)", [SEQUENCE_NAME])
+            value = cursor.fetchone()[0]
+        return ReferralCodeService.encode(ReferralCodeService.permute(value))
+
+    @staticmethod
+    def normalize(code):
+        """
+        Canonical form of user-typed input, so lookups stay exact matches on
+        the unique index. Legacy 8-character codes may legitimately contain
+        O, I or L and are only uppercased.
+        """
+        code = (code or "").strip().upper()
+        if len(code) == CODE_LENGTH:
+            code = code.translate(ALIASES)
+        return code
+
+    @staticmethod
+    def permute(value):
+        if not 0 <= value < MAX_SEQUENCE:
+            raise ValueError(f"Referral code sequence exhausted at {value}")
+        left, right = value >> HALF_BITS, value & HALF_MASK
+        for round_number in range(ROUNDS):
+            left, right = right, left ^ ReferralCodeService._round(round_number, right)
+        return (left << HALF_BITS) | right
+
+    @staticmethod
+    def encode(value):
+        chars = []
+        for _ in range(CODE_LENGTH):
+            value, index = divmod(value, 32)
+            chars.append(ALPHABET[index])
+        return "".join(reversed(chars))
+
+    @staticmethod
+    def _round(round_number, half):
+        digest = hashlib.blake2b(
+            f"{round_number}:{half}".encode(),
+            key=settings.REFERRAL_CODE_KEY.encode()[:64],
+            digest_size=8,
+        ).digest()
+        return int.from_bytes(digest, "big") & HALF_MASK
@@ -0,0 +1,185 @@
+"""
+Streaming exports of a business's subscribers, referrals and ledger entries.
+
+Rows are read through a server-side cursor (.iterator(chunk_size=...)) and
+encoded as they arrive, so memory stays flat whatever the number of rows.
+Exports are ordered by (created_at, id) and every row carries a `cursor`
+column: passing the last one received back as ?cursor= resumes an
+interrupted export right after that row.
+
+Formats:
+  * "csv": header line, then one line per row;
+  * "ndjson": one JSON object per row;
+  * "columns": column-major row groups, one JSON line each: a first line
+    {"columns": [...]}, then {"rows": n, "data": {column: [values]}} per
+    chunk of rows, so consumers can load whole columns at a time.
+"""
+import csv
+import datetime
+import json
+import uuid
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Subquery
+
+from deals.pagination import DealKeysetPagination
+from referrals.models import LedgerEntry, Referral, ReferralSubscription
+from referrals.services.ledger_service import LedgerService, business_revenue_account
+
+EXPORT_ORDERING = ("created_at", "id")
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "columns": ("application/x-ndjson", "columns.ndjson"),
+}
+
+
+def _cents(field):
+    return lambda row: LedgerService.to_amount(row[field])
+
+
+# Dataset: (queryset(business_id), [(column, row key or callable)])
+def _subscribers(business_id):
+    return ReferralSubscription.objects.filter(deal__business_id=business_id).values(
+        "id", "created_at", "referral_code", "referral_link", "clicks_count", "deal_id", "deal__deal_name",
+        "referrer_id", "referrer__email", "referrer__first_name", "referrer__last_name",
+    ).annotate(
+        commission_cents=LedgerService.commission_balance(),
+        revenue_cents=LedgerService.revenue_balance(),
+    )
+
+
+def _referrals(business_id):
+    return Referral.objects.filter(deal__business_id=business_id).values(
+        "id", "created_at", "deal_id", "referrer_id", "referred_email", "referred_name", "status",
+        "referral_code", "commission_earned", "conversion_date",
+    )
+
+
+def _ledger(business_id):
+    # Whole transactions touching the business, i.e. with its revenue share
+    transactions = LedgerEntry.objects.filter(rollup=business_revenue_account(business_id)).values("transaction_id")
+    return LedgerEntry.objects.filter(transaction_id__in=Subquery(transactions)).values(
+        "id", "created_at", "transaction_id", "account", "amount", "currency",
+    )
+
+
+DATASETS = {
+    "subscribers": (_subscribers, [
+        ("subscription_id", "id"),
+        ("created_at", "created_at"),
+        ("referral_code", "referral_code"),
+        ("referral_link", "referral_link"),
+        ("clicks", "clicks_count"),
+        ("deal_id", "deal_id"),
+        ("deal_name", "deal__deal_name"),
+        ("referrer_id", "referrer_id"),
+        ("referrer_email", "referrer__email"),
+        ("referrer_first_name", "referrer__first_name"),
+        ("referrer_last_name", "referrer__last_name"),
+        ("commission_earned", _cents("commission_cents")),
+        ("business_revenue", _cents("revenue_cents")),
+    ]),
+    "referrals": (_referrals, [
+        ("referral_id", "id"),
+        ("created_at", "created_at"),
+        ("deal_id", "deal_id"),
+        ("referrer_id", "referrer_id"),
+        ("referred_email", "referred_email"),
+        ("referred_name", "referred_name"),
+        ("status", "status"),
+        ("referral_code", "referral_code"),
+        ("commission_earned", "commission_earned"),
+        ("conversion_date", "conversion_date"),
+    ]),
+    "ledger": (_ledger, [
+        ("entry_id", "id"),
+        ("created_at", "created_at"),
+        ("transaction_id", "transaction_id"),
+        ("account", "account"),
+        ("amount", _cents("amount")),
+        ("currency", "currency"),
+    ]),
+}
+
+
+def _plain(value):
+    """Values as JSON/CSV friendly scalars; amounts stay exact as strings"""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, (uuid.UUID, Decimal)):
+        return str(value)
+    return value
+
+
+class _Echo:
+    """File-like object handing back what csv.writer writes"""
+
+    def write(self, value):
+        return value
+
+
+class ExportService:
+    @staticmethod
+    def paginator():
+        return DealKeysetPagination(ordering=EXPORT_ORDERING)
+
+    @staticmethod
+    def queryset(dataset, business_id, start=None, end=None, position=None):
+        """
+        Rows of `dataset` created in [start, end), after the decoded cursor
+        `position` if given. Built eagerly, so a cursor whose values don't
+        fit the ordered fields raises ValueError before anything is streamed.
+        """
+        build, _ = DATASETS[dataset]
+        queryset = build(business_id).order_by(*EXPORT_ORDERING)
+        if start:
+            queryset = queryset.filter(created_at__gte=start)
+        if end:
+            queryset = queryset.filter(created_at__lt=end)
+        if position:
+            try:
+                queryset = queryset.filter(ExportService.paginator().build_position_filter(position))
+            except (ValidationError, TypeError, ValueError) as e:
+                raise ValueError(f"Invalid cursor: {str(e)}") from e
+        return queryset
+
+    @staticmethod
+    def rows(dataset, queryset):
+        """The rows of `queryset` (see queryset()) as (column, value) lists ending with the cursor"""
+        _, columns = DATASETS[dataset]
+        paginator = ExportService.paginator()
+        for row in queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+            values = [_plain(key(row) if callable(key) else row[key]) for _, key in columns]
+            yield values + [paginator.encode_cursor(row)]
+
+    @staticmethod
+    def columns(dataset):
+        return [name for name, _ in DATASETS[dataset][1]] + ["cursor"]
+
+    @staticmethod
+    def stream(dataset, output, rows):
+        """Encode `rows` of `dataset` in `output` format, a chunk of rows per yielded string"""
+        columns = ExportService.columns(dataset)
+        size = settings.EXPORT_CHUNK_SIZE
+        rows = iter(rows)
+
+        if output == "csv":
+            writer = csv.writer(_Echo())
+            yield writer.writerow(columns)
+            while chunk := list(islice(rows, size)):
+                yield "".join(writer.writerow(values) for values in chunk)
+        elif output == "ndjson":
+            while chunk := list(islice(rows, size)):
+                yield "".join(json.dumps(dict(zip(columns, values))) + "\n" for values in chunk)
+        elif output == "columns":
+            yield json.dumps({"columns": columns}) + "\n"
+            while chunk := list(islice(rows, size)):
+                data = {name: [values[index] for values in chunk] for index, name in enumerate(columns)}
+                yield json.dumps({"rows": len(chunk), "data": data}) + "\n"
+        else:
+            raise ValueError(f"Unknown export format {output}")
@@ -0,0 +1,159 @@
+from decimal import Decimal, ROUND_DOWN
+
+from django.db import connection, transaction
+from django.db.models import CharField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Concat
+from django.utils import timezone
+
+from referrals.models import LedgerBalance, LedgerEntry
+
+CURRENCY = "usd"
+CENT = Decimal("0.01")
+
+# Money received through Stripe Checkout, not yet attributed
+CLEARING_ACCOUNT = "stripe:clearing"
+
+UPSERT_BALANCES_SQL = """
+    INSERT INTO referrals_ledgerbalance (account, currency, balance, updated_at)
+    VALUES {values}
+    ON CONFLICT (account, currency) DO UPDATE
+    SET balance = referrals_ledgerbalance.balance + EXCLUDED.balance, updated_at = EXCLUDED.updated_at
+"""
+
+RECONCILE_BALANCES_SQL = """
+    WITH totals AS (
+        SELECT account, currency, SUM(amount) AS total
+        FROM referrals_ledgerentry GROUP BY account, currency
+        UNION ALL
+        SELECT rollup, currency, SUM(amount) AS total
+        FROM referrals_ledgerentry WHERE rollup <> '' GROUP BY rollup, currency
+    )
+    INSERT INTO referrals_ledgerbalance (account, currency, balance, updated_at)
+    SELECT account, currency, total, NOW() FROM totals
+    ON CONFLICT (account, currency) DO UPDATE
+    SET balance = EXCLUDED.balance, updated_at = EXCLUDED.updated_at
+    WHERE referrals_ledgerbalance.balance <> EXCLUDED.balance
+"""
+
+
+# ---------------------------
+# ACCOUNTS
+# ---------------------------
+# Per subscription (deal + referrer) accounts for what the referrer earned
+# and what the business took in, each rolled up per referrer / business.
+
+def commission_account(deal_id, referrer_id):
+    return f"commission:deal:{deal_id}:referrer:{referrer_id}"
+
+
+def revenue_account(deal_id, referrer_id):
+    return f"revenue:deal:{deal_id}:referrer:{referrer_id}"
+
+
+def referrer_commission_account(referrer_id):
+    return f"commission:referrer:{referrer_id}"
+
+
+def business_revenue_account(business_id):
+    return f"revenue:business:{business_id}"
+
+
+class LedgerService:
+    @staticmethod
+    def split(amount, commission_percent):
+        """
+        (business_cut, referrer_cut) of `amount` cents. The commission is
+        rounded down to the cent, so the referrer never gets more than the
+        deal's rate and the two cuts always add up to the amount.
+        """
+        rate = Decimal(commission_percent or 0) / 100
+        referrer_cut = int((Decimal(amount) * rate).to_integral_value(rounding=ROUND_DOWN))
+        referrer_cut = min(max(referrer_cut, 0), amount)
+        return amount - referrer_cut, referrer_cut
+
+    @staticmethod
+    def record_payment(transaction_id, snapshot, amount, split, currency=CURRENCY):
+        """Post a successful referral payment of `amount` cents split as `split`"""
+        business_cut, referrer_cut = split
+        deal_id, referrer_id = snapshot.deal_id, snapshot.referrer_id
+        return LedgerService.post(transaction_id, [
+            (CLEARING_ACCOUNT, "", -amount),
+            (revenue_account(deal_id, referrer_id), business_revenue_account(snapshot.business_id), business_cut),
+            (commission_account(deal_id, referrer_id), referrer_commission_account(referrer_id), referrer_cut),
+        ], currency)
+
+    @staticmethod
+    @transaction.atomic
+    def post(transaction_id, lines, currency=CURRENCY):
+        """
+        Append a transaction made of (account, rollup, amount) lines and
+        apply it to the balances. Returns False if it was already posted.
+        """
+        lines = [line for line in lines if line[2]]
+        if sum(amount for _, _, amount in lines):
+            raise ValueError(f"Ledger transaction {transaction_id} does not balance")
+        if LedgerEntry.objects.filter(transaction_id=transaction_id).exists():
+            return False
+
+        LedgerEntry.objects.bulk_create([
+            LedgerEntry(transaction_id=transaction_id, account=account, rollup=rollup, amount=amount, currency=currency)
+            for account, rollup, amount in lines
+        ])
+
+        deltas = {}
+        for account, rollup, amount in lines:
+            for key in filter(None, (account, rollup)):
+                deltas[key] = deltas.get(key, 0) + amount
+        # Sorted, so concurrent postings lock balance rows in the same order
+        now = timezone.now()
+        params = []
+        for account in sorted(deltas):
+            params += [account, currency, deltas[account], now]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                UPSERT_BALANCES_SQL.format(values=", ".join(["(%s, %s, %s, %s)"] * len(deltas))), params
+            )
+        return True
+
+    @staticmethod
+    def rebuild_balances():
+        """Recompute every balance from the entries; returns the number of rows fixed"""
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(RECONCILE_BALANCES_SQL)
+            return cursor.rowcount
+
+    @staticmethod
+    def to_amount(cents):
+        """Cents to a Decimal currency amount"""
+        return (Decimal(cents or 0) / 100).quantize(CENT)
+
+    @staticmethod
+    def balance(*parts, currency=CURRENCY):
+        """
+        Subquery for the balance (in cents, 0 if none) of the account named
+        by concatenating `parts`: strings, or OuterRef()s into the outer query.
+        """
+        account = Concat(*(
+            Value(part) if isinstance(part, str) else Cast(part, output_field=CharField())
+            for part in parts
+        ))
+        balances = LedgerBalance.objects.filter(account=account, currency=currency).values("balance")[:1]
+        return Coalesce(Subquery(balances), 0)
+
+    @staticmethod
+    def commission_balance(deal_field="deal_id", referrer_field="referrer_id"):
+        """Subscription commission balance, for annotating subscription querysets"""
+        return LedgerService.balance("commission:deal:", OuterRef(deal_field), ":referrer:", OuterRef(referrer_field))
+
+    @staticmethod
+    def revenue_balance(deal_field="deal_id", referrer_field="referrer_id"):
+        """Subscription revenue balance, for annotating subscription querysets"""
+        return LedgerService.balance("revenue:deal:", OuterRef(deal_field), ":referrer:", OuterRef(referrer_field))
+
+    @staticmethod
+    def referrer_commission_balance(referrer_field="id"):
+        return LedgerService.balance("commission:referrer:", OuterRef(referrer_field))
+
+    @staticmethod
+    def business_revenue_balance(business_field="id"):
+        return LedgerService.balance("revenue:business:", OuterRef(business_field))
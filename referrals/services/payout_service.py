@@ -0,0 +1,204 @@
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from referrals.models import PayoutBatch, PayoutEntry, Referral
+from referrals.services.stripe_gateway import get_gateway
+
+logger = logging.getLogger(__name__)
+
+# A worker that died mid-transfer leaves the batch in "processing"; reclaim after this
+PROCESSING_TIMEOUT = timedelta(minutes=10)
+
+
+class PayoutService:
+    """
+    Payments no longer trigger transfers directly. Each successful payment
+    writes PayoutEntry rows, and run_payouts periodically cuts one
+    PayoutBatch per destination account and currency out of the pending
+    entries and pays it with a single Stripe transfer.
+    """
+
+    @staticmethod
+    @transaction.atomic
+    def record_payment(event_id, snapshot, split, currency="usd", payer_email=""):
+        """
+        Write the payout entries for a successful referral payment, `split`
+        being the (business_cut, referrer_cut) in cents. Safe to call again
+        for the same event.
+        """
+        business_cut, referrer_cut = split
+
+        # Referrals are keyed on the payer's email; without one the entries stand alone
+        # rather than being merged into (and notifying) a single blank referral
+        referral = None
+        if payer_email:
+            referral, _ = Referral.objects.get_or_create(
+                deal_id=snapshot.deal_id,
+                referrer_id=snapshot.referrer_id,
+                referred_email=payer_email,
+                defaults={"status": "confirmed", "conversion_date": timezone.now()},
+            )
+
+        shares = (
+            (PayoutEntry.ROLE_BUSINESS, snapshot.business_stripe_account_id, business_cut),
+            (PayoutEntry.ROLE_REFERRER, snapshot.referrer_stripe_account_id, referrer_cut),
+        )
+        entries = []
+        for role, destination, share in shares:
+            if share <= 0:
+                continue
+            if not destination:
+                logger.warning(f"No Stripe account for the {role} of {event_id}, {share} cents not paid out")
+                continue
+            entry, _ = PayoutEntry.objects.get_or_create(
+                event_id=event_id,
+                role=role,
+                defaults={
+                    "referral": referral,
+                    "destination": destination,
+                    "currency": currency,
+                    "amount": share,
+                },
+            )
+            entries.append(entry)
+        return entries
+
+    @staticmethod
+    @transaction.atomic
+    def create_batches():
+        """Move pending entries into one new batch per destination and currency"""
+        entries = list(
+            PayoutEntry.objects.select_for_update(skip_locked=True)
+            .filter(status=PayoutEntry.STATUS_PENDING)
+            .only("id", "destination", "currency", "amount")
+        )
+        groups = {}
+        for entry in entries:
+            groups.setdefault((entry.destination, entry.currency), []).append(entry)
+
+        batches = []
+        for (destination, currency), group in groups.items():
+            batch = PayoutBatch.objects.create(
+                destination=destination,
+                currency=currency,
+                amount=sum(entry.amount for entry in group),
+            )
+            PayoutEntry.objects.filter(id__in=[entry.id for entry in group]).update(
+                status=PayoutEntry.STATUS_BATCHED, batch=batch
+            )
+            batches.append(batch)
+        return batches
+
+    @staticmethod
+    def due_batches():
+        now = timezone.now()
+        return PayoutBatch.objects.filter(
+            Q(status=PayoutBatch.STATUS_PENDING)
+            | Q(status=PayoutBatch.STATUS_FAILED, next_attempt_at__lte=now)
+            | Q(status=PayoutBatch.STATUS_PROCESSING, claimed_at__lt=now - PROCESSING_TIMEOUT)
+        )
+
+    @staticmethod
+    def claim(batch_id):
+        """Move a due batch to processing; False if it is not due or another worker has it"""
+        return PayoutService.due_batches().filter(id=batch_id).update(
+            status=PayoutBatch.STATUS_PROCESSING,
+            attempts=F("attempts") + 1,
+            claimed_at=timezone.now(),
+        ) == 1
+
+    @staticmethod
+    def send_batch(batch_id):
+        """
+        Transfer a claimed batch. Failures are retried by later runs with
+        exponential backoff, under the same idempotency key, until
+        PAYOUT_MAX_ATTEMPTS; then the batch is dead-lettered for a person
+        to look at. Returns the resulting status, or None if not claimable.
+        """
+        if not PayoutService.claim(batch_id):
+            return None
+
+        batch = PayoutBatch.objects.get(id=batch_id)
+        try:
+            transfer = get_gateway().create_transfer(
+                amount=batch.amount,
+                currency=batch.currency,
+                destination=batch.destination,
+                idempotency_key=batch.idempotency_key,
+                metadata={"payout_batch": str(batch.id)},
+            )
+        except Exception as e:
+            logger.error(f"Payout batch {batch.id} failed (attempt {batch.attempts}): {str(e)}")
+            batch.last_error = str(e)
+            if batch.attempts >= settings.PAYOUT_MAX_ATTEMPTS:
+                batch.status = PayoutBatch.STATUS_DEAD_LETTER
+                batch.next_attempt_at = None
+            else:
+                batch.status = PayoutBatch.STATUS_FAILED
+                backoff = settings.PAYOUT_RETRY_BACKOFF * (2 ** (batch.attempts - 1))
+                batch.next_attempt_at = timezone.now() + timedelta(seconds=backoff)
+            batch.save(update_fields=["status", "last_error", "next_attempt_at"])
+            return batch.status
+
+        PayoutService._mark_paid(batch, transfer["id"])
+        return batch.status
+
+    @staticmethod
+    def run():
+        """Cut new batches and send every due one. Returns {status: count}"""
+        PayoutService.create_batches()
+        results = {}
+        for batch_id in PayoutService.due_batches().values_list("id", flat=True):
+            status = PayoutService.send_batch(batch_id)
+            if status:
+                results[status] = results.get(status, 0) + 1
+        return results
+
+    @staticmethod
+    def retry(queryset):
+        """Make failed or dead-lettered batches due again with a fresh attempt budget"""
+        return queryset.filter(
+            status__in=[PayoutBatch.STATUS_FAILED, PayoutBatch.STATUS_DEAD_LETTER]
+        ).update(status=PayoutBatch.STATUS_PENDING, attempts=0, next_attempt_at=None, claimed_at=None)
+
+    @staticmethod
+    @transaction.atomic
+    def _mark_paid(batch, transfer_id):
+        batch.status = PayoutBatch.STATUS_PAID
+        batch.transfer_id = transfer_id
+        batch.last_error = ""
+        batch.next_attempt_at = None
+        batch.paid_at = timezone.now()
+        batch.save(update_fields=["status", "transfer_id", "last_error", "next_attempt_at", "paid_at"])
+        batch.entries.update(status=PayoutEntry.STATUS_PAID)
+
+        referral_ids = batch.entries.filter(
+            role=PayoutEntry.ROLE_REFERRER, referral__isnull=False
+        ).values_list("referral_id", flat=True)
+        PayoutService.update_referrals(referral_ids)
+
+    @staticmethod
+    def update_referrals(referral_ids):
+        """
+        Derive Referral.commission_earned (paid referrer entries) and mark
+        the referral paid once none of its referrer entries are outstanding
+        """
+        totals = (
+            PayoutEntry.objects.filter(referral_id__in=list(referral_ids), role=PayoutEntry.ROLE_REFERRER)
+            .values("referral_id")
+            .annotate(
+                paid=Sum("amount", filter=Q(status=PayoutEntry.STATUS_PAID)),
+                outstanding=Count("id", filter=~Q(status=PayoutEntry.STATUS_PAID)),
+            )
+        )
+        for row in totals:
+            changes = {"commission_earned": Decimal(row["paid"] or 0) / 100}
+            if not row["outstanding"]:
+                changes["status"] = "paid"
+            Referral.objects.filter(id=row["referral_id"]).update(**changes)
@@ -1,6 +1,53 @@
-from django.db import transaction
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 
+from accounts.models import Business
+from deals.models import Deal
 from referrals.models import ReferralSubscription
+from referrals.services.ledger_service import LedgerService
+
+DEAL_FIELDS = ("deal_name", "deal_description", "reward_type", "customer_incentive", "no_reward_reason")
+REFERRER_FIELDS = ("email", "first_name", "last_name", "phone_number")
+RECONCILE_DEAL_COUNTS_SQL = """
+    UPDATE deals_deal AS d SET subscribers_count = c.total
+    FROM (
+        SELECT d2.id, COUNT(s.id) AS total
+        FROM deals_deal d2
+        LEFT JOIN referrals_referralsubscription s ON s.deal_id = d2.id
+        GROUP BY d2.id
+    ) AS c
+    WHERE c.id = d.id AND d.subscribers_count <> c.total
+"""
+
+RECONCILE_BUSINESS_COUNTS_SQL = """
+    UPDATE accounts_business AS b SET subscribers_count = c.total
+    FROM (
+        SELECT b2.id, COUNT(s.id) AS total
+        FROM accounts_business b2
+        LEFT JOIN deals_deal d ON d.business_id = b2.id
+        LEFT JOIN referrals_referralsubscription s ON s.deal_id = d.id
+        GROUP BY b2.id
+    ) AS c
+    WHERE c.id = b.id AND b.subscribers_count <> c.total
+"""
+
+BUSINESS_FIELDS = {
+    "business_name": "business_name",
+    "industry": "industry",
+    "website": "website",
+    "description": "description",
+    "logo_url": "business_logo_url",
+    "cover_url": "business_cover_url",
+    "is_verified": "is_verified",
+    "address": "business_address",
+    "city": "business_city",
+    "state": "business_state",
+    "country": "business_country",
+    "registration_no": "registration_no",
+    "phone_number": "business_phone",
+    "email": "business_email",
+}
 
 
 class ReferralService:
@@ -25,4 +72,113 @@ class ReferralService:
         if subscription:
             subscription.delete()
             return True
-        return False
\ No newline at end of file
+        return False
+
+    # ---------------------------
+    # SUBSCRIBER COUNTERS
+    # ---------------------------
+    @staticmethod
+    def adjust_subscriber_counts(deal_id, delta):
+        """
+        Apply a subscription change to the deal's and its business's stored
+        counters. Runs from the ReferralSubscription save/delete signals, i.e.
+        in the same transaction as the subscription row itself.
+        """
+        Deal.objects.filter(id=deal_id).update(
+            subscribers_count=Greatest(F("subscribers_count") + delta, 0)
+        )
+        Business.objects.filter(deals__id=deal_id).update(
+            subscribers_count=Greatest(F("subscribers_count") + delta, 0)
+        )
+
+    @staticmethod
+    def rebuild_subscriber_counts():
+        """
+        Recount every deal and business from ReferralSubscription and fix the
+        counters that drifted (raw SQL writes, manual edits...). Returns
+        (deals_fixed, businesses_fixed).
+        """
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(RECONCILE_DEAL_COUNTS_SQL)
+            deals_fixed = cursor.rowcount
+            cursor.execute(RECONCILE_BUSINESS_COUNTS_SQL)
+            businesses_fixed = cursor.rowcount
+        return deals_fixed, businesses_fixed
+
+    # ---------------------------
+    # SUBSCRIPTION LISTINGS
+    # ---------------------------
+    # Listings are built from one joined .values() query per page, rows are
+    # shaped into the nested response format without loading model instances.
+
+    @staticmethod
+    def business_subscribers(business):
+        """Subscriptions to any of the business's deals, with referrer and deal columns"""
+        return ReferralSubscription.objects.filter(deal__business=business).values(
+            "id", "referral_code", "referral_link", "clicks_count", "created_at", "referrer_id", "deal_id",
+            *(f"referrer__{field}" for field in REFERRER_FIELDS),
+            *(f"deal__{field}" for field in DEAL_FIELDS),
+        ).annotate(**ReferralService._earnings_annotations())
+
+    @staticmethod
+    def referrer_subscriptions(referrer):
+        """The referrer's subscriptions, with deal and business columns"""
+        return ReferralSubscription.objects.filter(referrer=referrer).values(
+            "id", "referral_code", "referral_link", "clicks_count", "created_at", "deal_id", "deal__business_id",
+            *(f"deal__{field}" for field in DEAL_FIELDS),
+            *(f"deal__business__{field}" for field in BUSINESS_FIELDS.values()),
+        ).annotate(**ReferralService._earnings_annotations())
+
+    @staticmethod
+    def _earnings_annotations():
+        # One lookup per row on the materialized ledger balances
+        return {
+            "commission_cents": LedgerService.commission_balance(),
+            "revenue_cents": LedgerService.revenue_balance(),
+        }
+
+    @staticmethod
+    def format_subscriber(row):
+        return {
+            **ReferralService._format_subscription(row),
+            "referrer": {
+                "id": str(row["referrer_id"]),
+                **{field: row[f"referrer__{field}"] for field in REFERRER_FIELDS},
+                "profile_image_url": None,
+            },
+            "deal": ReferralService._format_deal(row),
+            **ReferralService._earnings(row),
+        }
+
+    @staticmethod
+    def format_subscription(row):
+        return {
+            **ReferralService._format_subscription(row),
+            "deal": ReferralService._format_deal(row),
+            "business": {
+                "id": str(row["deal__business_id"]),
+                **{key: row[f"deal__business__{field}"] for key, field in BUSINESS_FIELDS.items()},
+            },
+            **ReferralService._earnings(row),
+        }
+
+    @staticmethod
+    def _format_subscription(row):
+        return {
+            "subscription_id": str(row["id"]),
+            "referral_code": row["referral_code"],
+            "referral_link": row["referral_link"],
+            "clicks": row["clicks_count"],
+        }
+
+    @staticmethod
+    def _format_deal(row):
+        return {"id": str(row["deal_id"]), **{field: row[f"deal__{field}"] for field in DEAL_FIELDS}}
+
+    @staticmethod
+    def _earnings(row):
+        return {
+            "commission_earned": LedgerService.to_amount(row["commission_cents"]),
+            "business_revenue": LedgerService.to_amount(row["revenue_cents"]),
+            "created_at": row["created_at"],
+        }
@@ -0,0 +1,128 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from accounts.models import User, Business
+from referrals.models import StripeAccountState
+from referrals.services.stripe_gateway import StripeUnavailableError, get_gateway
+
+logger = logging.getLogger(__name__)
+
+
+def _cache_key(account_id):
+    return f"stripe-account:{account_id}"
+
+
+class StripeAccountService:
+    """
+    Onboarding state of connected accounts, read from the cache and the
+    StripeAccountState table. Stripe itself is only asked when an account
+    has no local row yet (or a caller forces a refresh); the account.updated
+    webhook and the sync_stripe_accounts task keep the rows current.
+    """
+
+    @staticmethod
+    def get(account_id, refresh=False):
+        """
+        StripeAccountState for `account_id`. Returns None when the account
+        is unknown locally and Stripe cannot be reached; with refresh=True
+        the stored state is returned instead, if there is one.
+        """
+        if not refresh:
+            state = StripeAccountService._cached(account_id)
+            if state is not None:
+                return state
+        state = StripeAccountState.objects.filter(account_id=account_id).first()
+        if state is not None and not refresh:
+            StripeAccountService._cache(state)
+            return state
+
+        try:
+            account = get_gateway().retrieve_account(account_id)
+        except StripeUnavailableError as e:
+            logger.warning(f"Stripe unavailable for account {account_id}: {str(e)}")
+            return state
+        return StripeAccountService.record(account)
+
+    @staticmethod
+    @transaction.atomic
+    def record(account):
+        """Store the flags of a Stripe account object (API response or webhook payload)"""
+        state, _ = StripeAccountState.objects.update_or_create(
+            account_id=account["id"],
+            defaults={
+                "details_submitted": bool(account.get("details_submitted")),
+                "charges_enabled": bool(account.get("charges_enabled")),
+                "payouts_enabled": bool(account.get("payouts_enabled")),
+                "synced_at": timezone.now(),
+            },
+        )
+        if state.is_complete:
+            User.objects.filter(stripe_account_id=state.account_id, is_onboarding_completed=False).update(
+                is_onboarding_completed=True
+            )
+            Business.objects.filter(stripe_account_id=state.account_id, is_onboarding_completed=False).update(
+                is_onboarding_completed=True
+            )
+        transaction.on_commit(lambda: StripeAccountService._cache(state))
+        return state
+
+    @staticmethod
+    def sync(limit=None):
+        """
+        Refresh linked accounts that have no local state or whose state is
+        older than STRIPE_ACCOUNT_SYNC_MAX_AGE, oldest first. Stops early if
+        Stripe becomes unavailable. Returns the number of accounts refreshed.
+        """
+        limit = limit or settings.STRIPE_ACCOUNT_SYNC_BATCH
+        known = StripeAccountState.objects.values("account_id")
+        missing = list(
+            User.objects.exclude(Q(stripe_account_id__isnull=True) | Q(stripe_account_id=""))
+            .exclude(stripe_account_id__in=known)
+            .values_list("stripe_account_id", flat=True)[:limit]
+        )
+        missing += list(
+            Business.objects.exclude(Q(stripe_account_id__isnull=True) | Q(stripe_account_id=""))
+            .exclude(stripe_account_id__in=known)
+            .values_list("stripe_account_id", flat=True)[:limit - len(missing)]
+        )
+        cutoff = timezone.now() - timedelta(seconds=settings.STRIPE_ACCOUNT_SYNC_MAX_AGE)
+        stale = list(
+            StripeAccountState.objects.filter(synced_at__lt=cutoff)
+            .order_by("synced_at")
+            .values_list("account_id", flat=True)[:max(limit - len(missing), 0)]
+        )
+
+        gateway = get_gateway()
+        synced = 0
+        for account_id in dict.fromkeys(missing + stale):
+            try:
+                StripeAccountService.record(gateway.retrieve_account(account_id))
+            except StripeUnavailableError as e:
+                logger.warning(f"Stopping Stripe account sync after {synced} account(s): {str(e)}")
+                break
+            except Exception as e:
+                logger.error(f"Failed to sync Stripe account {account_id}: {str(e)}")
+                continue
+            synced += 1
+        return synced
+
+    @staticmethod
+    def _cached(account_id):
+        try:
+            return cache.get(_cache_key(account_id))
+        except Exception as e:
+            logger.warning(f"Cache unavailable for Stripe account {account_id}: {str(e)}")
+            return None
+
+    @staticmethod
+    def _cache(state):
+        try:
+            cache.set(_cache_key(state.account_id), state, settings.STRIPE_ACCOUNT_CACHE_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Failed to cache Stripe account {state.account_id}: {str(e)}")
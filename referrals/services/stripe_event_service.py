@@ -0,0 +1,165 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from deals.services.stats_service import StatsService
+from referrals import resolver
+from referrals.models import StripeEvent
+from referrals.services.ledger_service import LedgerService
+from referrals.services.payout_service import PayoutService
+from referrals.services.stripe_account_service import StripeAccountService
+
+logger = logging.getLogger(__name__)
+
+# A worker that died mid-event leaves it in "processing"; reclaim after this
+PROCESSING_TIMEOUT = timedelta(minutes=10)
+
+
+class UnprocessableEventError(Exception):
+    """The event can never succeed as-is (e.g. unknown referral code), do not retry"""
+
+
+class StripeEventService:
+    @staticmethod
+    @transaction.atomic
+    def receive(event):
+        """
+        Store a verified webhook event once and queue it for processing.
+        Redeliveries of an already stored event are acknowledged without
+        queueing it again, unless it never left the pending state.
+        """
+        stripe_event, created = StripeEvent.objects.get_or_create(
+            event_id=event["id"],
+            defaults={
+                "type": event["type"],
+                "payload": event,
+                "livemode": bool(event.get("livemode")),
+            },
+        )
+        if created or stripe_event.status == StripeEvent.STATUS_PENDING:
+            transaction.on_commit(lambda: StripeEventService.enqueue(stripe_event.event_id))
+        return stripe_event, created
+
+    @staticmethod
+    def enqueue(event_id):
+        from referrals.utils import process_stripe_event
+
+        try:
+            process_stripe_event.delay(event_id)
+        except Exception as e:
+            # The event stays pending and can be picked up with replay_stripe_events
+            logger.error(f"Failed to enqueue Stripe event {event_id}: {str(e)}")
+
+    @staticmethod
+    def claim(event_id):
+        """Move the event to processing; False if it is done or another worker has it"""
+        now = timezone.now()
+        claimable = Q(status__in=[StripeEvent.STATUS_PENDING, StripeEvent.STATUS_FAILED]) | Q(
+            status=StripeEvent.STATUS_PROCESSING, claimed_at__lt=now - PROCESSING_TIMEOUT
+        )
+        return StripeEvent.objects.filter(claimable, event_id=event_id).update(
+            status=StripeEvent.STATUS_PROCESSING,
+            attempts=F("attempts") + 1,
+            claimed_at=now,
+        ) == 1
+
+    @staticmethod
+    def process(event_id):
+        """
+        Run the handler for a stored event. Returns the resulting status, or
+        None if the event was not claimable. Retryable failures are re-raised
+        until STRIPE_EVENT_MAX_ATTEMPTS, after which the event is dead-lettered.
+        """
+        if not StripeEventService.claim(event_id):
+            return None
+
+        stripe_event = StripeEvent.objects.get(event_id=event_id)
+        handler = EVENT_HANDLERS.get(stripe_event.type)
+        if handler is None:
+            return StripeEventService._finish(
+                stripe_event, StripeEvent.STATUS_DEAD_LETTER, f"Unhandled event type {stripe_event.type}"
+            )
+
+        try:
+            handler(stripe_event)
+        except UnprocessableEventError as e:
+            return StripeEventService._finish(stripe_event, StripeEvent.STATUS_DEAD_LETTER, str(e))
+        except Exception as e:
+            logger.error(f"Stripe event {event_id} failed (attempt {stripe_event.attempts}): {str(e)}")
+            if stripe_event.attempts >= settings.STRIPE_EVENT_MAX_ATTEMPTS:
+                return StripeEventService._finish(stripe_event, StripeEvent.STATUS_DEAD_LETTER, str(e))
+            StripeEventService._finish(stripe_event, StripeEvent.STATUS_FAILED, str(e))
+            raise
+
+        return StripeEventService._finish(stripe_event, StripeEvent.STATUS_PROCESSED)
+
+    @staticmethod
+    def reset(queryset):
+        """Put the given events back to pending with a fresh attempt budget"""
+        event_ids = list(queryset.values_list("event_id", flat=True))
+        StripeEvent.objects.filter(event_id__in=event_ids).update(
+            status=StripeEvent.STATUS_PENDING, attempts=0, last_error="", claimed_at=None
+        )
+        return event_ids
+
+    @staticmethod
+    def replay(queryset):
+        """Reset the given events and queue them again"""
+        event_ids = StripeEventService.reset(queryset)
+        for event_id in event_ids:
+            StripeEventService.enqueue(event_id)
+        return event_ids
+
+    @staticmethod
+    def _finish(stripe_event, status, error=""):
+        stripe_event.status = status
+        stripe_event.last_error = error
+        stripe_event.processed_at = timezone.now() if status == StripeEvent.STATUS_PROCESSED else None
+        stripe_event.save(update_fields=["status", "last_error", "processed_at"])
+        return status
+
+    # ---------------------------
+    # EVENT HANDLERS
+    # ---------------------------
+    @staticmethod
+    def handle_account_updated(stripe_event):
+        StripeAccountService.record(stripe_event.payload["data"]["object"])
+
+    @staticmethod
+    def handle_payment_intent_succeeded(stripe_event):
+        intent = stripe_event.payload["data"]["object"]
+
+        referral_code = (intent.get("metadata") or {}).get("referral_code")
+        if not referral_code:
+            return  # not a referral payment, nothing to split
+        amount = intent["amount_received"]  # in cents
+
+        # Skip the per-process tier: payouts must see the latest accounts and rates
+        snapshot = resolver.resolve(referral_code, local=False)
+        if snapshot is None:
+            raise UnprocessableEventError(f"Unknown referral code {referral_code}")
+
+        currency = intent.get("currency") or "usd"
+        split = LedgerService.split(amount, snapshot.customer_incentive)
+        # Ledger and payout entries commit together; transfers are made by
+        # the payout batches, see PayoutService
+        with transaction.atomic():
+            if LedgerService.record_payment(stripe_event.event_id, snapshot, amount, split, currency):
+                StatsService.track(snapshot.deal_id, conversions=1, revenue=split[0])
+            PayoutService.record_payment(
+                stripe_event.event_id,
+                snapshot,
+                split,
+                currency=currency,
+                payer_email=intent.get("receipt_email") or "",
+            )
+
+
+EVENT_HANDLERS = {
+    "account.updated": StripeEventService.handle_account_updated,
+    "payment_intent.succeeded": StripeEventService.handle_payment_intent_succeeded,
+}
@@ -0,0 +1,168 @@
+"""
+Stripe API calls made by the account state lookups and the payout batches
+go through a gateway, so they get a short timeout and a circuit breaker and
+can be swapped for FakeStripeGateway (settings.STRIPE_GATEWAY) in tests and
+offline development.
+"""
+import logging
+
+import stripe
+from stripe._error import APIConnectionError, APIError, InvalidRequestError, RateLimitError
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Errors that say nothing about the request itself, only that Stripe is not answering
+UNAVAILABLE_ERRORS = (APIConnectionError, APIError, RateLimitError)
+
+
+class StripeUnavailableError(Exception):
+    """Stripe timed out, failed or the circuit is open; callers should fall back"""
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds, after which calls are let through again. State
+    lives in the shared cache so every process backs off together; if the
+    cache is down the breaker stays closed.
+    """
+
+    def __init__(self, name, threshold, reset_timeout):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+
+    @property
+    def _open_key(self):
+        return f"circuit:{self.name}:open"
+
+    @property
+    def _failures_key(self):
+        return f"circuit:{self.name}:failures"
+
+    def allow(self):
+        try:
+            return not cache.get(self._open_key)
+        except Exception as e:
+            logger.warning(f"Circuit {self.name} state unavailable: {str(e)}")
+            return True
+
+    def record_success(self):
+        try:
+            cache.delete(self._failures_key)
+        except Exception as e:
+            logger.warning(f"Circuit {self.name} state unavailable: {str(e)}")
+
+    def record_failure(self):
+        try:
+            cache.add(self._failures_key, 0, self.reset_timeout)
+            failures = cache.incr(self._failures_key)
+            if failures >= self.threshold:
+                cache.set(self._open_key, True, self.reset_timeout)
+                cache.delete(self._failures_key)
+                logger.error(f"Circuit {self.name} opened after {failures} failures")
+        except Exception as e:
+            logger.warning(f"Circuit {self.name} state unavailable: {str(e)}")
+
+
+breaker = CircuitBreaker(
+    "stripe",
+    threshold=settings.STRIPE_CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=settings.STRIPE_CIRCUIT_RESET_TIMEOUT,
+)
+
+_client = None
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = stripe.StripeClient(
+            settings.STRIPE_SECRET_KEY,
+            http_client=stripe.new_default_http_client(timeout=settings.STRIPE_API_TIMEOUT),
+            max_network_retries=0,
+        )
+    return _client
+
+
+def get_gateway():
+    return import_string(settings.STRIPE_GATEWAY)()
+
+
+class StripeGateway:
+    def retrieve_account(self, account_id):
+        return self._call(lambda: _get_client().v1.accounts.retrieve(account_id))
+
+    def create_transfer(self, amount, currency, destination, idempotency_key, **params):
+        return self._call(lambda: _get_client().v1.transfers.create(
+            {"amount": amount, "currency": currency, "destination": destination, **params},
+            {"idempotency_key": idempotency_key},
+        ))
+
+    def _call(self, request):
+        if not breaker.allow():
+            raise StripeUnavailableError("Stripe circuit is open")
+        try:
+            result = request()
+        except UNAVAILABLE_ERRORS as e:
+            breaker.record_failure()
+            raise StripeUnavailableError(str(e)) from e
+        breaker.record_success()
+        return result
+
+
+class FakeStripeGateway(StripeGateway):
+    """
+    In-memory Stripe for tests and offline development. Accounts are plain
+    dicts registered with add_account(); set `down` to simulate an outage.
+    Every request that reaches the "API" is recorded in `calls`.
+    """
+    accounts = {}
+    transfers = {}  # idempotency key -> transfer
+    calls = []
+    down = False
+
+    @classmethod
+    def reset(cls):
+        cls.accounts = {}
+        cls.transfers = {}
+        cls.calls = []
+        cls.down = False
+
+    @classmethod
+    def add_account(cls, account_id, **fields):
+        cls.accounts[account_id] = {
+            "id": account_id,
+            "details_submitted": False,
+            "charges_enabled": False,
+            "payouts_enabled": False,
+            **fields,
+        }
+
+    def retrieve_account(self, account_id):
+        return self._call(lambda: self._respond("retrieve_account", account_id))
+
+    def create_transfer(self, amount, currency, destination, idempotency_key, **params):
+        def respond():
+            self._respond("create_transfer", destination)
+            # Replaying a key returns the original transfer, like Stripe does
+            return FakeStripeGateway.transfers.setdefault(idempotency_key, {
+                "id": f"tr_{len(FakeStripeGateway.transfers) + 1}",
+                "amount": amount,
+                "currency": currency,
+                "destination": destination,
+                **params,
+            })
+
+        return self._call(respond)
+
+    def _respond(self, method, account_id):
+        FakeStripeGateway.calls.append((method, account_id))
+        if FakeStripeGateway.down:
+            raise APIConnectionError("Fake Stripe is down")
+        if account_id not in FakeStripeGateway.accounts:
+            raise InvalidRequestError(f"No such account: '{account_id}'", "account")
+        return dict(FakeStripeGateway.accounts[account_id])
@@ -0,0 +1,40 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from deals.services.stats_service import StatsService
+from referrals import resolver
+from referrals.models import ReferralSubscription
+from referrals.services.referral_service import ReferralService
+
+
+# ---------------------------
+# SUBSCRIBER COUNTERS
+# ---------------------------
+@receiver(post_save, sender=ReferralSubscription)
+def count_new_subscription(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        ReferralService.adjust_subscriber_counts(instance.deal_id, 1)
+
+
+@receiver(post_delete, sender=ReferralSubscription)
+def count_removed_subscription(sender, instance, **kwargs):
+    # Also fires for cascades (deal, business or referrer deleted)
+    ReferralService.adjust_subscriber_counts(instance.deal_id, -1)
+
+
+# ---------------------------
+# REFERRAL CODE CACHE
+# ---------------------------
+@receiver([post_save, post_delete], sender=ReferralSubscription)
+def forget_referral_code(sender, instance, **kwargs):
+    # A new code may have been cached as unknown; a deleted one must stop resolving
+    resolver.forget(instance.referral_code)
+
+
+# ---------------------------
+# DEAL STATS
+# ---------------------------
+@receiver(post_save, sender=ReferralSubscription)
+def track_new_subscription(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        StatsService.track(instance.deal_id, at=instance.created_at, subscriptions=1)
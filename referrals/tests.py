@@ -1,3 +1,730 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import io
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from accounts.authentication import tokens_for_user
+from accounts.models import User, Business
+from accounts.services.mail_service import MailService
+from dealshark import mail as mail_pool
+from deals.models import Deal, DealDailyStats
+from referrals import resolver
+from referrals.models import (
+    LedgerBalance, LedgerEntry, PayoutBatch, PayoutEntry, Referral, ReferralClick, ReferralSubscription,
+    StripeAccountState, StripeEvent,
+)
+from referrals.services import click_service
+from referrals.services.click_service import ClickService
+from referrals.services.code_service import ALPHABET, ReferralCodeService
+from referrals.services.ledger_service import LedgerService
+from referrals.services.payout_service import PayoutService
+from referrals.services.referral_service import ReferralService
+from referrals.services.stripe_account_service import StripeAccountService
+from referrals.services.stripe_event_service import StripeEventService
+from referrals.services.stripe_gateway import FakeStripeGateway
+from referrals.utils import send_referral_notifications
+
+
+TEST_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+def create_user(email, phone_number, user_type="customer", **extra):
+    return User.objects.create_user(
+        email=email, username=email, phone_number=phone_number, password="testpass123",
+        user_type=user_type, **extra,
+    )
+
+
+def create_business(email, phone_number, **extra):
+    return Business.objects.create(
+        user=create_user(email, phone_number, user_type="business"),
+        business_name=f"Business {email}", business_email=email, business_phone=phone_number,
+        website="https://example.com", designation="Owner", registration_no="REG-1",
+        business_address="1 Main St", business_city="Austin", business_state="TX",
+        business_country="US", industry="Retail", **extra,
+    )
+
+
+def payment_event(event_id, referral_code, amount=10000):
+    return {
+        "id": event_id,
+        "type": "payment_intent.succeeded",
+        "livemode": False,
+        "data": {"object": {"amount_received": amount, "metadata": {"referral_code": referral_code}}},
+    }
+
+
+@override_settings(WEBHOOK_SECRET="whsec_test")
+class StripeWebhookTests(TestCase):
+    url = "/referrals/stripe/webhook/"
+
+    def _post(self, event):
+        with mock.patch("stripe.Webhook.construct_event"), \
+                mock.patch("referrals.utils.process_stripe_event.delay") as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                self.url, json.dumps(event), content_type="application/json", HTTP_STRIPE_SIGNATURE="sig"
+            )
+        return response, delay
+
+    def test_event_is_stored_and_queued_once(self):
+        event = payment_event("evt_1", "CODE1234")
+        response, delay = self._post(event)
+        self.assertEqual(response.status_code, 200)
+        delay.assert_called_once_with("evt_1")
+
+        StripeEvent.objects.filter(event_id="evt_1").update(status=StripeEvent.STATUS_PROCESSED)
+        response, delay = self._post(event)
+        self.assertEqual(response.status_code, 200)
+        delay.assert_not_called()
+        self.assertEqual(StripeEvent.objects.count(), 1)
+
+    def test_invalid_signature_is_rejected(self):
+        response = self.client.post(
+            self.url, json.dumps(payment_event("evt_2", "X")), content_type="application/json",
+            HTTP_STRIPE_SIGNATURE="bad",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+
+@override_settings(CACHES=TEST_CACHES, STRIPE_EVENT_MAX_ATTEMPTS=2)
+class StripeEventProcessingTests(TestCase):
+    def setUp(self):
+        referrer = create_user("ref@example.com", "+15551000001", stripe_account_id="acct_referrer")
+        business = create_business("biz@example.com", "+15551000002", stripe_account_id="acct_business")
+        deal = Deal.objects.create(
+            business=business, deal_name="Deal", reward_type="commission", customer_incentive=10
+        )
+        self.subscription = ReferralSubscription.objects.create(deal=deal, referrer=referrer)
+
+    def _store(self, event):
+        return StripeEvent.objects.create(event_id=event["id"], type=event["type"], payload=event)
+
+    def test_payment_is_split_into_payout_entries(self):
+        self._store(payment_event("evt_pay", self.subscription.referral_code))
+
+        self.assertEqual(StripeEventService.process("evt_pay"), StripeEvent.STATUS_PROCESSED)
+        entries = {entry.role: (entry.destination, entry.amount) for entry in PayoutEntry.objects.all()}
+        self.assertEqual(entries, {"business": ("acct_business", 9000), "referrer": ("acct_referrer", 1000)})
+
+        # A redelivered task finds the event already processed
+        self.assertIsNone(StripeEventService.process("evt_pay"))
+        self.assertEqual(PayoutEntry.objects.count(), 2)
+
+    def test_unknown_events_are_dead_lettered(self):
+        self._store({"id": "evt_odd", "type": "charge.refunded", "data": {"object": {}}})
+        self.assertEqual(StripeEventService.process("evt_odd"), StripeEvent.STATUS_DEAD_LETTER)
+        self._store(payment_event("evt_nocode", "MISSING1"))
+        self.assertEqual(StripeEventService.process("evt_nocode"), StripeEvent.STATUS_DEAD_LETTER)
+
+    @mock.patch.object(PayoutService, "record_payment", side_effect=RuntimeError("database down"))
+    def test_failures_retry_then_dead_letter_and_replay(self, record_payment):
+        self._store(payment_event("evt_retry", self.subscription.referral_code))
+
+        with self.assertRaises(RuntimeError):
+            StripeEventService.process("evt_retry")
+        self.assertEqual(StripeEvent.objects.get(event_id="evt_retry").status, StripeEvent.STATUS_FAILED)
+        self.assertEqual(StripeEventService.process("evt_retry"), StripeEvent.STATUS_DEAD_LETTER)
+
+        record_payment.side_effect = None
+        call_command("replay_stripe_events", "evt_retry", "--sync", stdout=mock.MagicMock())
+        event = StripeEvent.objects.get(event_id="evt_retry")
+        self.assertEqual(event.status, StripeEvent.STATUS_PROCESSED)
+        self.assertEqual(event.attempts, 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ReferralNotificationTests(TestCase):
+    def setUp(self):
+        self.referrer = create_user("notify@example.com", "+15551000003")
+        business = create_business("shop@example.com", "+15551000004")
+        self.deal = Deal.objects.create(
+            business=business, deal_name="Espresso", reward_type="commission", customer_incentive=10
+        )
+
+    def test_batch_is_sent_over_one_pooled_connection(self):
+        referrals = [
+            Referral(deal=self.deal, referrer=self.referrer, referred_email=f"friend{i}@example.com")
+            for i in range(3)
+        ]
+        with mock.patch.object(send_referral_notifications, "delay") as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            MailService.send_referral_notifications(referrals)
+        delay.assert_called_once()
+
+        notifications = delay.call_args.args[0]
+        send_referral_notifications.apply(args=[notifications[:1]], throw=True)
+        connection = mail_pool.get_connection()
+        send_referral_notifications.apply(args=[notifications[1:]], throw=True)
+
+        self.assertIs(mail_pool.get_connection(), connection)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn("Espresso", mail.outbox[0].subject)
+
+    def test_new_referral_queues_notification_on_commit(self):
+        with mock.patch.object(send_referral_notifications, "delay") as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            Referral.objects.create(deal=self.deal, referrer=self.referrer, referred_email="a@example.com")
+        delay.assert_called_once_with([{
+            "referrer_email": "notify@example.com",
+            "referred_email": "a@example.com",
+            "deal_title": "Espresso",
+        }])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SubscriptionListingTests(APITestCase):
+    def setUp(self):
+        self.business = create_business("listing@example.com", "+15551000010")
+        self.deals = [
+            Deal.objects.create(
+                business=self.business, deal_name=f"Deal {i}", reward_type="commission", customer_incentive=5
+            )
+            for i in range(12)
+        ]
+        self.referrer = create_user("fan@example.com", "+15551000011")
+        self.subscribe(self.referrer, self.deals[:2])
+
+    def subscribe(self, referrer, deals):
+        for deal in deals:
+            ReferralSubscription.objects.create(deal=deal, referrer=referrer)
+
+    def get(self, url, params=None, user=None):
+        self.client.force_authenticate(user or self.referrer)
+        with self.assertNumQueries(self.budget):
+            response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_subscribers_query_budget_does_not_grow(self):
+        url = f"/referrals/{self.business.id}/subscribers/"
+        self.budget = 3  # business, page, total
+        self.get(url)
+        for i in range(8):
+            self.subscribe(create_user(f"fan{i}@example.com", f"+1555200{i:04d}"), self.deals[:3])
+        response = self.get(url, {"page_size": 20})
+
+        self.assertEqual(response.data["total_subscribers"], 26)
+        self.assertEqual(len(response.data["subscribers"]), 20)
+        self.assertIsNotNone(response.data["next"])
+        subscriber = response.data["subscribers"][0]
+        self.assertEqual(subscriber["deal"]["deal_name"], "Deal 2")
+        self.assertTrue(subscriber["referrer"]["email"].startswith("fan"))
+
+    def test_my_subscriptions_pages_cover_every_subscription(self):
+        self.budget = 2  # page, total
+        self.subscribe(self.referrer, self.deals[2:])
+        seen, url, params = [], "/referrals/my-subscriptions/", {"page_size": 5}
+        while url:
+            response = self.get(url, params)
+            seen.extend(sub["subscription_id"] for sub in response.data["subscriptions"])
+            url, params = response.data["next"], None
+
+        self.assertEqual(len(set(seen)), 12)
+        self.assertEqual(response.data["subscriptions"][-1]["business"]["business_name"], self.business.business_name)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SubscriberCounterTests(TestCase):
+    def setUp(self):
+        self.business = create_business("counted@example.com", "+15551000020")
+        self.deal = Deal.objects.create(
+            business=self.business, deal_name="Counted", reward_type="commission", customer_incentive=5
+        )
+        self.other_deal = Deal.objects.create(
+            business=self.business, deal_name="Other", reward_type="commission", customer_incentive=5
+        )
+        self.referrer = create_user("counter@example.com", "+15551000021")
+
+    def assertCounts(self, deal_count, business_count):
+        self.deal.refresh_from_db()
+        self.business.refresh_from_db()
+        self.assertEqual(self.deal.subscribers_count, deal_count)
+        self.assertEqual(self.business.subscribers_count, business_count)
+
+    def test_subscribe_and_unsubscribe_update_counters(self):
+        ReferralService.subscribe_to_deal(self.deal, self.referrer)
+        ReferralService.subscribe_to_deal(self.deal, self.referrer)  # already subscribed
+        ReferralService.subscribe_to_deal(self.other_deal, self.referrer)
+        self.assertCounts(1, 2)
+
+        ReferralService.unsubscribe_from_deal(self.deal, self.referrer)
+        self.assertCounts(0, 1)
+
+    def test_cascade_delete_updates_counters(self):
+        ReferralService.subscribe_to_deal(self.deal, self.referrer)
+        self.referrer.delete()
+        self.assertCounts(0, 0)
+
+    def test_rebuild_fixes_drifted_counters(self):
+        ReferralService.subscribe_to_deal(self.deal, self.referrer)
+        Deal.objects.filter(id=self.deal.id).update(subscribers_count=7)
+        Business.objects.filter(id=self.business.id).update(subscribers_count=0)
+
+        call_command("rebuild_subscriber_counts", stdout=mock.MagicMock())
+        self.assertCounts(1, 1)
+        self.assertEqual(ReferralService.rebuild_subscriber_counts(), (0, 0))
+
+
+@override_settings(CACHES=TEST_CACHES, CLICK_BUFFER="local")
+class ReferralCodeTests(APITestCase):
+    def test_codes_are_unique_fixed_length_base32(self):
+        codes = {ReferralCodeService.encode(ReferralCodeService.permute(n)) for n in range(1, 20001)}
+        self.assertEqual(len(codes), 20000)
+        self.assertTrue(all(len(code) == 10 and set(code) <= set(ALPHABET) for code in codes))
+
+    def test_subscriptions_get_allocated_codes_and_lookups_normalize(self):
+        business = create_business("codes@example.com", "+15551000030")
+        deal = Deal.objects.create(business=business, deal_name="Codes", reward_type="commission")
+        subscription = ReferralSubscription.objects.create(
+            deal=deal, referrer=create_user("coder@example.com", "+15551000031")
+        )
+        self.assertEqual(len(subscription.referral_code), 10)
+        self.assertTrue(subscription.referral_link.endswith(subscription.referral_code))
+
+        typed = subscription.referral_code.lower().replace("0", "o").replace("1", "l")
+        response = self.client.get("/referrals/verify/", {"code": f" {typed} "})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["referral_code"], subscription.referral_code)
+
+    def test_legacy_codes_are_only_uppercased(self):
+        self.assertEqual(ReferralCodeService.normalize("ab0oil12"), "AB0OIL12")
+
+
+@override_settings(CACHES=TEST_CACHES, CLICK_BUFFER="local", CLICK_FLUSH_INTERVAL=3600)
+class ReferralCodeResolutionTests(APITestCase):
+    url = "/referrals/verify/"
+
+    def setUp(self):
+        cache.clear()
+        resolver._local.clear()
+        click_service._local.clear()
+        self.business = create_business("resolve@example.com", "+15551000040")
+        self.deal = Deal.objects.create(
+            business=self.business, deal_name="Resolved", reward_type="commission", customer_incentive=10
+        )
+        self.subscription = ReferralSubscription.objects.create(
+            deal=self.deal, referrer=create_user("resolver@example.com", "+15551000041")
+        )
+
+    def verify(self, code):
+        return self.client.get(self.url, {"code": code})
+
+    def test_repeat_lookups_skip_the_database(self):
+        self.verify(self.subscription.referral_code)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.verify(self.subscription.referral_code).status_code, 200)
+
+        resolver._local.clear()  # another process: served from the shared tier
+        with self.assertNumQueries(0):
+            response = self.verify(self.subscription.referral_code)
+        self.assertEqual(response.data["deal"]["deal_name"], "Resolved")
+
+    def test_unknown_codes_are_negatively_cached(self):
+        self.assertEqual(self.verify("ZZZZZZZZZZ").status_code, 404)
+        resolver._local.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.verify("ZZZZZZZZZZ").status_code, 404)
+
+    def test_changes_invalidate_the_shared_snapshot(self):
+        code = self.subscription.referral_code
+        self.verify(code)
+
+        self.deal.deal_name = "Renamed"
+        self.deal.save()
+        ReferralSubscription.objects.create(
+            deal=self.deal, referrer=create_user("second@example.com", "+15551000042")
+        )
+        snapshot = resolver.resolve(code, local=False)
+        self.assertEqual(snapshot.deal_name, "Renamed")
+        self.assertEqual(snapshot.deal["subscribers_count"], 2)
+
+        self.subscription.delete()
+        self.assertIsNone(resolver.resolve(code))
+
+
+@override_settings(CACHES=TEST_CACHES, STRIPE_GATEWAY="referrals.services.stripe_gateway.FakeStripeGateway")
+class StripeAccountStateTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        FakeStripeGateway.reset()
+        self.user = create_user("onboard@example.com", "+15551000040", stripe_account_id="acct_onboard")
+
+    def status(self):
+        self.client.force_authenticate(self.user)
+        return self.client.get("/referrals/onboarding/status/")
+
+    def test_state_is_fetched_once_then_served_locally(self):
+        FakeStripeGateway.add_account("acct_onboard", details_submitted=True)
+        self.assertFalse(self.status().data["charges_enabled"])
+        self.assertEqual(len(FakeStripeGateway.calls), 1)
+
+        self.assertTrue(StripeAccountService.get("acct_onboard").details_submitted)
+        with self.assertNumQueries(0):
+            StripeAccountService.get("acct_onboard")
+        cache.clear()
+        self.assertTrue(StripeAccountService.get("acct_onboard").details_submitted)
+        self.assertEqual(len(FakeStripeGateway.calls), 1)
+
+    def test_status_with_a_token_user(self):
+        FakeStripeGateway.add_account("acct_onboard", details_submitted=True)
+        access = tokens_for_user(self.user)["access"]
+        response = self.client.get("/referrals/onboarding/status/", HTTP_AUTHORIZATION=f"Bearer {access}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["account_id"], "acct_onboard")
+
+    @mock.patch("stripe.AccountLink.create", return_value=mock.Mock(url="https://connect.stripe.com/setup/x"))
+    def test_onboarding_link_with_a_token_user(self, create_link):
+        access = tokens_for_user(self.user)["access"]
+        response = self.client.post("/referrals/onboarding/create-link/", HTTP_AUTHORIZATION=f"Bearer {access}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["account_id"], "acct_onboard")
+        create_link.assert_called_once()
+
+    def test_webhook_keeps_state_current(self):
+        FakeStripeGateway.add_account("acct_onboard")
+        StripeAccountService.get("acct_onboard")
+        with self.captureOnCommitCallbacks(execute=True):
+            StripeEvent.objects.create(
+                event_id="evt_account", type="account.updated", payload={"data": {"object": {
+                    "id": "acct_onboard", "details_submitted": True, "charges_enabled": True, "payouts_enabled": True,
+                }}},
+            )
+            StripeEventService.process("evt_account")
+
+        response = self.status()
+        self.assertEqual(response.data["message"], "Onboarding complete")
+        self.assertEqual(len(FakeStripeGateway.calls), 1)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_onboarding_completed)
+
+    def test_outage_opens_the_circuit(self):
+        FakeStripeGateway.down = True
+        for _ in range(settings.STRIPE_CIRCUIT_FAILURE_THRESHOLD):
+            self.assertIsNone(StripeAccountService.get("acct_onboard"))
+        self.assertEqual(self.status().status_code, 503)
+        self.assertEqual(len(FakeStripeGateway.calls), settings.STRIPE_CIRCUIT_FAILURE_THRESHOLD)
+
+        # Stored state is still served when a refresh cannot reach Stripe
+        StripeAccountState.objects.create(account_id="acct_onboard", details_submitted=True, synced_at=timezone.now())
+        self.assertTrue(StripeAccountService.get("acct_onboard", refresh=True).details_submitted)
+
+    def test_sync_refreshes_missing_and_stale_accounts(self):
+        FakeStripeGateway.add_account("acct_onboard", details_submitted=True)
+        FakeStripeGateway.add_account("acct_stale", charges_enabled=True)
+        StripeAccountState.objects.create(
+            account_id="acct_stale", synced_at=timezone.now() - timedelta(days=1)
+        )
+        StripeAccountState.objects.create(account_id="acct_fresh", synced_at=timezone.now())
+
+        self.assertEqual(StripeAccountService.sync(), 2)
+        self.assertTrue(StripeAccountState.objects.get(account_id="acct_onboard").details_submitted)
+        self.assertTrue(StripeAccountState.objects.get(account_id="acct_stale").charges_enabled)
+        self.assertEqual(StripeAccountService.sync(), 0)
+
+
+@override_settings(
+    CACHES=TEST_CACHES, STRIPE_GATEWAY="referrals.services.stripe_gateway.FakeStripeGateway", PAYOUT_MAX_ATTEMPTS=2
+)
+class PayoutBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        FakeStripeGateway.reset()
+        FakeStripeGateway.add_account("acct_payee")
+        FakeStripeGateway.add_account("acct_shop")
+        referrer = create_user("payee@example.com", "+15551000050", stripe_account_id="acct_payee")
+        business = create_business("shop2@example.com", "+15551000051", stripe_account_id="acct_shop")
+        deal = Deal.objects.create(
+            business=business, deal_name="Batched", reward_type="commission", customer_incentive=10
+        )
+        self.code = ReferralSubscription.objects.create(deal=deal, referrer=referrer).referral_code
+
+    def pay(self, event_id, amount=10000, receipt_email="buyer@example.com"):
+        event = payment_event(event_id, self.code, amount)
+        event["data"]["object"]["receipt_email"] = receipt_email
+        StripeEvent.objects.create(event_id=event_id, type=event["type"], payload=event)
+        StripeEventService.process(event_id)
+
+    def test_one_transfer_per_account_per_run(self):
+        self.pay("evt_a")
+        self.pay("evt_b", amount=5000)
+        self.assertEqual(FakeStripeGateway.transfers, {})
+
+        self.assertEqual(PayoutService.run(), {PayoutBatch.STATUS_PAID: 2})
+        amounts = {t["destination"]: t["amount"] for t in FakeStripeGateway.transfers.values()}
+        self.assertEqual(amounts, {"acct_shop": 13500, "acct_payee": 1500})
+
+        referral = Referral.objects.get(referred_email="buyer@example.com")
+        self.assertEqual(referral.status, "paid")
+        self.assertEqual(referral.commission_earned, Decimal("15.00"))
+        self.assertEqual(PayoutService.run(), {})
+
+    @mock.patch("deals.utils.record_deal_events.delay")
+    def test_payments_without_an_email_create_no_referral(self, record_deal_events):
+        with mock.patch.object(send_referral_notifications, "delay") as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.pay("evt_anon_1", receipt_email=None)
+            self.pay("evt_anon_2", receipt_email=None)
+
+        self.assertFalse(Referral.objects.exists())
+        delay.assert_not_called()
+        self.assertEqual(PayoutEntry.objects.filter(referral__isnull=True).count(), 4)
+        self.assertEqual(PayoutService.run(), {PayoutBatch.STATUS_PAID: 2})
+
+    def test_failed_batches_back_off_and_keep_their_key(self):
+        self.pay("evt_c")
+        FakeStripeGateway.down = True
+        self.assertEqual(PayoutService.run(), {PayoutBatch.STATUS_FAILED: 2})
+        self.assertEqual(PayoutService.run(), {})  # not due yet
+
+        FakeStripeGateway.down = False
+        PayoutBatch.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(PayoutService.run(), {PayoutBatch.STATUS_PAID: 2})
+        keys = {batch.idempotency_key for batch in PayoutBatch.objects.all()}
+        self.assertEqual(set(FakeStripeGateway.transfers), keys)
+        self.assertFalse(PayoutEntry.objects.exclude(status=PayoutEntry.STATUS_PAID).exists())
+
+
+@override_settings(CACHES=TEST_CACHES, STRIPE_GATEWAY="referrals.services.stripe_gateway.FakeStripeGateway")
+class CommissionLedgerTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.referrer = create_user("earner@example.com", "+15551000060", stripe_account_id="acct_earner")
+        self.business = create_business("seller@example.com", "+15551000061", stripe_account_id="acct_seller")
+        self.deal = Deal.objects.create(
+            business=self.business, deal_name="Ledger", reward_type="commission", customer_incentive=Decimal("12.5")
+        )
+        self.code = ReferralSubscription.objects.create(deal=self.deal, referrer=self.referrer).referral_code
+
+    def pay(self, event_id, amount):
+        event = payment_event(event_id, self.code, amount)
+        StripeEvent.objects.create(event_id=event_id, type=event["type"], payload=event)
+        return StripeEventService.process(event_id)
+
+    def balances(self):
+        return dict(LedgerBalance.objects.values_list("account", "balance"))
+
+    def test_split_uses_exact_decimal_math(self):
+        self.assertEqual(LedgerService.split(999, Decimal("12.5")), (875, 124))
+        self.assertEqual(LedgerService.split(1000, Decimal("33.33")), (667, 333))
+        self.assertEqual(LedgerService.split(500, None), (500, 0))
+
+    def test_payments_post_balanced_entries_and_balances(self):
+        self.pay("evt_one", 999)
+        self.pay("evt_two", 2000)
+        self.assertEqual(StripeEventService.process("evt_two"), None)
+
+        for transaction_id in ("evt_one", "evt_two"):
+            amounts = LedgerEntry.objects.filter(transaction_id=transaction_id).values_list("amount", flat=True)
+            self.assertEqual(sum(amounts), 0)
+        balances = self.balances()
+        self.assertEqual(balances[f"commission:referrer:{self.referrer.id}"], 124 + 250)
+        self.assertEqual(balances[f"revenue:business:{self.business.id}"], 875 + 1750)
+        self.assertEqual(balances["stripe:clearing"], -2999)
+        self.assertEqual(PayoutEntry.objects.get(event_id="evt_one", role="referrer").amount, 124)
+
+    def test_listings_show_earnings(self):
+        self.pay("evt_listed", 10000)
+
+        self.client.force_authenticate(self.referrer)
+        response = self.client.get("/referrals/my-subscriptions/")
+        self.assertEqual(response.data["total_commission_earned"], Decimal("12.50"))
+        self.assertEqual(response.data["subscriptions"][0]["commission_earned"], Decimal("12.50"))
+        self.assertEqual(response.data["subscriptions"][0]["business_revenue"], Decimal("87.50"))
+
+        response = self.client.get(f"/referrals/{self.business.id}/subscribers/")
+        self.assertEqual(response.data["total_revenue"], Decimal("87.50"))
+        self.assertEqual(response.data["subscribers"][0]["commission_earned"], Decimal("12.50"))
+
+    def test_entries_are_append_only_and_balances_rebuildable(self):
+        self.pay("evt_drift", 1000)
+        entry = LedgerEntry.objects.first()
+        with self.assertRaises(ValueError):
+            entry.save()
+        with self.assertRaises(ValueError):
+            LedgerService.post("bad", [("a", "", 1), ("b", "", 2)])
+
+        expected = self.balances()
+        LedgerBalance.objects.update(balance=0)
+        call_command("rebuild_ledger_balances", stdout=mock.MagicMock())
+        self.assertEqual(self.balances(), expected)
+        self.assertEqual(LedgerService.rebuild_balances(), 0)
+
+
+@override_settings(CACHES=TEST_CACHES, CLICK_BUFFER="local", CLICK_FLUSH_INTERVAL=3600)
+class ClickTrackingTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        resolver._local.clear()
+        click_service._local.clear()
+        business = create_business("clicks@example.com", "+15551000070")
+        self.deal = Deal.objects.create(
+            business=business, deal_name="Clicked", reward_type="commission", customer_incentive=10
+        )
+        referrer = create_user("clicker@example.com", "+15551000071")
+        self.subscription = ReferralSubscription.objects.create(deal=self.deal, referrer=referrer)
+
+    def click(self, user_agent="Browser/1.0", **headers):
+        response = self.client.get(
+            "/referrals/verify/", {"code": self.subscription.referral_code}, HTTP_USER_AGENT=user_agent, **headers
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_clicks_are_buffered_deduplicated_and_flushed(self):
+        self.click()
+        with self.assertNumQueries(0):
+            self.click()  # same visitor, deduplicated
+            self.click("Other/2.0")
+        self.assertFalse(ReferralClick.objects.exists())
+
+        self.assertEqual(ClickService.flush(), 2)
+        self.assertEqual(ReferralClick.objects.filter(deal=self.deal).count(), 2)
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.clicks_count, 2)
+        self.assertEqual(DealDailyStats.objects.get(deal=self.deal).clicks, 2)
+        self.assertEqual(ClickService.flush(), 0)
+
+    def test_spoofed_forwarded_for_is_the_same_visitor(self):
+        self.click(HTTP_X_FORWARDED_FOR="198.51.100.1")
+        self.click(HTTP_X_FORWARDED_FOR="198.51.100.2")
+        self.assertEqual(ClickService.flush(), 1)
+
+    @override_settings(CLICK_FLUSH_BATCH=2)
+    def test_full_local_buffer_is_flushed_by_the_request(self):
+        self.click("A")
+        self.assertFalse(ReferralClick.objects.exists())
+        self.click("B")
+        self.assertEqual(ReferralClick.objects.count(), 2)
+
+    def test_failed_batches_go_back_to_the_buffer(self):
+        self.click()
+        with mock.patch.object(ClickService, "_write", side_effect=RuntimeError("db down")):
+            with self.assertRaises(RuntimeError):
+                ClickService.flush()
+        self.assertEqual(ClickService.flush(), 1)
+
+
+@override_settings(CACHES=TEST_CACHES, EXPORT_CHUNK_SIZE=2)
+class ExportTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        resolver._local.clear()
+        self.business = create_business("exporter@example.com", "+15551000080")
+        self.deal = Deal.objects.create(
+            business=self.business, deal_name="Exported", reward_type="commission", customer_incentive=10
+        )
+        self.subscriptions = [
+            ReferralSubscription.objects.create(
+                deal=self.deal, referrer=create_user(f"exported{i}@example.com", f"+155510001{i:02d}")
+            )
+            for i in range(5)
+        ]
+        self.url = f"/referrals/{self.business.id}/export/"
+        self.client.force_authenticate(self.business.user)
+
+    def export(self, dataset, **params):
+        response = self.client.get(self.url + f"{dataset}/", params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv_export_streams_every_row_in_creation_order(self):
+        rows = list(csv.DictReader(io.StringIO(self.export("subscribers"))))
+        self.assertEqual(
+            [row["subscription_id"] for row in rows], [str(sub.id) for sub in self.subscriptions]
+        )
+        self.assertEqual(rows[0]["deal_name"], "Exported")
+        self.assertEqual(rows[0]["commission_earned"], "0.00")
+
+    def test_exports_resume_from_a_row_cursor(self):
+        first = [json.loads(line) for line in self.export("subscribers", output="ndjson").splitlines()]
+        rest = self.export("subscribers", output="ndjson", cursor=first[1]["cursor"])
+        self.assertEqual(
+            [json.loads(line)["subscription_id"] for line in rest.splitlines()],
+            [row["subscription_id"] for row in first[2:]],
+        )
+
+    def test_bad_cursors_are_rejected_before_streaming(self):
+        cursors = ["not-a-cursor", base64.urlsafe_b64encode(b'["yesterday", "x"]').decode()]
+        for cursor in cursors:
+            response = self.client.get(self.url + "subscribers/", {"cursor": cursor})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {"error": "Invalid cursor."})
+
+    def test_columnar_export_groups_rows_by_chunk(self):
+        lines = [json.loads(line) for line in self.export("subscribers", output="columns").splitlines()]
+        self.assertEqual(lines[0]["columns"][0], "subscription_id")
+        self.assertEqual([group["rows"] for group in lines[1:]], [2, 2, 1])
+        self.assertEqual(lines[1]["data"]["referral_code"][0], self.subscriptions[0].referral_code)
+
+    def test_ledger_export_and_date_range(self):
+        snapshot = resolver.resolve(self.subscriptions[0].referral_code)
+        LedgerService.record_payment("evt_export", snapshot, 1000, LedgerService.split(1000, 10))
+        rows = list(csv.DictReader(io.StringIO(self.export("ledger"))))
+        self.assertEqual(sorted(row["amount"] for row in rows), ["-10.00", "1.00", "9.00"])
+
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        self.assertEqual(self.export("ledger", **{"from": str(tomorrow)}).splitlines()[1:], [])
+
+    def test_only_the_owning_business_can_export(self):
+        self.assertEqual(self.client.get(self.url + "nope/").status_code, 404)
+        self.assertEqual(self.client.get(self.url + "referrals/", {"output": "xml"}).status_code, 400)
+        other = create_business("other-exporter@example.com", "+15551000081")
+        self.assertEqual(self.client.get(f"/referrals/{other.id}/export/referrals/").status_code, 404)
+        self.client.force_authenticate(self.subscriptions[0].referrer)
+        self.assertEqual(self.client.get(self.url + "referrals/").status_code, 403)
+
+
+def slow_checkout(**params):
+    time.sleep(0.3)
+    return SimpleNamespace(id="cs_test", url="https://checkout.stripe.com/c/cs_test")
+
+
+@override_settings(CACHES=TEST_CACHES)
+class AsyncCheckoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        resolver._local.clear()
+        business = create_business("async@example.com", "+15551000090")
+        deal = Deal.objects.create(business=business, deal_name="Async", reward_type="commission", customer_incentive=10)
+        self.code = ReferralSubscription.objects.create(
+            deal=deal, referrer=create_user("async-referrer@example.com", "+15551000091")
+        ).referral_code
+        self.payload = {"referral_code": self.code, "amount": "25.00"}
+
+    @mock.patch("referrals.views.StatsService.track")
+    @mock.patch("stripe.checkout.Session.create", return_value=SimpleNamespace(id="cs_test", url="https://pay"))
+    def test_create_payment_opens_a_checkout_session(self, create, track):
+        response = self.client.post("/referrals/create-payment/", self.payload, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["session_id"], "cs_test")
+        self.assertEqual(create.call_args.kwargs["line_items"][0]["price_data"]["unit_amount"], 2500)
+        track.assert_called_once_with(create.call_args.kwargs["payment_intent_data"]["metadata"]["deal_id"], checkouts=1)
+
+        missing = self.client.post("/referrals/create-payment/", {"amount": "1"}, content_type="application/json")
+        self.assertEqual(missing.status_code, 400)
+
+    @mock.patch("referrals.views.StatsService.track")
+    @mock.patch("stripe.checkout.Session.create", side_effect=slow_checkout)
+    async def test_slow_stripe_calls_overlap(self, create, track):
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(
+            self.async_client.post("/referrals/create-payment/", self.payload, content_type="application/json")
+            for _ in range(4)
+        ))
+        self.assertEqual([response.status_code for response in responses], [200] * 4)
+        self.assertLess(time.perf_counter() - started, 1.0)  # 4 x 0.3s one after the other would be 1.2s
@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from .views import ReferralListCreateView, ReferralDetailView, confirm_referral, ReferralSubscriptionViewSet, \
-    StripeConnectViewSet
+    StripeConnectViewSet, CreatePaymentView, StripeConnectLinkView, StripeStatusView
 from .webhooks import stripe_webhook
 
 router = DefaultRouter()
@@ -14,5 +14,8 @@ urlpatterns = [
     path('<uuid:pk>/', ReferralDetailView.as_view(), name='referral_detail'),
     path('<uuid:referral_id>/confirm/', confirm_referral, name='confirm_referral'),
     path('stripe/webhook/', stripe_webhook, name='stripe_webhook'),
+    path('create-payment/', CreatePaymentView.as_view(), name='create_payment'),
+    path('onboarding/create-link/', StripeConnectLinkView.as_view(), name='stripe_connect_link'),
+    path('onboarding/status/', StripeStatusView.as_view(), name='stripe_connect_status'),
     path('', include(router.urls)),
 ]
@@ -1,35 +1,82 @@
 from celery import shared_task
-from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 import logging
 
+from dealshark import mail
+from referrals.services.click_service import ClickService
+from referrals.services.payout_service import PayoutService
+from referrals.services.referral_service import ReferralService
+from referrals.services.stripe_account_service import StripeAccountService
+from referrals.services.stripe_event_service import StripeEventService
+
 logger = logging.getLogger(__name__)
 
-@shared_task
-def send_referral_notification(referrer_email, referred_email, deal_title):
-    """Send notification when someone is referred"""
-    try:
-        subject = f"Your referral for {deal_title} has been submitted!"
-
-        html_message = render_to_string('emails/referral_notification.html', {
-            'referrer_email': referrer_email,
-            'referred_email': referred_email,
-            'deal_title': deal_title
-        })
-        plain_message = strip_tags(html_message)
-
-        send_mail(
-            subject=subject,
-            message=plain_message,
+@shared_task(bind=True, max_retries=mail.MAX_RETRIES)
+def send_referral_notifications(self, notifications):
+    """
+    Send a batch of referral notifications in one go over the worker's pooled
+    mail connection. `notifications` is a list of dicts with referrer_email,
+    referred_email and deal_title.
+    """
+    messages = []
+    for notification in notifications:
+        html_message = render_to_string('emails/referral_notification.html', notification)
+        message = EmailMultiAlternatives(
+            subject=f"Your referral for {notification['deal_title']} has been submitted!",
+            body=strip_tags(html_message),
             from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[referrer_email],
-            html_message=html_message,
-            fail_silently=False,
+            to=[notification['referrer_email']],
         )
-        return True
+        message.attach_alternative(html_message, "text/html")
+        messages.append(message)
 
+    try:
+        return mail.deliver(lambda connection: connection.send_messages(messages))
     except Exception as e:
-        logger.error(f"Failed to send referral notification: {str(e)}")
-        return False
+        logger.error(f"Failed to send {len(messages)} referral notification(s): {str(e)}")
+        raise self.retry(exc=e, countdown=mail.retry_countdown(self.request.retries))
+
+
+@shared_task(bind=True, max_retries=settings.STRIPE_EVENT_MAX_ATTEMPTS)
+def process_stripe_event(self, event_id):
+    """Process a stored Stripe webhook event, retrying with exponential backoff"""
+    try:
+        return StripeEventService.process(event_id)
+    except Exception as e:
+        countdown = settings.STRIPE_EVENT_RETRY_BACKOFF * (2 ** self.request.retries)
+        raise self.retry(exc=e, countdown=countdown)
+
+
+@shared_task
+def reconcile_subscriber_counts():
+    """Periodic safety net for the stored deal/business subscriber counters"""
+    deals_fixed, businesses_fixed = ReferralService.rebuild_subscriber_counts()
+    if deals_fixed or businesses_fixed:
+        logger.warning(
+            f"Subscriber counters drifted: fixed {deals_fixed} deal(s), {businesses_fixed} business(es)"
+        )
+    return deals_fixed, businesses_fixed
+
+
+@shared_task
+def sync_stripe_accounts():
+    """Refresh missing or stale StripeAccountState rows from Stripe"""
+    return StripeAccountService.sync()
+
+
+@shared_task
+def run_payouts():
+    """Batch pending payout entries and send (or retry) the due transfers"""
+    results = PayoutService.run()
+    if results.get("dead_letter"):
+        logger.error(f"{results['dead_letter']} payout batch(es) dead-lettered")
+    return results
+
+
+@shared_task
+def flush_clicks():
+    """Write buffered referral link clicks to Postgres"""
+    return ClickService.flush()
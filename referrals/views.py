@@ -1,24 +1,59 @@
+from datetime import datetime, time
+
 import stripe
 import stripe
+from asgiref.sync import sync_to_async
 from stripe._error import StripeError, CardError, InvalidRequestError
 
 from django.conf import settings
+from django.db.models import Count
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import generics, status, viewsets
 from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from django.utils import timezone
 
+from accounts.authentication import request_business_id
 from accounts.models import Business, User
-from accounts.serializers import BusinessResponseSerializer, UserProfileSerializer
 from deals.models import Deal
-from deals.serializers import DealSerializer
+from deals.pagination import DealKeysetPagination
+from deals.services.stats_service import StatsService
+from dealshark.aio import AsyncAPIView, run_blocking
+from dealshark.ratelimit import RateLimitThrottle
+from . import resolver
 from .models import Referral, ReferralSubscription
 from .serializers import ReferralSerializer, ReferralCreateSerializer, ReferralSubscriptionSerializer
 from accounts.permissions import IsBusinessUser
+from .services.click_service import ClickService
+from .services.code_service import ReferralCodeService
+from .services.export_service import DATASETS, FORMATS, ExportService
+from .services.ledger_service import LedgerService
 from .services.referral_service import ReferralService
+from .services.stripe_account_service import StripeAccountService
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
+SUBSCRIPTION_ORDERING = ("-created_at", "-id")
+
+
+def _query_datetime(request, name):
+    """Date or datetime query parameter as an aware datetime, None if absent; ValueError if malformed"""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValueError(value)
+        moment = datetime.combine(date, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
 class ReferralListCreateView(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
 
@@ -86,8 +121,13 @@ class ReferralSubscriptionViewSet(viewsets.ViewSet):
             return "Stripe account must be connected before subscribing."
 
         if not getattr(referrer, "is_onboarding_completed", False):
-            account = stripe.Account.retrieve(referrer.stripe_account_id)
-            if account.get("details_submitted") is False:
+            try:
+                state = StripeAccountService.get(referrer.stripe_account_id)
+            except StripeError:
+                return "Stripe account could not be found."
+            if state is None:
+                return "Stripe is unavailable, please try again shortly."
+            if not state.details_submitted:
                 return "Stripe onboarding must be completed before subscribing."
 
         return None
@@ -151,38 +191,15 @@ class ReferralSubscriptionViewSet(viewsets.ViewSet):
     def subscribers(self, request, pk=None):
         """All subscribers for a specific business"""
         try:
-            business = Business.objects.get(id=pk)
+            business = Business.objects.annotate(
+                revenue_cents=LedgerService.business_revenue_balance()
+            ).get(id=pk)
         except Business.DoesNotExist:
             return Response({"error": "Business not found."}, status=404)
 
-        subscriptions = ReferralSubscription.objects.filter(deal__business=business)
-
-        data = []
-        for sub in subscriptions:
-            data.append({
-                "subscription_id": str(sub.id),
-                "referral_code": sub.referral_code,
-                "referral_link": sub.referral_link,
-                "referrer": {
-                    "id": str(sub.referrer.id),
-                    "email": sub.referrer.email,
-                    "first_name": sub.referrer.first_name,
-                    "last_name": sub.referrer.last_name,
-                    "phone_number": sub.referrer.phone_number,
-                    "profile_image_url": getattr(sub.referrer, "profile_image_url", None),
-                },
-                "deal": {
-                    "id": str(sub.deal.id),
-                    "deal_name": sub.deal.deal_name,
-                    "deal_description": sub.deal.deal_description,
-                    "reward_type": sub.deal.reward_type,
-                    "customer_incentive": sub.deal.customer_incentive,
-                    "no_reward_reason": sub.deal.no_reward_reason,
-                },
-                "commission_earned": None,  # placeholder (future Stripe integration)
-                "business_revenue": None,  # placeholder (future Stripe integration)
-                "created_at": sub.created_at,
-            })
+        paginator = DealKeysetPagination(ordering=SUBSCRIPTION_ORDERING)
+        page = paginator.paginate_queryset(ReferralService.business_subscribers(business), request)
+        data = [ReferralService.format_subscriber(row) for row in page]
 
         return Response({
             "business": {
@@ -203,145 +220,87 @@ class ReferralSubscriptionViewSet(viewsets.ViewSet):
                 "email": business.business_email,
 
             },
-            "total_subscribers": len(subscriptions),
+            "total_subscribers": ReferralSubscription.objects.filter(deal__business=business).count(),
+            "total_revenue": LedgerService.to_amount(business.revenue_cents),
+            "next": paginator.get_next_link(),
+            "page_size": paginator.page_size,
             "subscribers": data,
         }, status=200)
 
     @action(detail=False, methods=["get"], url_path="my-subscriptions")
     def my_subscriptions(self, request):
         """All deals a referrer (current user) has subscribed to"""
-        subscriptions = ReferralSubscription.objects.filter(referrer=request.user)
-
-        data = []
-        for sub in subscriptions:
-            data.append({
-                "subscription_id": str(sub.id),
-                "referral_code": sub.referral_code,
-                "referral_link": sub.referral_link,
-                "deal": {
-                    "id": str(sub.deal.id),
-                    "deal_name": sub.deal.deal_name,
-                    "deal_description": sub.deal.deal_description,
-                    "reward_type": sub.deal.reward_type,
-                    "customer_incentive": sub.deal.customer_incentive,
-                    "no_reward_reason": sub.deal.no_reward_reason,
-                },
-                "business": {
-                    "id": str(sub.deal.business.id),
-                    "business_name": sub.deal.business.business_name,
-                    "industry": sub.deal.business.industry,
-                    "website": sub.deal.business.website,
-                    "description": sub.deal.business.description,
-                    "logo_url": sub.deal.business.business_logo_url,
-                    "cover_url": sub.deal.business.business_cover_url,
-                    "is_verified": sub.deal.business.is_verified,
-                    "address": sub.deal.business.business_address,
-                    "city": sub.deal.business.business_city,
-                    "state": sub.deal.business.business_state,
-                    "country": sub.deal.business.business_country,
-                    "registration_no": sub.deal.business.registration_no,
-                    "phone_number": sub.deal.business.business_phone,
-                    "email": sub.deal.business.business_email,
-                },
-                "commission_earned": None,  # placeholder (future Stripe integration)
-                "business_revenue": None,  # placeholder (future Stripe integration)
-                "created_at": sub.created_at,
-            })
+        paginator = DealKeysetPagination(ordering=SUBSCRIPTION_ORDERING)
+        page = paginator.paginate_queryset(ReferralService.referrer_subscriptions(request.user), request)
+        data = [ReferralService.format_subscription(row) for row in page]
+        totals = User.objects.filter(id=request.user.id).annotate(
+            total_subscriptions=Count("subscriptions"),
+            commission_cents=LedgerService.referrer_commission_balance(),
+        ).values("email", "total_subscriptions", "commission_cents").get()
 
         return Response({
             "referrer": {
                 "id": str(request.user.id),
-                "email": request.user.email,
+                # From the totals row: a token user only carries its claims
+                "email": totals["email"],
             },
-            "total_subscriptions": len(subscriptions),
+            "total_subscriptions": totals["total_subscriptions"],
+            "total_commission_earned": LedgerService.to_amount(totals["commission_cents"]),
+            "next": paginator.get_next_link(),
+            "page_size": paginator.page_size,
             "subscriptions": data,
         }, status=200)
 
+    @action(detail=True, methods=["get"], url_path=r"export/(?P<dataset>[a-z]+)")
+    def export(self, request, pk=None, dataset=None):
+        """
+        Stream the business's subscribers, referrals or ledger entries.
+        ?output=csv|ndjson|columns, ?from= / ?to= bound created_at (dates or
+        ISO datetimes, `to` exclusive), ?cursor= resumes after a row.
+        """
+        business_id = request_business_id(request)
+        if not business_id:
+            return Response({"error": "Only businesses can export their data."}, status=403)
+        if str(business_id) != pk:
+            return Response({"error": "Business not found."}, status=404)
+        if dataset not in DATASETS:
+            return Response({"error": f"Unknown export, expected one of: {', '.join(DATASETS)}."}, status=404)
+
+        output = request.query_params.get("output", "csv")
+        if output not in FORMATS:
+            return Response({"error": f"Unknown output, expected one of: {', '.join(FORMATS)}."}, status=400)
+        try:
+            start = _query_datetime(request, "from")
+            end = _query_datetime(request, "to")
+        except ValueError:
+            return Response({"error": "`from` and `to` must be dates or ISO datetimes."}, status=400)
+        # Checked before streaming: once the 200 is sent a bad cursor could only cut the file short
+        try:
+            position = ExportService.paginator().decode_cursor(request)
+            queryset = ExportService.queryset(dataset, business_id, start, end, position)
+        except (NotFound, ValueError):
+            return Response({"error": "Invalid cursor."}, status=400)
+
+        content_type, extension = FORMATS[output]
+        rows = ExportService.rows(dataset, queryset)
+        response = StreamingHttpResponse(ExportService.stream(dataset, output, rows), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{dataset}-{business_id}.{extension}"'
+        return response
+
     @action(detail=False, methods=["get"], url_path="verify", permission_classes=[AllowAny])
     def verify_code(self, request):
         """Verify referral code and return related business, deal, referrer"""
-        code = request.query_params.get("code")
+        code = ReferralCodeService.normalize(request.query_params.get("code"))
         if not code:
             return Response({"error": "Referral code is required"}, status=400)
 
-        try:
-            sub = ReferralSubscription.objects.select_related(
-                "deal", "referrer", "deal__business"
-            ).get(referral_code=code)
-        except ReferralSubscription.DoesNotExist:
-            return Response({"error": "Invalid referral code"}, status=404)
-
-        return Response({
-            "referral_code": sub.referral_code,
-            "referral_link": sub.referral_link,
-            "deal": DealSerializer(sub.deal).data,
-            "business": BusinessResponseSerializer(sub.deal.business).data,
-            "referrer": UserProfileSerializer(sub.referrer).data,
-        }, status=200)
-
-    @action(detail=False, methods=["post"], url_path="create-payment", permission_classes=[AllowAny])
-    def create_payment(self, request):
-        """Create Stripe Checkout Session for referral deal"""
-        code = request.data.get("referral_code")
-        amount = request.data.get("amount")
-
-        if not code or not amount:
-            return Response({"error": "referral_code and amount are required"}, status=400)
-
-        try:
-            sub = ReferralSubscription.objects.select_related(
-                "deal", "referrer", "deal__business"
-            ).get(referral_code=code)
-        except ReferralSubscription.DoesNotExist:
+        snapshot = resolver.resolve(code)
+        if snapshot is None:
             return Response({"error": "Invalid referral code"}, status=404)
 
-        try:
-            amount_cents = int(float(amount) * 100)
-            commission_rate = float(sub.deal.customer_incentive or 0) / 100
-            referrer_amount_cents = int(amount_cents * commission_rate)
+        ClickService.record(snapshot, request)
+        return Response(snapshot.verify_payload(), status=200)
 
-            # Create Checkout Session
-            session = stripe.checkout.Session.create(
-                payment_method_types=["card"],
-                mode="payment",
-                line_items=[{
-                    "price_data": {
-                        "currency": "usd",
-                        "unit_amount": amount_cents,
-                        "product_data": {
-                            "name": sub.deal.deal_name,
-                            "description": sub.deal.deal_description,
-                        },
-                    },
-                    "quantity": 1,
-                }],
-                payment_intent_data={
-                    "metadata": {
-                        "referral_code": sub.referral_code,
-                        "deal_id": str(sub.deal.id),
-                        "referrer_id": str(sub.referrer.id),
-                        "business_id": str(sub.deal.business.id),
-                    },
-                },
-                success_url=f"{settings.FRONTEND_URL}/payment/success?session_id={{CHECKOUT_SESSION_ID}}",
-                cancel_url=f"{settings.FRONTEND_URL}/payment/failure",
-            )
-
-            return Response({
-                "checkout_url": session.url,
-                "session_id": session.id,
-                "amount": amount,
-                "currency": "usd",
-            }, status=200)
-
-        except CardError as e:
-            return Response({"error": "Card declined", "details": str(e)}, status=402)
-        except InvalidRequestError as e:
-            return Response({"error": "Invalid request to Stripe", "details": str(e)}, status=400)
-        except StripeError as e:
-            return Response({"error": "Stripe error", "details": str(e)}, status=400)
-        except Exception as e:
-            return Response({"error": "Unexpected error", "details": str(e)}, status=500)
     # @action(detail=False, methods=["post"], url_path="create-payment", permission_classes=[AllowAny])
     # def create_payment(self, request):
     #     """Create Stripe PaymentIntent for referral deal"""
@@ -405,20 +364,112 @@ class ReferralSubscriptionViewSet(viewsets.ViewSet):
 class StripeConnectViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
-    @action(detail=False, methods=["post"], url_path="create-link")
-    def create_connect_link(self, request):
+    @action(detail=False, methods=["post"], url_path="save-account")
+    def save_account(self, request):
+        """Save Stripe account ID after onboarding"""
+        account_id = request.data.get("account_id")
+        if not account_id:
+            return Response({"error": "account_id is required"}, status=400)
+
+        user = request.user
+        user.stripe_account_id = account_id
+        user.save()
+
+        return Response({
+            "message": "Stripe account linked successfully",
+            "account_id": account_id
+        }, status=200)
+
+
+# ---------------------------
+# ASYNC STRIPE ENDPOINTS
+# ---------------------------
+# These mostly wait on Stripe: async views, SDK calls in the bounded
+# blocking I/O pool (see dealshark.aio).
+
+class CreatePaymentView(AsyncAPIView):
+    permission_classes = [AllowAny]
+
+    async def post(self, request):
+        """Create Stripe Checkout Session for referral deal"""
+        code = ReferralCodeService.normalize(request.data.get("referral_code"))
+        amount = request.data.get("amount")
+
+        if not code or not amount:
+            return Response({"error": "referral_code and amount are required"}, status=400)
+
+        snapshot = await sync_to_async(resolver.resolve)(code)
+        if snapshot is None:
+            return Response({"error": "Invalid referral code"}, status=404)
+
+        try:
+            amount_cents = int(float(amount) * 100)
+
+            # Create Checkout Session
+            session = await run_blocking(
+                stripe.checkout.Session.create,
+                payment_method_types=["card"],
+                mode="payment",
+                line_items=[{
+                    "price_data": {
+                        "currency": "usd",
+                        "unit_amount": amount_cents,
+                        "product_data": {
+                            "name": snapshot.deal_name,
+                            "description": snapshot.deal_description,
+                        },
+                    },
+                    "quantity": 1,
+                }],
+                payment_intent_data={
+                    "metadata": {
+                        "referral_code": snapshot.referral_code,
+                        "deal_id": snapshot.deal_id,
+                        "referrer_id": snapshot.referrer_id,
+                        "business_id": str(snapshot.business_id),
+                    },
+                },
+                success_url=f"{settings.FRONTEND_URL}/payment/success?session_id={{CHECKOUT_SESSION_ID}}",
+                cancel_url=f"{settings.FRONTEND_URL}/payment/failure",
+            )
+            await sync_to_async(StatsService.track)(snapshot.deal_id, checkouts=1)
+
+            return Response({
+                "checkout_url": session.url,
+                "session_id": session.id,
+                "amount": amount,
+                "currency": "usd",
+            }, status=200)
+
+        except CardError as e:
+            return Response({"error": "Card declined", "details": str(e)}, status=402)
+        except InvalidRequestError as e:
+            return Response({"error": "Invalid request to Stripe", "details": str(e)}, status=400)
+        except StripeError as e:
+            return Response({"error": "Stripe error", "details": str(e)}, status=400)
+        except Exception as e:
+            return Response({"error": "Unexpected error", "details": str(e)}, status=500)
+
+
+class StripeConnectLinkView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [RateLimitThrottle]
+    throttle_scope = "stripe_onboarding"
+
+    async def post(self, request):
         """Create Stripe Connect onboarding link for both users and businesses"""
         user = request.user
         account_id = None
 
         # Case 1: If user is a business
         if user.is_business:
-            business = getattr(user, "business_profile", None)
+            business = await Business.objects.filter(user=user).afirst()
             if not business:
                 return Response({"error": "Business profile not found"}, status=404)
 
             if not business.stripe_account_id:
-                acct = stripe.Account.create(
+                acct = await run_blocking(
+                    stripe.Account.create,
                     type="express",
                     email=user.email,
                     country="US",
@@ -429,7 +480,7 @@ class StripeConnectViewSet(viewsets.ViewSet):
                     },
                 )
                 business.stripe_account_id = acct.id
-                business.save()
+                await business.asave()
                 account_id = acct.id
             else:
                 account_id = business.stripe_account_id
@@ -437,7 +488,8 @@ class StripeConnectViewSet(viewsets.ViewSet):
         # Case 2: If user is a referrer (customer type)
         else:
             if not user.stripe_account_id:
-                acct = stripe.Account.create(
+                acct = await run_blocking(
+                    stripe.Account.create,
                     type="express",
                     email=user.email,
                     country="US",
@@ -448,13 +500,14 @@ class StripeConnectViewSet(viewsets.ViewSet):
                     },
                 )
                 user.stripe_account_id = acct.id
-                user.save()
+                await user.asave()
                 account_id = acct.id
             else:
                 account_id = user.stripe_account_id
 
         # Step 2: Generate onboarding link
-        link = stripe.AccountLink.create(
+        link = await run_blocking(
+            stripe.AccountLink.create,
             account=account_id,
             refresh_url=f"{settings.FRONTEND_URL}/onboarding/refresh",
             return_url=f"{settings.FRONTEND_URL}payment-account/success/",
@@ -466,29 +519,18 @@ class StripeConnectViewSet(viewsets.ViewSet):
             "account_id": account_id,
         }, status=200)
 
-    @action(detail=False, methods=["post"], url_path="save-account")
-    def save_account(self, request):
-        """Save Stripe account ID after onboarding"""
-        account_id = request.data.get("account_id")
-        if not account_id:
-            return Response({"error": "account_id is required"}, status=400)
 
-        user = request.user
-        user.stripe_account_id = account_id
-        user.save()
-
-        return Response({
-            "message": "Stripe account linked successfully",
-            "account_id": account_id
-        }, status=200)
+class StripeStatusView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+    throttle_classes = [RateLimitThrottle]
+    throttle_scope = "stripe_onboarding"
 
-    @action(detail=False, methods=["get"], url_path="status")
-    def check_status(self, request):
+    async def get(self, request):
         """Check onboarding status for a user"""
         user = request.user
 
         if user.is_business:
-            business = getattr(user, "business_profile", None)
+            business = await Business.objects.filter(user=user).afirst()
             if not business or not business.stripe_account_id:
                 return Response({"error": "No Stripe account linked to this business"}, status=400)
             account_id = business.stripe_account_id
@@ -508,29 +550,21 @@ class StripeConnectViewSet(viewsets.ViewSet):
                 "details_submitted": True,
             }, status=200)
 
+        # Local state is kept current by the account.updated webhook;
+        # recording a complete account also sets is_onboarding_completed
         try:
-            account = stripe.Account.retrieve(account_id)
+            state = await sync_to_async(StripeAccountService.get)(account_id)
         except Exception as e:
             return Response({"error": f"Stripe error: {str(e)}"}, status=400)
-
-        details_submitted = account.get("details_submitted", False)
-        charges_enabled = account.get("charges_enabled", False)
-        payouts_enabled = account.get("payouts_enabled", False)
-
-        if details_submitted and charges_enabled and payouts_enabled:
-            if user.is_business:
-                business.is_onboarding_completed = True
-                business.save(update_fields=["is_onboarding_completed"])
-            else:
-                user.is_onboarding_completed = True
-                user.save(update_fields=["is_onboarding_completed"])
+        if state is None:
+            return Response({"error": "Stripe is unavailable, please try again shortly"}, status=503)
 
         return Response({
-            "message": "Onboarding complete" if details_submitted else "Onboarding incomplete",
+            "message": "Onboarding complete" if state.details_submitted else "Onboarding incomplete",
             "account_id": account_id,
-            "payouts_enabled": payouts_enabled,
-            "charges_enabled": charges_enabled,
-            "details_submitted": details_submitted,
+            "payouts_enabled": state.payouts_enabled,
+            "charges_enabled": state.charges_enabled,
+            "details_submitted": state.details_submitted,
         }, status=200)
 
 
@@ -555,13 +589,19 @@ def stripe_onboarding_redirect(request):
         return Response({"error": "No Stripe account linked to this user"}, status=400)
 
     try:
-        account = stripe.Account.retrieve(account_id)
-        return Response({
-            "message": "Onboarding complete" if account.details_submitted else "Onboarding incomplete",
-            "account_id": account.id,
-            "payouts_enabled": account.payouts_enabled,
-            "charges_enabled": account.charges_enabled,
-            "details_submitted": account.details_submitted,
-        }, status=200)
-    except stripe.error.StripeError as e:
-        return Response({"error": str(e)}, status=400)
\ No newline at end of file
+        state = StripeAccountService.get(account_id)
+        # The user is just back from onboarding, possibly ahead of the webhook
+        if state is not None and not state.is_complete:
+            state = StripeAccountService.get(account_id, refresh=True)
+    except StripeError as e:
+        return Response({"error": str(e)}, status=400)
+    if state is None:
+        return Response({"error": "Stripe is unavailable, please try again shortly"}, status=503)
+
+    return Response({
+        "message": "Onboarding complete" if state.details_submitted else "Onboarding incomplete",
+        "account_id": state.account_id,
+        "payouts_enabled": state.payouts_enabled,
+        "charges_enabled": state.charges_enabled,
+        "details_submitted": state.details_submitted,
+    }, status=200)
\ No newline at end of file
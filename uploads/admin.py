@@ -0,0 +1,11 @@
+from django.contrib import admin
+from .models import UploadSession
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('path', 'user', 'content_type', 'size', 'status', 'created_at', 'completed_at')
+    list_filter = ('status', 'content_type', 'created_at')
+    search_fields = ('path', 'sha256', 'filename', 'user__email')
+    raw_id_fields = ('user',)
+    readonly_fields = ('sha256', 'path', 'metadata', 'created_at', 'completed_at')
@@ -0,0 +1,41 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from uploads.services.image_service import VARIANT_FIELDS
+from uploads.utils import generate_image_variants
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the resized WebP/AVIF variants of business logos, covers and profile "
+        "pictures that have none (or only those of a previous image), queued to Celery "
+        "unless --sync."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sync", action="store_true", help="Generate in this process instead of queueing")
+        parser.add_argument("--force", action="store_true", help="Regenerate images that already have variants")
+
+    def handle(self, *args, **options):
+        for model_label, fields in VARIANT_FIELDS.items():
+            model = apps.get_model(model_label)
+            for field, (variants_field, _) in fields.items():
+                rows = (
+                    model.objects.exclude(**{f"{field}__isnull": True}).exclude(**{field: ""})
+                    .values_list("pk", field, variants_field)
+                )
+                count = 0
+                for pk, url, variants in rows.iterator():
+                    if variants.get("source") == url:
+                        if not options["force"]:
+                            continue
+                        # The task skips images whose variants are current
+                        model.objects.filter(pk=pk).update(**{variants_field: {}})
+                    if options["sync"]:
+                        generate_image_variants.apply(args=(model_label, str(pk), field), throw=True)
+                    else:
+                        generate_image_variants.delay(model_label, str(pk), field)
+                    count += 1
+                action = "generated" if options["sync"] else "queued"
+                self.stdout.write(f"{model_label}.{field}: {count} image(s) {action}")
+        self.stdout.write(self.style.SUCCESS("Image variants up to date" if options["sync"] else "Image variants queued"))
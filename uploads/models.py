@@ -0,0 +1,53 @@
+import uuid
+
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+from accounts.models import User
+
+
+class UploadSession(models.Model):
+    """
+    A file uploaded straight to storage. The client declares the file,
+    uploads it to the signed URL it gets back, then completes the session,
+    at which point the stored object is checked against the declaration.
+    """
+    STATUS_PENDING = "pending"
+    STATUS_COMPLETED = "completed"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "Pending"),
+        (STATUS_COMPLETED, "Completed"),
+        (STATUS_FAILED, "Failed"),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="upload_sessions")
+    filename = models.CharField(max_length=255, blank=True)  # as sent by the client, informational only
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    path = models.CharField(max_length=500)  # content addressed, see UploadService.path_for
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    public_url = models.URLField(max_length=1000, blank=True)
+    metadata = models.JSONField(default=dict, blank=True)  # what storage reported on completion
+    error = models.CharField(max_length=255, blank=True)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "sha256"])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["path"], condition=Q(status="completed"), name="unique_completed_upload_path"
+            ),
+        ]
+
+    @property
+    def is_expired(self):
+        return timezone.now() >= self.expires_at
+
+    def __str__(self):
+        return f"{self.path} ({self.status})"
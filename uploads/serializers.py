@@ -0,0 +1,23 @@
+from rest_framework import serializers
+
+from uploads.services.image_service import ImageService
+
+
+class SrcsetField(serializers.Field):
+    """
+    Read-only {format: srcset} of an image URL field's variants, e.g.
+    SrcsetField("business_logo_url", "business_logo_variants"). Empty until
+    the variants of the current image are generated.
+    """
+
+    def __init__(self, url_field, variants_field, **kwargs):
+        self.url_field = url_field
+        self.variants_field = variants_field
+        kwargs["read_only"] = True
+        kwargs["source"] = "*"
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        return ImageService.srcset(
+            getattr(instance, self.variants_field), source=getattr(instance, self.url_field)
+        )
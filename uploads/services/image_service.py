@@ -0,0 +1,121 @@
+"""
+Resized variants of the business logos / covers and profile pictures, so
+listings can load an image sized for the slot instead of the original.
+
+For every breakpoint not wider than the original, the image is rotated per
+its EXIF orientation, resized, stripped of its metadata (EXIF, XMP: camera,
+GPS...) and encoded as WebP and, where Pillow supports it, AVIF. Variants
+are stored under content hashed paths, so their URLs can be cached forever.
+
+The model keeps them in a JSON field next to the image URL:
+    {"source": <image url>, "images": {"webp": {"64": <url>, ...}, "avif": {...}}}
+plus "error" instead of "images" if the image could not be processed.
+"""
+import hashlib
+import io
+import logging
+
+from PIL import Image, ImageOps, features
+from django.conf import settings
+
+from uploads.services.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# Image URL field -> (variants field, breakpoints in px wide)
+VARIANT_FIELDS = {
+    "accounts.Business": {
+        "business_logo_url": ("business_logo_variants", (64, 128, 256, 512)),
+        "business_cover_url": ("business_cover_variants", (480, 960, 1440, 1920)),
+    },
+    "accounts.User": {
+        "profile_picture": ("profile_picture_variants", (64, 128, 256)),
+    },
+}
+
+# In <picture> source order: AVIF (smallest) first, WebP as the widely supported fallback
+ENCODINGS = (
+    ("avif", "image/avif", {"quality": 55, "speed": 6}),
+    ("webp", "image/webp", {"quality": 80, "method": 4}),
+)
+
+
+class ImageError(ValueError):
+    """The source is not an image we can process"""
+
+
+class ImageService:
+    @staticmethod
+    def formats():
+        return [encoding for encoding in ENCODINGS if features.check(encoding[0])]
+
+    @staticmethod
+    def fetch(url):
+        """
+        Original bytes, only for images in our storage: other URLs are never
+        downloaded, so a profile can't make the server request internal hosts
+        """
+        data = get_storage().read(url)
+        if data is None:
+            raise ImageError(f"Not an image in our storage: {url}")
+        return data
+
+    @staticmethod
+    def render(data, widths):
+        """{format: {width: encoded bytes}} for the breakpoints the image is wide enough for"""
+        try:
+            image = Image.open(io.BytesIO(data))
+            if image.width * image.height > settings.IMAGE_MAX_PIXELS:
+                raise ImageError(f"Image is {image.width}x{image.height}, too many pixels")
+            image.load()
+            image = ImageOps.exif_transpose(image)
+        except (OSError, Image.DecompressionBombError, SyntaxError) as e:
+            raise ImageError(str(e)) from e
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+
+        widths = [width for width in widths if width <= image.width] or [image.width]
+        rendered = {}
+        for width in widths:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+            # Only the color profile survives, EXIF / XMP metadata is dropped
+            resized.info = {key: value for key, value in image.info.items() if key == "icc_profile"}
+            for name, _, options in ImageService.formats():
+                buffer = io.BytesIO()
+                resized.save(buffer, format=name.upper(), **options)
+                rendered.setdefault(name, {})[width] = buffer.getvalue()
+        return rendered
+
+    @staticmethod
+    def build(url, widths):
+        """Render and store the variants of the image at `url`; the value for the variants field"""
+        try:
+            rendered = ImageService.render(ImageService.fetch(url), widths)
+        except ImageError as e:
+            logger.warning(f"Cannot make variants of {url}: {str(e)}")
+            return {"source": url, "error": str(e)[:255]}
+
+        storage = get_storage()
+        content_types = {name: content_type for name, content_type, _ in ENCODINGS}
+        images = {}
+        for name, by_width in rendered.items():
+            for width, data in by_width.items():
+                digest = hashlib.sha256(data).hexdigest()
+                path = f"variants/{digest[:2]}/{digest}.{name}"
+                images.setdefault(name, {})[str(width)] = storage.save(path, data, content_types[name])
+        return {"source": url, "images": images}
+
+    @staticmethod
+    def srcset(variants, source=None):
+        """
+        {format: "url 64w, url 128w"} for <source srcset>, empty when there
+        are no variants, or they are of another image than `source`
+        """
+        if not variants or (source is not None and variants.get("source") != source):
+            return {}
+        return {
+            name: ", ".join(
+                f"{url} {width}w" for width, url in sorted(by_width.items(), key=lambda item: int(item[0]))
+            )
+            for name, by_width in variants.get("images", {}).items()
+        }
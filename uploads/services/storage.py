@@ -0,0 +1,162 @@
+"""
+Object storage behind the upload sessions, picked by settings.UPLOAD_STORAGE:
+FirebaseUploadStorage in production, LocalUploadStorage (files under
+UPLOAD_LOCAL_ROOT, uploaded to our own signed endpoint) for tests and
+offline development.
+
+A storage hands out signed upload URLs, reports what was stored at a path
+(stat, with the sha256 of the stored bytes) and makes an object public. Only the signing runs in the request;
+the bytes go from the client to the storage directly. Background jobs
+also read stored objects back and save generated files (image variants).
+"""
+import hashlib
+import os
+from datetime import timedelta
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+LOCAL_TOKEN_SALT = "uploads.local"
+
+
+def get_storage():
+    return import_string(settings.UPLOAD_STORAGE)()
+
+
+def _sha256(handle):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FirebaseUploadStorage:
+    def _bucket(self):
+        from config import firebase  # noqa: F401, initializes the Firebase app
+
+        return firebase.storage.bucket()
+
+    def signed_upload(self, request, path, content_type, size, expires_at):
+        """
+        V4 signed URL starting a resumable upload: the client POSTs to it
+        with `headers` to get the session URI, then PUTs the bytes there
+        (in chunks if it likes). GCS rejects any other size or content type.
+        """
+        headers = {
+            "Content-Type": content_type,
+            "x-goog-resumable": "start",
+            "x-goog-content-length-range": f"{size},{size}",
+        }
+        url = self._bucket().blob(path).generate_signed_url(
+            version="v4",
+            expiration=max(expires_at - timezone.now(), timedelta(seconds=1)),
+            method="POST",
+            content_type=content_type,
+            headers={key: value for key, value in headers.items() if key != "Content-Type"},
+        )
+        return {"url": url, "method": "POST", "headers": headers, "resumable": True}
+
+    def stat(self, path):
+        """
+        What is stored at `path`, its sha256 computed from the stored bytes:
+        the path is named after the client's claimed hash, never trust it
+        """
+        blob = self._bucket().get_blob(path)
+        if blob is None:
+            return None
+        stored = {"size": blob.size, "content_type": blob.content_type, "md5": blob.md5_hash, "crc32c": blob.crc32c}
+        # Oversized objects fail verification on their size, don't download them
+        if blob.size <= settings.UPLOAD_MAX_BYTES:
+            with blob.open("rb") as handle:
+                stored["sha256"] = _sha256(handle)
+        return stored
+
+    def publish(self, path):
+        blob = self._bucket().blob(path)
+        blob.make_public()
+        return blob.public_url
+
+    def save(self, path, data, content_type):
+        """Store generated bytes at a content hashed path and return their public URL"""
+        blob = self._bucket().blob(path)
+        blob.cache_control = "public, max-age=31536000, immutable"
+        blob.upload_from_string(data, content_type=content_type)
+        blob.make_public()
+        return blob.public_url
+
+    def read(self, url):
+        """Bytes of an object of ours given its public URL, None for other URLs"""
+        bucket = self._bucket()
+        prefix = f"https://storage.googleapis.com/{bucket.name}/"
+        if not url.startswith(prefix):
+            return None
+        blob = bucket.get_blob(unquote(url[len(prefix):]))
+        return blob.download_as_bytes() if blob else None
+
+
+class LocalUploadStorage:
+    """
+    Stand-in for tests and offline development. The signed URL points at
+    uploads.views.local_upload, which checks the token and writes the PUT
+    body under UPLOAD_LOCAL_ROOT; files are served back by local_file.
+    """
+
+    def signed_upload(self, request, path, content_type, size, expires_at):
+        token = signing.dumps(
+            {"path": path, "size": size, "exp": expires_at.timestamp()}, salt=LOCAL_TOKEN_SALT
+        )
+        url = request.build_absolute_uri(reverse("local_upload", args=[token]))
+        return {"url": url, "method": "PUT", "headers": {"Content-Type": content_type}, "resumable": False}
+
+    @staticmethod
+    def load_token(token):
+        """(path, size) of a valid, unexpired token; signing.BadSignature otherwise"""
+        claims = signing.loads(token, salt=LOCAL_TOKEN_SALT)
+        if timezone.now().timestamp() >= claims["exp"]:
+            raise signing.SignatureExpired("Upload URL expired")
+        return claims["path"], claims["size"]
+
+    @staticmethod
+    def full_path(path):
+        root = os.path.abspath(settings.UPLOAD_LOCAL_ROOT)
+        full = os.path.abspath(os.path.join(root, path))
+        if not full.startswith(root + os.sep):
+            raise ValueError(f"Path {path} escapes the upload root")
+        return full
+
+    def write(self, path, chunks):
+        full = self.full_path(path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        partial = f"{full}.part"
+        with open(partial, "wb") as handle:
+            for chunk in chunks:
+                handle.write(chunk)
+        os.replace(partial, full)
+
+    def stat(self, path):
+        full = self.full_path(path)
+        if not os.path.isfile(full):
+            return None
+        with open(full, "rb") as handle:
+            sha256 = _sha256(handle)
+        return {"size": os.path.getsize(full), "content_type": None, "sha256": sha256}
+
+    def publish(self, path):
+        return f"{settings.UPLOAD_LOCAL_URL}{path}"
+
+    def save(self, path, data, content_type):
+        self.write(path, [data])
+        return self.publish(path)
+
+    def read(self, url):
+        if not url.startswith(settings.UPLOAD_LOCAL_URL):
+            return None
+        full = self.full_path(unquote(url[len(settings.UPLOAD_LOCAL_URL):]))
+        if not os.path.isfile(full):
+            return None
+        with open(full, "rb") as handle:
+            return handle.read()
@@ -0,0 +1,101 @@
+import logging
+import mimetypes
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from uploads.models import UploadSession
+from uploads.services.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class UploadService:
+    @staticmethod
+    def path_for(user_id, sha256, content_type):
+        """
+        Content addressed object path: the same bytes always land at the
+        same path, and different files can never overwrite each other.
+        Namespaced per user: the hash is the client's claim until complete()
+        checks it against the stored bytes.
+        """
+        extension = mimetypes.guess_extension(content_type) or ""
+        return f"uploads/{user_id}/{sha256}{extension}"
+
+    @staticmethod
+    def validate(content_type, size, sha256):
+        """Error message for an upload we won't accept, None if fine"""
+        if content_type not in settings.UPLOAD_ALLOWED_TYPES:
+            return f"Unsupported content type, expected one of: {', '.join(settings.UPLOAD_ALLOWED_TYPES)}."
+        if not isinstance(size, int) or size <= 0:
+            return "size must be a positive number of bytes."
+        if size > settings.UPLOAD_MAX_BYTES:
+            return f"Files are limited to {settings.UPLOAD_MAX_BYTES} bytes."
+        if not isinstance(sha256, str) or not SHA256_RE.match(sha256):
+            return "sha256 must be the lowercase hex SHA-256 of the file."
+        return None
+
+    @staticmethod
+    def start(request, user, filename, content_type, size, sha256):
+        """
+        (session, upload) for a new upload. If the user already uploaded
+        these bytes, the completed session is returned with no upload.
+        """
+        existing = UploadSession.objects.filter(
+            user=user, sha256=sha256, content_type=content_type, status=UploadSession.STATUS_COMPLETED
+        ).first()
+        if existing:
+            return existing, None
+
+        session = UploadSession.objects.create(
+            user=user,
+            filename=(filename or "")[:255],
+            content_type=content_type,
+            size=size,
+            sha256=sha256,
+            path=UploadService.path_for(user.id, sha256, content_type),
+            expires_at=timezone.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL),
+        )
+        upload = get_storage().signed_upload(request, session.path, content_type, size, session.expires_at)
+        return session, upload
+
+    @staticmethod
+    def verify(session, stored):
+        """Error message if what storage holds doesn't match the session, None if it does"""
+        if stored is None:
+            return "File not found in storage, upload it first."
+        if stored["size"] != session.size:
+            return f"Stored file is {stored['size']} bytes, {session.size} were declared."
+        if stored.get("content_type") and stored["content_type"] != session.content_type:
+            return f"Stored file is {stored['content_type']}, {session.content_type} was declared."
+        # The path (and later dedup in start) relies on the hash, so it is required
+        if stored.get("sha256") != session.sha256:
+            return "Stored file does not match the declared sha256."
+        return None
+
+    @staticmethod
+    def complete(session, stored, public_url):
+        """Record a verified upload; returns the completed session (an older one for the same path, if any)"""
+        session.status = UploadSession.STATUS_COMPLETED
+        session.public_url = public_url
+        session.metadata = stored
+        session.completed_at = timezone.now()
+        try:
+            with transaction.atomic():
+                session.save(update_fields=["status", "public_url", "metadata", "completed_at"])
+        except IntegrityError:
+            # The same bytes were completed by another session meanwhile
+            return UploadSession.objects.get(path=session.path, status=UploadSession.STATUS_COMPLETED)
+        return session
+
+    @staticmethod
+    def fail(session, error):
+        logger.warning(f"Upload {session.id} failed verification: {error}")
+        session.status = UploadSession.STATUS_FAILED
+        session.error = error[:255]
+        session.save(update_fields=["status", "error"])
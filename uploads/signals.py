@@ -0,0 +1,38 @@
+import logging
+
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from accounts.models import Business, User
+from uploads.services.image_service import VARIANT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Business)
+@receiver(post_save, sender=User)
+def queue_image_variants(sender, instance, update_fields=None, raw=False, **kwargs):
+    """Queue variants for new or changed images, drop those of removed images"""
+    if raw:
+        return
+    model_label = sender._meta.label
+    for field, (variants_field, _) in VARIANT_FIELDS[model_label].items():
+        if update_fields is not None and field not in update_fields:
+            continue
+        url = getattr(instance, field)
+        variants = getattr(instance, variants_field)
+        if url and variants.get("source") != url:
+            transaction.on_commit(lambda field=field: _enqueue(model_label, instance.pk, field))
+        elif not url and variants:
+            setattr(instance, variants_field, {})
+            sender.objects.filter(pk=instance.pk).update(**{variants_field: {}})
+
+
+def _enqueue(model_label, pk, field):
+    from uploads.utils import generate_image_variants
+
+    try:
+        generate_image_variants.delay(model_label, str(pk), field)
+    except Exception as e:
+        logger.error(f"Failed to queue image variants for {model_label} {pk}: {str(e)}")
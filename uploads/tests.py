@@ -0,0 +1,243 @@
+import hashlib
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from PIL import Image
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from accounts.models import Business, User
+from deals.models import Deal
+from uploads.models import UploadSession
+from uploads.services.image_service import ImageService
+from uploads.services.storage import FirebaseUploadStorage, LocalUploadStorage
+from uploads.services.upload_service import UploadService
+from uploads.utils import generate_image_variants
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"pixels" * 100
+
+
+TEST_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+def create_user(email, phone_number, user_type="customer"):
+    return User.objects.create_user(
+        email=email, username=email, phone_number=phone_number, password="testpass123", user_type=user_type,
+    )
+
+
+def photo(width, height):
+    """JPEG taken sideways (EXIF orientation 6) with camera and GPS metadata"""
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90 CW to display
+    exif[0x010F] = "PhoneCam"  # Make
+    exif[0x8825] = {1: "N", 2: (48.0, 51.0, 29.0)}  # GPS
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "orange").save(buffer, format="JPEG", exif=exif)
+    return buffer.getvalue()
+
+
+class UploadSessionTests(APITestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings_override = override_settings(
+            UPLOAD_STORAGE="uploads.services.storage.LocalUploadStorage",
+            UPLOAD_LOCAL_ROOT=root,
+            UPLOAD_LOCAL_URL="https://files.example.com/",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = create_user("uploader@example.com", "+15551000100")
+        self.client.force_authenticate(self.user)
+
+    def start(self, content=PNG, **overrides):
+        return self.client.post("/uploads/sessions/", {
+            "filename": "logo.png",
+            "content_type": "image/png",
+            "size": len(content),
+            "sha256": hashlib.sha256(content).hexdigest(),
+            **overrides,
+        }, format="json")
+
+    def put(self, upload, content):
+        return self.client.generic(
+            upload["method"], upload["url"], content, content_type=upload["headers"]["Content-Type"]
+        )
+
+    def complete(self, session_id):
+        return self.client.post(f"/uploads/sessions/{session_id}/complete/")
+
+    def test_upload_goes_to_storage_then_is_verified_and_published(self):
+        response = self.start()
+        self.assertEqual(response.status_code, 201)
+        session = response.data
+        self.assertEqual(session["path"], f"uploads/{self.user.id}/{hashlib.sha256(PNG).hexdigest()}.png")
+
+        self.assertEqual(self.complete(session["session_id"]).status_code, 409)  # nothing uploaded yet
+        self.assertEqual(self.put(session["upload"], PNG).status_code, 200)
+        response = self.complete(session["session_id"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["url"], f"https://files.example.com/{session['path']}")
+        self.assertEqual(self.client.get(f"/uploads/files/{session['path']}").getvalue(), PNG)
+
+        stored = UploadSession.objects.get(id=session["session_id"])
+        self.assertEqual(stored.metadata["sha256"], hashlib.sha256(PNG).hexdigest())
+
+        # Same bytes again: nothing to upload
+        again = self.start(filename="copy.png")
+        self.assertEqual(again.status_code, 200)
+        self.assertIsNone(again.data["upload"])
+        self.assertEqual(again.data["url"], response.data["url"])
+
+    def test_stored_bytes_must_match_the_declaration(self):
+        session = self.start().data
+        forged = PNG[:-6] + b"forged"
+        self.assertEqual(self.put(session["upload"], forged).status_code, 200)
+
+        response = self.complete(session["session_id"])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UploadSession.objects.get(id=session["session_id"]).status, UploadSession.STATUS_FAILED)
+
+    def test_firebase_uploads_are_verified_against_the_stored_bytes(self):
+        session = UploadSession.objects.get(id=self.start().data["session_id"])
+        forged = PNG[:-6] + b"forged"
+        blob = mock.Mock(size=len(forged), content_type="image/png", md5_hash="x", crc32c="y")
+        blob.open.side_effect = lambda mode: io.BytesIO(forged)
+        storage = FirebaseUploadStorage()
+        with mock.patch.object(FirebaseUploadStorage, "_bucket") as bucket:
+            bucket.return_value.get_blob.return_value = blob
+            stored = storage.stat(session.path)
+            self.assertEqual(UploadService.verify(session, stored), "Stored file does not match the declared sha256.")
+
+            blob.open.side_effect = lambda mode: io.BytesIO(PNG)
+            self.assertIsNone(UploadService.verify(session, storage.stat(session.path)))
+
+        # A storage that can't vouch for the bytes doesn't complete the upload
+        self.assertIsNotNone(UploadService.verify(session, {"size": len(PNG), "content_type": "image/png"}))
+
+    def test_declarations_and_upload_urls_are_checked(self):
+        self.assertEqual(self.start(content_type="text/html").status_code, 400)
+        self.assertEqual(self.start(sha256="not-a-hash").status_code, 400)
+        with override_settings(UPLOAD_MAX_BYTES=10):
+            self.assertEqual(self.start().status_code, 400)
+
+        upload = self.start().data["upload"]
+        self.assertEqual(self.put(upload, PNG + b"extra").status_code, 400)
+        self.assertEqual(self.put({**upload, "url": upload["url"].replace("/local/", "/local/x")}, PNG).status_code, 403)
+
+    def test_sessions_belong_to_their_user(self):
+        session = self.start().data
+        self.client.force_authenticate(create_user("other@example.com", "+15551000101"))
+        self.assertEqual(self.complete(session["session_id"]).status_code, 404)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.start().status_code, 401)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ImageVariantTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings_override = override_settings(
+            UPLOAD_STORAGE="uploads.services.storage.LocalUploadStorage",
+            UPLOAD_LOCAL_ROOT=root,
+            UPLOAD_LOCAL_URL="https://files.example.com/",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.storage = LocalUploadStorage()
+        self.business = Business.objects.create(
+            user=create_user("biz@example.com", "+15551000200", user_type="business"),
+            business_name="Biz",
+            business_email="biz@example.com",
+            business_phone="+15551000200",
+            designation="Owner",
+            registration_no="REG-1",
+            business_address="1 Main St",
+            business_city="Austin",
+            business_state="TX",
+            business_country="US",
+            industry="Retail",
+        )
+        Deal.objects.create(business=self.business, deal_name="Deal", reward_type="commission", customer_incentive=5)
+
+    def set_logo(self, content):
+        url = self.storage.save(f"uploads/{self.business.user_id}/{hashlib.sha256(content).hexdigest()}.jpg",
+                                content, "image/jpeg")
+        self.business.business_logo_url = url
+        with mock.patch.object(generate_image_variants, "delay") as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.business.save()
+        return url, delay
+
+    def test_new_logo_queues_variants(self):
+        _, delay = self.set_logo(photo(300, 200))
+        delay.assert_called_once_with("accounts.Business", str(self.business.id), "business_logo_url")
+
+        # Saving the business again (same logo, variants pending) doesn't queue more
+        with mock.patch.object(generate_image_variants, "delay") as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.business.save(update_fields=["business_name"])
+        delay.assert_not_called()
+
+    def test_variants_are_resized_rotated_and_stripped(self):
+        url, _ = self.set_logo(photo(300, 200))
+        generate_image_variants.apply(args=("accounts.Business", str(self.business.id), "business_logo_url"))
+
+        self.business.refresh_from_db()
+        variants = self.business.business_logo_variants
+        self.assertEqual(variants["source"], url)
+        formats = [name for name, _, _ in ImageService.formats()]
+        self.assertEqual(sorted(variants["images"]), sorted(formats))
+        for name in formats:
+            # Rotated to 200 wide: no 256 or 512 breakpoint, never upscaled
+            self.assertEqual(sorted(variants["images"][name], key=int), ["64", "128"])
+            for width, variant_url in variants["images"][name].items():
+                image = Image.open(io.BytesIO(self.storage.read(variant_url)))
+                self.assertEqual(image.format, name.upper())
+                self.assertEqual(image.size, (int(width), int(width) * 3 // 2))
+                self.assertNotIn("exif", image.info)
+                self.assertEqual(len(image.getexif()), 0)
+
+    def test_payloads_carry_the_srcset_of_the_current_logo(self):
+        self.set_logo(photo(300, 200))
+        generate_image_variants.apply(args=("accounts.Business", str(self.business.id), "business_logo_url"))
+
+        business = self.client.get("/deals/all/").data["results"][0]["business"]
+        self.assertRegex(business["business_logo_srcset"]["webp"], r"^https://files\.example\.com/variants/\S+\.webp 64w, \S+ 128w$")
+        self.assertEqual(business["business_cover_srcset"], {})
+
+        # A new logo: no srcset until its own variants exist, the old ones are never served for it
+        cache.clear()
+        self.set_logo(photo(100, 100))
+        business = self.client.get("/deals/all/").data["results"][0]["business"]
+        self.assertEqual(business["business_logo_srcset"], {})
+
+    def test_unreadable_image_is_recorded_not_retried(self):
+        url, _ = self.set_logo(b"not an image")
+        generate_image_variants.apply(args=("accounts.Business", str(self.business.id), "business_logo_url"))
+
+        self.business.refresh_from_db()
+        self.assertEqual(self.business.business_logo_variants["source"], url)
+        self.assertIn("error", self.business.business_logo_variants)
+
+    def test_urls_outside_our_storage_are_never_fetched(self):
+        url = "http://169.254.169.254/latest/meta-data/logo.jpg"
+        self.assertEqual(ImageService.build(url, (64,)), {"source": url, "error": f"Not an image in our storage: {url}"})
+
+    def test_removing_the_logo_drops_its_variants(self):
+        self.set_logo(photo(300, 200))
+        generate_image_variants.apply(args=("accounts.Business", str(self.business.id), "business_logo_url"))
+        self.business.refresh_from_db()
+
+        self.business.business_logo_url = ""
+        self.business.save()
+        self.business.refresh_from_db()
+        self.assertEqual(self.business.business_logo_variants, {})
@@ -0,0 +1,10 @@
+from django.urls import path, re_path
+
+from .views import CompleteUploadView, UploadSessionView, local_file, local_upload
+
+urlpatterns = [
+    path('sessions/', UploadSessionView.as_view(), name='upload_sessions'),
+    path('sessions/<uuid:session_id>/complete/', CompleteUploadView.as_view(), name='upload_session_complete'),
+    path('local/<str:token>/', local_upload, name='local_upload'),
+    re_path(r'^files/(?P<path>.+)$', local_file, name='local_upload_file'),
+]
@@ -0,0 +1,35 @@
+import logging
+
+from celery import shared_task
+from django.apps import apps
+
+from uploads.services.image_service import VARIANT_FIELDS, ImageService
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(bind=True, max_retries=3)
+def generate_image_variants(self, model_label, pk, field):
+    """
+    Build the resized variants of an image field and store them on the row,
+    unless the image changed meanwhile (the change queued its own run).
+    """
+    variants_field, widths = VARIANT_FIELDS[model_label][field]
+    instance = apps.get_model(model_label).objects.filter(pk=pk).first()
+    url = getattr(instance, field, None)
+    if not url or getattr(instance, variants_field).get("source") == url:
+        return None
+
+    try:
+        variants = ImageService.build(url, widths)
+    except Exception as e:
+        logger.error(f"Failed to make variants of {model_label} {pk} {field}: {str(e)}")
+        raise self.retry(exc=e, countdown=60 * 2 ** self.request.retries)
+
+    instance.refresh_from_db(fields=[field])
+    if getattr(instance, field) != url:
+        return None
+    setattr(instance, variants_field, variants)
+    # A regular save, so the API cache invalidation signals run
+    instance.save(update_fields=[variants_field])
+    return variants
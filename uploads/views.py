@@ -0,0 +1,110 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.http import Http404, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from django.views.static import serve
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from dealshark.aio import AsyncAPIView, run_blocking
+from .models import UploadSession
+from .services.storage import LocalUploadStorage, get_storage
+from .services.upload_service import UploadService
+
+
+def _session_payload(session, upload=None):
+    return {
+        "session_id": str(session.id),
+        "status": session.status,
+        "path": session.path,
+        "url": session.public_url or None,
+        "expires_at": session.expires_at,
+        "upload": upload,
+    }
+
+
+class UploadSessionView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        """
+        Start an upload: declare content_type, size (bytes) and sha256 (hex)
+        of the file, get back a signed URL to send the bytes to storage.
+        """
+        content_type = request.data.get("content_type")
+        size = request.data.get("size")
+        sha256 = request.data.get("sha256")
+
+        error_message = UploadService.validate(content_type, size, sha256)
+        if error_message:
+            return Response({"error": error_message}, status=400)
+
+        session, upload = UploadService.start(
+            request, request.user, request.data.get("filename"), content_type, size, sha256
+        )
+        return Response(_session_payload(session, upload), status=201 if upload else 200)
+
+
+class CompleteUploadView(AsyncAPIView):
+    permission_classes = [IsAuthenticated]
+
+    async def post(self, request, session_id):
+        """Check the uploaded object against the session and publish it"""
+        session = await UploadSession.objects.filter(id=session_id, user_id=request.user.id).afirst()
+        if not session:
+            return Response({"error": "Upload session not found."}, status=404)
+        if session.status == UploadSession.STATUS_COMPLETED:
+            return Response(_session_payload(session), status=200)
+        if session.status == UploadSession.STATUS_FAILED:
+            return Response({"error": session.error}, status=400)
+
+        storage = get_storage()
+        stored = await run_blocking(storage.stat, session.path)
+        if stored is None:
+            if session.is_expired:
+                await sync_to_async(UploadService.fail)(session, "Upload session expired.")
+                return Response({"error": "Upload session expired."}, status=410)
+            return Response({"error": "File not found in storage, upload it first."}, status=409)
+
+        error_message = UploadService.verify(session, stored)
+        if error_message:
+            await sync_to_async(UploadService.fail)(session, error_message)
+            return Response({"error": error_message}, status=400)
+
+        public_url = await run_blocking(storage.publish, session.path)
+        session = await sync_to_async(UploadService.complete)(session, stored, public_url)
+        return Response(_session_payload(session), status=200)
+
+
+# ---------------------------
+# LOCAL STORAGE STAND-IN
+# ---------------------------
+def _local_storage():
+    storage = get_storage()
+    if not isinstance(storage, LocalUploadStorage):
+        raise Http404()
+    return storage
+
+
+@csrf_exempt
+@require_http_methods(["PUT"])
+def local_upload(request, token):
+    """Signed upload target of LocalUploadStorage"""
+    storage = _local_storage()
+    try:
+        path, size = storage.load_token(token)
+    except signing.BadSignature:
+        return JsonResponse({"error": "Invalid or expired upload URL."}, status=403)
+    if int(request.META.get("CONTENT_LENGTH") or 0) != size:
+        return JsonResponse({"error": f"Expected exactly {size} bytes."}, status=400)
+
+    storage.write(path, iter(lambda: request.read(64 * 1024), b""))
+    return JsonResponse({"path": path}, status=200)
+
+
+def local_file(request, path):
+    _local_storage()
+    return serve(request, path, document_root=settings.UPLOAD_LOCAL_ROOT)